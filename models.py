@@ -2,6 +2,51 @@
 SQLAlchemy models for Pitch Simulator
 Add your database models here
 """
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy.orm import relationship
+
 from database import Base
 
-# Add your model classes here
+
+class ConversationSession(Base):
+    """One practice conversation, shared by every API worker"""
+    __tablename__ = 'conversation_sessions'
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String(128), unique=True, nullable=False, index=True)
+    system_prompt = Column(Text, nullable=False)
+    # Running summary of folded turns (stored as the full system message content)
+    summary = Column(Text, nullable=True)
+    # First message seq still in the live context window
+    window_start_seq = Column(Integer, nullable=False, default=0)
+    # Total messages ever appended; the next message gets this seq
+    message_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    messages = relationship(
+        'ConversationMessage',
+        back_populates='session',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+        order_by='ConversationMessage.seq',
+    )
+
+
+class ConversationMessage(Base):
+    """A user or assistant message, in order within its session"""
+    __tablename__ = 'conversation_messages'
+    __table_args__ = (
+        UniqueConstraint('session_pk', 'seq', name='uq_conversation_messages_session_seq'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_pk = Column(Integer, ForeignKey('conversation_sessions.id', ondelete='CASCADE'), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String(16), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    session = relationship('ConversationSession', back_populates='messages')
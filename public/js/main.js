@@ -14,12 +14,61 @@ const caseStudyTitles = {
 // API Configuration
 const API_URL = 'http://localhost:8080';
 const SESSION_ID = `session_${Date.now()}`;
+// Use /api/chat/stream so the donor starts talking after the first sentence
+const STREAM_VOICE_REPLIES = false;
+// Stream mic audio to /api/stt/stream while recording, so the transcript is ready on release
+const STREAM_STT = false;
+const STT_TIMESLICE_MS = 250;
+// Ask /api/chat for the reply text right away; the audio URL answers once TTS is done
+const ASYNC_AUDIO = true;
+// Offer a "Listen" button on typed-turn replies (TTS runs only when it's clicked)
+const TEXT_MODE_AUDIO = true;
+// /api/chat attempts per turn, and how long each may take; retries reuse the turn's
+// Idempotency-Key, so the server replays the turn instead of running it again
+const CHAT_ATTEMPTS = 3;
+const CHAT_TIMEOUT_MS = 45000;
+
+// A fresh key for each turn (the same for all of its retries)
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// POST a turn, retrying timeouts, network errors and 409/503/504 with the same idempotency key
+async function postTurn(url, body, idempotencyKey) {
+    for (let attempt = 1; ; attempt++) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), CHAT_TIMEOUT_MS);
+        let response = null;
+        try {
+            response = await fetch(url, {
+                method: 'POST',
+                headers: { 'Idempotency-Key': idempotencyKey },
+                body,
+                signal: controller.signal
+            });
+        } catch (error) {
+            if (attempt >= CHAT_ATTEMPTS) throw error;
+            console.warn(`[Voice] Attempt ${attempt} failed (${error.name}), retrying...`);
+        } finally {
+            clearTimeout(timer);
+        }
+        if (response) {
+            if (![409, 503, 504].includes(response.status) || attempt >= CHAT_ATTEMPTS) return response;
+            console.warn(`[Voice] Attempt ${attempt} got ${response.status}, retrying...`);
+        }
+        const retryAfter = Number(response && response.headers.get('Retry-After')) || 1;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+}
 
 // Audio recording variables
 let mediaRecorder;
 let audioChunks = [];
 let isRecording = false;
 let recordingStartTime = 0;
+let sttSocket = null;
+let sttPending = [];
 
 // Feedback tracking
 let voiceExchangeCount = 0;
@@ -107,6 +156,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (messageCountEl) {
             messageCountEl.textContent = messageCount;
         }
+        return messageContent;
     }
     
     // Function to add audio message with player
@@ -185,8 +235,31 @@ document.addEventListener('DOMContentLoaded', () => {
         if (loadingMsg) loadingMsg.remove();
     }
     
+    // Open the conversation with the donor's greeting (audio is pre-generated on the server)
+    async function loadGreeting() {
+        try {
+            const formData = new FormData();
+            formData.append('session_id', SESSION_ID);
+            const response = await fetch(`${API_URL}/api/personas/${encodeURIComponent(studyKey)}/greeting`, {
+                method: 'POST',
+                body: formData
+            });
+            if (!response.ok) return;
+            const data = await response.json();
+            if (!data.text) return;
+            addMessage(data.text, false);
+            if (data.audio_url) {
+                addAudioMessage(`${API_URL}${data.audio_url}`);
+            }
+        } catch (error) {
+            console.error('[Greeting] Could not load greeting:', error);
+        }
+    }
+    
+    loadGreeting();
+    
     // Function to send text message
-    function sendMessage() {
+    async function sendMessage() {
         const message = userInput.value.trim();
         if (!message) return;
         
@@ -196,11 +269,52 @@ document.addEventListener('DOMContentLoaded', () => {
         // Show loading
         showLoading();
         
-        // Simulate AI response for now (replace with actual API call later)
-        setTimeout(() => {
+        try {
+            // Text turns skip STT; audio is only synthesized if the user asks to hear it
+            const response = await fetch(`${API_URL}/api/chat/text`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    message: message,
+                    session_id: SESSION_ID,
+                    case_study: studyKey,
+                    tts: TEXT_MODE_AUDIO ? 'lazy' : 'none'
+                })
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'API request failed');
+            }
+            
+            removeLoading();
+            userMessages.push(message);
+            const messageContent = addMessage(data.reply, false);
+            aiResponses.push(data.reply);
+            
+            if (data.audio_url) {
+                addListenButton(messageContent, `${API_URL}${data.audio_url}`);
+            }
+        } catch (error) {
+            console.error('[Text] Error:', error);
             removeLoading();
-            addMessage("cool!", false);
-        }, 1000);
+            addMessage(`Error: ${error.message}`, false);
+        }
+    }
+    
+    // Swap a "Listen" button for an audio player the first time it's clicked
+    function addListenButton(messageContent, audioUrl) {
+        const listenButton = document.createElement('button');
+        listenButton.className = 'listen-button';
+        listenButton.textContent = '🔊 Listen';
+        listenButton.addEventListener('click', () => {
+            const audioPlayer = document.createElement('audio');
+            audioPlayer.controls = true;
+            audioPlayer.autoplay = true;
+            audioPlayer.src = audioUrl;
+            audioPlayer.className = 'audio-player';
+            listenButton.replaceWith(audioPlayer);
+        });
+        messageContent.appendChild(listenButton);
     }
     
     // Function to send voice message to API
@@ -216,6 +330,7 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('audio', audioBlob, 'recording.webm');
             formData.append('session_id', SESSION_ID);
             formData.append('case_study', studyKey);
+            formData.append('async_audio', ASYNC_AUDIO ? '1' : '0');
             
             console.log('[Voice] Making API request to:', `${API_URL}/api/chat`);
             console.log('[Voice] FormData contents:', {
@@ -224,10 +339,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 case_study: studyKey
             });
             
-            const response = await fetch(`${API_URL}/api/chat`, {
-                method: 'POST',
-                body: formData
-            });
+            const response = await postTurn(`${API_URL}/api/chat`, formData, newIdempotencyKey());
             
             console.log('[Voice] Response status:', response.status);
             console.log('[Voice] Response headers:', [...response.headers.entries()]);
@@ -279,6 +391,194 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    // Play streamed audio segments back-to-back, in order
+    const segmentQueue = [];
+    let segmentPlaying = false;
+    
+    function playNextSegment() {
+        if (segmentPlaying || segmentQueue.length === 0) return;
+        segmentPlaying = true;
+        const player = new Audio(segmentQueue.shift());
+        const next = () => {
+            segmentPlaying = false;
+            playNextSegment();
+        };
+        player.onended = next;
+        player.onerror = next;
+        player.play().catch(next);
+    }
+    
+    // Function to send voice message to the streaming API (Server-Sent Events)
+    async function sendVoiceMessageStreaming(audioBlob) {
+        try {
+            showLoading();
+            
+            const formData = new FormData();
+            formData.append('audio', audioBlob, 'recording.webm');
+            formData.append('session_id', SESSION_ID);
+            formData.append('case_study', studyKey);
+            
+            const response = await fetch(`${API_URL}/api/chat/stream`, {
+                method: 'POST',
+                body: formData
+            });
+            
+            if (!response.ok) {
+                const errorText = await response.text();
+                let errorData;
+                try {
+                    errorData = JSON.parse(errorText);
+                } catch {
+                    errorData = { error: errorText };
+                }
+                throw new Error(errorData.error || 'API request failed');
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let replyParts = [];
+            
+            const handleEvent = (event, data) => {
+                if (event === 'transcript') {
+                    removeLoading();
+                    addMessage(data.transcript, true);
+                    userMessages.push(data.transcript);
+                } else if (event === 'segment') {
+                    console.log('[Voice] Segment', data.index, 'ready after', data.elapsed_ms, 'ms');
+                    replyParts.push(data.text);
+                    segmentQueue.push(`${API_URL}${data.audio_url}`);
+                    playNextSegment();
+                } else if (event === 'done') {
+                    addMessage(data.reply, false);
+                    aiResponses.push(data.reply);
+                } else if (event === 'error') {
+                    throw new Error(data.error);
+                }
+            };
+            
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                
+                // SSE frames are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    let data = '';
+                    frame.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    });
+                    handleEvent(event, data ? JSON.parse(data) : {});
+                }
+            }
+            
+            voiceExchangeCount++;
+            if (voiceExchangeCount >= FEEDBACK_THRESHOLD && !feedbackShown) {
+                feedbackShown = true;
+                setTimeout(() => showFeedbackModal(), 2000);
+            }
+            
+        } catch (error) {
+            removeLoading();
+            console.error('[Voice] Streaming error:', error);
+            addMessage(`Error: ${error.message}. Check console for details.`, false);
+        }
+    }
+    
+    // Open the live transcription socket for one recording
+    function openSttStream(mimeType) {
+        const params = new URLSearchParams({
+            session_id: SESSION_ID,
+            case_study: studyKey,
+            content_type: mimeType,
+            async_audio: ASYNC_AUDIO ? '1' : '0'
+        });
+        const socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/api/stt/stream?${params}`);
+        sttPending = [];
+        socket.onopen = () => {
+            // Chunks recorded while the socket was connecting
+            sttPending.forEach(chunk => socket.send(chunk));
+            sttPending = [];
+        };
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.type === 'partial') {
+                recordingStatus.textContent = `"${data.transcript}"`;
+            }
+        };
+        sttSocket = socket;
+    }
+    
+    function sendSttChunk(chunk) {
+        if (sttSocket.readyState === WebSocket.OPEN) {
+            sttSocket.send(chunk);
+        } else if (sttSocket.readyState === WebSocket.CONNECTING) {
+            sttPending.push(chunk);
+        }
+    }
+    
+    // Finish the live transcription and show the reply; falls back to uploading the blob
+    function finishSttStream(audioBlob) {
+        const socket = sttSocket;
+        sttSocket = null;
+        
+        return new Promise(resolve => {
+            let finished = false;
+            const finish = () => {
+                finished = true;
+                removeLoading();
+                resolve();
+            };
+            
+            showLoading();
+            socket.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                if (data.type === 'transcript' && data.transcript) {
+                    addMessage(data.transcript, true);
+                    userMessages.push(data.transcript);
+                } else if (data.type === 'reply') {
+                    removeLoading();
+                    addMessage(data.reply, false);
+                    aiResponses.push(data.reply);
+                    addAudioMessage(`${API_URL}${data.audio_url}`);
+                    
+                    voiceExchangeCount++;
+                    if (voiceExchangeCount >= FEEDBACK_THRESHOLD && !feedbackShown) {
+                        feedbackShown = true;
+                        setTimeout(() => showFeedbackModal(), 2000);
+                    }
+                    finish();
+                } else if (data.type === 'error') {
+                    addMessage(`Error: ${data.error}. Check console for details.`, false);
+                    finish();
+                }
+            };
+            socket.onclose = async () => {
+                if (finished) return;
+                console.warn('[Voice] STT socket closed early, uploading the recording instead');
+                removeLoading();
+                await sendVoiceMessage(audioBlob);
+                resolve();
+            };
+            
+            const finalize = () => socket.send(JSON.stringify({ type: 'finalize' }));
+            if (socket.readyState === WebSocket.OPEN) {
+                finalize();
+            } else if (socket.readyState === WebSocket.CONNECTING) {
+                socket.onopen = () => {
+                    sttPending.forEach(chunk => socket.send(chunk));
+                    sttPending = [];
+                    finalize();
+                };
+            }
+        });
+    }
+    
     // Audio recording setup
     async function setupAudioRecording() {
         try {
@@ -286,7 +586,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 audio: {
                     echoCancellation: true,
                     noiseSuppression: true,
-                    sampleRate: 44100
+                    // Speech models run at 16 kHz mono; anything more only inflates the upload
+                    channelCount: 1,
+                    sampleRate: 16000
                 }
             });
             
@@ -307,12 +609,16 @@ document.addEventListener('DOMContentLoaded', () => {
             
             console.log('[Voice] Using MIME type:', mimeType || 'default');
             
-            const options = mimeType ? { mimeType } : {};
+            // Opus at 24 kbps is plenty for speech (the default is often 128 kbps)
+            const options = mimeType ? { mimeType, audioBitsPerSecond: 24000 } : { audioBitsPerSecond: 24000 };
             mediaRecorder = new MediaRecorder(stream, options);
             
             mediaRecorder.ondataavailable = (event) => {
                 if (event.data.size > 0) {
                     audioChunks.push(event.data);
+                    if (sttSocket) {
+                        sendSttChunk(event.data);
+                    }
                 }
             };
             
@@ -323,7 +629,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 audioChunks = [];
                 
                 recordingStatus.textContent = 'Processing...';
-                await sendVoiceMessage(audioBlob);
+                if (sttSocket) {
+                    await finishSttStream(audioBlob);
+                } else if (STREAM_VOICE_REPLIES) {
+                    await sendVoiceMessageStreaming(audioBlob);
+                } else {
+                    await sendVoiceMessage(audioBlob);
+                }
                 recordingStatus.textContent = '';
             };
             
@@ -343,7 +655,12 @@ document.addEventListener('DOMContentLoaded', () => {
             audioChunks = [];
             recordingStartTime = Date.now();
             console.log('[Voice] Starting recording...');
-            mediaRecorder.start();
+            if (STREAM_STT) {
+                openSttStream(mediaRecorder.mimeType || 'audio/webm');
+                mediaRecorder.start(STT_TIMESLICE_MS);
+            } else {
+                mediaRecorder.start();
+            }
             isRecording = true;
             
             recordButton.classList.add('recording');
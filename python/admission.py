@@ -0,0 +1,353 @@
+"""
+Admission control for vendor calls: concurrency limits, wait queues,
+per-turn deadlines and a per-session turn rate.
+
+Each vendor (deepgram, openai, elevenlabs) gets a Limiter: at most N calls
+in flight from this worker and at most Q callers waiting for a slot. A
+caller that finds the queue full is shed at once with Overloaded, which
+the API answers with 503 and Retry-After, instead of piling more requests
+onto a vendor that is already at its rate limit. providers.py takes a slot
+around each vendor call (cache hits and coalesced requests don't need one);
+its async variants use `acquire_async()`, which never blocks the event loop.
+
+A turn runs under a deadline:
+
+    with admission.turn_deadline():
+        transcript = transcribe_with_deepgram(...)
+
+Vendor calls made inside it cap their timeouts to the time left
+(`cap_timeout()`), queue waits give up when it passes, and
+DeadlineExceeded is raised once it has. The deadline lives in a
+ContextVar, so it follows the request through every stage without
+each function taking a parameter. Work handed to a thread pool only
+sees it if submitted through `contextvars.copy_context().run`.
+
+Configuration (environment variables, read on first use):
+    {STT,LLM,TTS}_MAX_CONCURRENCY
+        Calls in flight per worker to Deepgram, OpenAI and ElevenLabs
+        (defaults 16, 16 and 8; 0 means no limit).
+    {STT,LLM,TTS}_MAX_QUEUE
+        Callers allowed to wait for a slot before new ones are shed (default 32).
+    ADMISSION_MAX_WAIT_SECONDS
+        Longest wait for a slot before the caller is shed (default 10).
+    TURN_DEADLINE_SECONDS
+        Time budget for one whole turn (default 30).
+    SESSION_TURNS_PER_MINUTE, SESSION_TURN_BURST
+        Sustained turns per minute per session, and how many may come
+        back to back (defaults 20 and 5; 0 turns the limit off).
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Vendor -> prefix of its environment variables (same stage names as the timeouts)
+VENDOR_STAGES = {"deepgram": "STT", "openai": "LLM", "elevenlabs": "TTS"}
+DEFAULT_CONCURRENCY = {"deepgram": 16, "openai": 16, "elevenlabs": 8}
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_WAIT_SECONDS = 10
+DEFAULT_TURN_DEADLINE_SECONDS = 30
+DEFAULT_TURNS_PER_MINUTE = 20
+DEFAULT_TURN_BURST = 5
+MAX_TRACKED_SESSIONS = 10000
+
+
+class Overloaded(Exception):
+    """A vendor's wait queue is full (or the wait ran out); the request was shed"""
+
+    def __init__(self, vendor: str, retry_after: int):
+        super().__init__(f"{vendor} is at capacity, try again in {retry_after}s")
+        self.vendor = vendor
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """The turn's deadline passed before a stage could finish"""
+
+
+class AdmissionConfig:
+    """Limits read once from the environment"""
+
+    def __init__(self):
+        self.max_concurrency = {}
+        self.max_queue = {}
+        for vendor, stage in VENDOR_STAGES.items():
+            self.max_concurrency[vendor] = int(os.getenv(f"{stage}_MAX_CONCURRENCY") or DEFAULT_CONCURRENCY[vendor])
+            self.max_queue[vendor] = int(os.getenv(f"{stage}_MAX_QUEUE") or DEFAULT_MAX_QUEUE)
+        self.max_wait_seconds = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS") or DEFAULT_MAX_WAIT_SECONDS)
+        self.turn_deadline_seconds = float(os.getenv("TURN_DEADLINE_SECONDS") or DEFAULT_TURN_DEADLINE_SECONDS)
+        self.turns_per_minute = float(os.getenv("SESSION_TURNS_PER_MINUTE") or DEFAULT_TURNS_PER_MINUTE)
+        self.turn_burst = int(os.getenv("SESSION_TURN_BURST") or DEFAULT_TURN_BURST)
+
+
+# Deadlines
+
+_deadline = ContextVar("turn_deadline", default=None)  # time.monotonic() value
+_deadlines_missed = 0
+
+
+@contextmanager
+def turn_deadline(seconds: float = None):
+    """Run the block under a deadline `seconds` from now (TURN_DEADLINE_SECONDS by default); an earlier enclosing one wins"""
+    if seconds is None:
+        seconds = get_config().turn_deadline_seconds
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float:
+    """Seconds left before the current deadline; None outside a turn"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current turn is out of time"""
+    left = remaining()
+    if left is not None and left <= 0:
+        global _deadlines_missed
+        _deadlines_missed += 1
+        raise DeadlineExceeded("turn deadline passed")
+
+
+def cap_timeout(timeout: tuple) -> tuple:
+    """A (connect, read) timeout shortened to the time left in the turn"""
+    check_deadline()
+    left = remaining()
+    if left is None:
+        return timeout
+    connect, read = timeout
+    return min(connect, left), min(read, left)
+
+
+# Per-vendor concurrency limits
+
+class Limiter:
+    """
+    At most `max_concurrent` holders; up to `max_queue` more wait (FIFO-ish,
+    bounded by `max_wait` and the turn deadline), anyone beyond that is shed.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0  # admitted after waiting for a slot
+        self.shed = 0  # turned away because the queue was full
+        self.timed_out = 0  # gave up waiting (max_wait or the deadline)
+        self.hold_seconds = 1.0  # moving average of how long a slot is held, for Retry-After
+
+    def _full(self) -> bool:
+        return bool(self.max_concurrent) and self.in_flight >= self.max_concurrent
+
+    def saturated(self) -> bool:
+        """True when a new caller would be shed right now"""
+        with self.cond:
+            return self._full() and self.waiting >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Rough seconds until the current queue has drained"""
+        slots = self.max_concurrent or 1
+        return max(1, math.ceil(self.hold_seconds * (self.waiting + 1) / slots))
+
+    def acquire(self) -> float:
+        """Take a slot, waiting if allowed; returns the time it was taken, for release()"""
+        started = time.monotonic()
+        with self.cond:
+            if self._full():
+                if self.waiting >= self.max_queue:
+                    self.shed += 1
+                    raise Overloaded(self.name, self.retry_after())
+                wait = self.max_wait
+                left = remaining()
+                if left is not None:
+                    wait = min(wait, max(left, 0))
+                self.waiting += 1
+                try:
+                    got_slot = self.cond.wait_for(lambda: not self._full(), timeout=wait)
+                finally:
+                    self.waiting -= 1
+                if not got_slot:
+                    self.timed_out += 1
+                    check_deadline()
+                    raise Overloaded(self.name, self.retry_after())
+                self.queued += 1
+            self.in_flight += 1
+            self.admitted += 1
+        acquired = time.monotonic()
+        metrics.observe("admission_wait", acquired - started)
+        return acquired
+
+    def try_acquire(self) -> float:
+        """Take a slot only if one is free now; the time it was taken, or None"""
+        with self.cond:
+            if self._full():
+                return None
+            self.in_flight += 1
+            self.admitted += 1
+        metrics.observe("admission_wait", 0)
+        return time.monotonic()
+
+    async def acquire_async(self) -> float:
+        """acquire() for asyncio code: a free slot is taken at once, a wait for one happens on a worker thread"""
+        acquired = self.try_acquire()
+        if acquired is not None:
+            return acquired
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.acquire))  # to_thread carries the turn deadline
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The thread may still get a slot after we've gone; hand it straight back
+            waiter.add_done_callback(lambda done: done.cancelled() or done.exception() or self.release(done.result()))
+            raise
+
+    def release(self, acquired: float):
+        held = time.monotonic() - acquired
+        with self.cond:
+            self.in_flight -= 1
+            self.hold_seconds += 0.2 * (held - self.hold_seconds)
+            self.cond.notify()
+
+    @contextmanager
+    def slot(self):
+        acquired = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "limit": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "shed": self.shed,
+                "timed_out": self.timed_out,
+            }
+
+
+# Per-session turn rate
+
+class SessionRateLimiter:
+    """Token bucket per session: `per_minute` turns sustained, `burst` back to back"""
+
+    def __init__(self, per_minute: float, burst: int, max_sessions: int = MAX_TRACKED_SESSIONS):
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1)
+        self.max_sessions = max_sessions
+        self.buckets = OrderedDict()  # session_id -> (tokens, updated), least recently used first
+        self.lock = threading.Lock()
+        self.limited = 0
+
+    def check(self, session_id: str) -> float:
+        """0 if the session may take a turn now (using up one), else seconds until it may"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(session_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self.buckets[session_id] = (tokens - 1, now)
+                wait = 0
+            else:
+                self.buckets[session_id] = (tokens, now)
+                self.limited += 1
+                wait = (1 - tokens) / self.rate
+            while len(self.buckets) > self.max_sessions:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"sessions_tracked": len(self.buckets), "session_rate_limited": self.limited}
+
+
+_config = None
+_limiters = {}
+_session_limiter = None
+_init_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """In a forked child, start with empty limiters (the parent's in-flight calls aren't ours)"""
+    global _limiters, _session_limiter, _init_lock
+    _limiters = {}
+    _session_limiter = None
+    _init_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_config() -> AdmissionConfig:
+    global _config
+    if _config is None:
+        _config = AdmissionConfig()
+    return _config
+
+
+def get_limiter(vendor: str) -> Limiter:
+    limiter = _limiters.get(vendor)
+    if limiter is None:
+        with _init_lock:
+            limiter = _limiters.get(vendor)
+            if limiter is None:
+                config = get_config()
+                limiter = Limiter(vendor, config.max_concurrency.get(vendor, 0),
+                                  config.max_queue.get(vendor, DEFAULT_MAX_QUEUE), config.max_wait_seconds)
+                _limiters[vendor] = limiter
+    return limiter
+
+
+def get_session_limiter() -> SessionRateLimiter:
+    global _session_limiter
+    if _session_limiter is None:
+        with _init_lock:
+            if _session_limiter is None:
+                config = get_config()
+                _session_limiter = SessionRateLimiter(config.turns_per_minute, config.turn_burst)
+    return _session_limiter
+
+
+def admit(vendors=tuple(VENDOR_STAGES)):
+    """Shed a turn before any work is done if one of the vendors it needs has a full queue"""
+    for vendor in vendors:
+        limiter = get_limiter(vendor)
+        if limiter.saturated():
+            with limiter.cond:
+                limiter.shed += 1
+            raise Overloaded(vendor, limiter.retry_after())
+
+
+def stats() -> dict:
+    """Flat counters for the metrics gauge: <vendor>_<counter>, session limits and missed deadlines"""
+    values = {f"{vendor}_{name}": value
+              for vendor in VENDOR_STAGES
+              for name, value in get_limiter(vendor).stats().items()}
+    values.update(get_session_limiter().stats())
+    values["deadlines_missed"] = _deadlines_missed
+    return values
@@ -1,327 +1,936 @@
-import os
-import requests
+"""
+Flask API: speech-to-text, donor reply, text-to-speech.
+
+Build the app with `create_app()`; importing this module has no side
+effects. The factory loads .env, validates the configuration once and
+creates the stores. Vendor clients are created on first use in each
+process (and dropped in forked children, see providers.py), and
+background threads (audio janitor, greeting warm-up) start on each
+process's first request. So this works under gunicorn --preload:
+
+    WEB_CONCURRENCY=4 AUDIO_STORE=disk gunicorn --preload -b 0.0.0.0:8080 --chdir python 'api:create_app()'
+
+With more than one worker, reply audio has to be on disk: create_app()
+refuses AUDIO_STORE=memory when WEB_CONCURRENCY > 1. Background and lazy
+TTS (tts_jobs, pending_speech) stay per worker, so /api/audio for an
+async or text-turn reply must reach the worker that took the turn (route
+each session to one worker).
+    flask --app api run --port 8080          # from python/
+    python python/api.py                     # debug server on :8080
+
+Startup is timed (import and create_app) and logged against
+STARTUP_BUDGET_MS; startup_check.py measures it in fresh processes.
+"""
 import time
-from flask import Flask, request, jsonify, send_file
+
+IMPORT_STARTED = time.perf_counter()
+
+import io
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from flask import Blueprint, Flask, current_app, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
+from flask_sock import Sock
+from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
-from openai import OpenAI
 from pathlib import Path
 
-# Load .env from project root
+import admission
+import metrics
+import providers
+from audio_codec import prepare_for_stt
+from audio_janitor import create_audio_janitor
+from audio_store import audio_format, create_audio_store
+from context_budget import create_context_manager
+from idempotency import MAX_KEY_LENGTH, TurnInProgress, create_turn_results
+from session_store import create_session_store
+from singleflight import Abandoned, SingleFlight, request_key
+from providers import transcribe_with_deepgram
+from stt_stream import DeepgramStream
+from personas import get_registry, warm_up_enabled
+from prompts import get_system_prompt
+from reply_cache import create_reply_cache
+from tts_backends import ElevenLabsBackend, create_hedged_tts
+from tts_jobs import FAILED, PENDING, create_tts_jobs, get_wait_seconds
+from tts_cache import cache_key, get_tts_cache, normalize_text
+from streaming import iter_sentences, stream_segments, sse_event, elapsed_ms
+from logging_setup import configure_logging
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+log = logging.getLogger("api")
+
 project_root = Path(__file__).parent.parent
 env_path = project_root / '.env'
-load_dotenv(dotenv_path=env_path)
 
-print(f"[Init] Loading .env from: {env_path}")
-print(f"[Init] .env exists: {env_path.exists()}")
+bp = Blueprint("api", __name__)
+sock = Sock()  # WebSocket routes, registered on `bp`
+
+# Voice ID for ElevenLabs
+CHATBOT_VOICE_ID = "Xb7hH8MSUJpSbSDYk0k2"  # Alice
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend requests
+# Donor replies
+LLM_MODEL = "gpt-4o-mini"
+LLM_MAX_TOKENS = 256
 
-# API Keys
-ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DEFAULT_STARTUP_BUDGET_MS = 1500
 
-print(f"[Init] ELEVEN_API_KEY loaded: {bool(ELEVEN_API_KEY)}")
-print(f"[Init] DEEPGRAM_API_KEY loaded: {bool(DEEPGRAM_API_KEY)}")
-print(f"[Init] OPENAI_API_KEY loaded: {bool(OPENAI_API_KEY)}")
 
-if not all([ELEVEN_API_KEY, DEEPGRAM_API_KEY, OPENAI_API_KEY]):
-    raise RuntimeError("Missing API keys in .env file")
+class ApiConfig:
+    """Settings read from the environment once, by create_app()"""
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self):
+        self.eleven_api_key = os.getenv("ELEVEN_API_KEY")
+        self.deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
+        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        # Oversized uploads are rejected from the Content-Length header, before the body is read
+        self.max_upload_bytes = int(os.getenv("MAX_UPLOAD_BYTES") or 10 * 1024 * 1024)
+        # Text turns (/api/chat/text): longest message accepted, and how many replies
+        # can wait for /api/audio/<id> to synthesize them on first request
+        self.text_message_max_chars = int(os.getenv("TEXT_MESSAGE_MAX_CHARS") or 2000)
+        self.lazy_tts_max_pending = int(os.getenv("LAZY_TTS_MAX_PENDING") or 1000)
+        # /api/stt/stream limits: seconds without a message from the browser, and audio kept per turn
+        self.stt_stream_idle_seconds = float(os.getenv("STT_STREAM_IDLE_SECONDS") or 30)
+        self.stt_stream_max_bytes = int(os.getenv("STT_STREAM_MAX_BYTES") or 10 * 1024 * 1024)
+        # Default for /api/chat's async_audio field, and how long /api/audio waits on background TTS
+        self.chat_async_audio = os.getenv("CHAT_ASYNC_AUDIO", "0").lower() in ("1", "true", "yes")
+        self.audio_wait_seconds = get_wait_seconds()
+        self.startup_budget_ms = float(os.getenv("STARTUP_BUDGET_MS") or DEFAULT_STARTUP_BUDGET_MS)
+        # Worker count (gunicorn reads it too); the memory audio store can't be shared between workers
+        self.web_concurrency = int(os.getenv("WEB_CONCURRENCY") or 1)
+        self.audio_store_backend = os.getenv("AUDIO_STORE", "memory").lower()
+
+    def validate(self):
+        missing = [name for name, value in (
+            ("ELEVEN_API_KEY", self.eleven_api_key),
+            ("DEEPGRAM_API_KEY", self.deepgram_api_key),
+            ("OPENAI_API_KEY", self.openai_api_key),
+        ) if not value]
+        if missing:
+            raise RuntimeError(f"Missing API keys in .env file: {', '.join(missing)}")
+        if self.web_concurrency > 1 and self.audio_store_backend == "memory":
+            # /api/audio/<id> would 404 whenever it reached a different worker than the turn
+            raise RuntimeError(f"AUDIO_STORE=memory keeps reply audio in one worker, but WEB_CONCURRENCY is "
+                               f"{self.web_concurrency}; set AUDIO_STORE=disk and route each session to one worker")
 
-# Voice ID for ElevenLabs
-CHATBOT_VOICE_ID = "Xb7hH8MSUJpSbSDYk0k2"  # Alice
 
-# Create audio output directory in project root
+# Set up by create_app(); the routes below use them
+config = None
 audio_out_dir = project_root / "audio_out"
-audio_out_dir.mkdir(exist_ok=True)
-print(f"[Init] Audio output directory: {audio_out_dir}")
+audio_store = None  # reply audio between TTS and /api/audio/<id> (see audio_store.py)
+audio_janitor = None  # deletes old reply files from audio_out/
+sessions = None  # conversation history per session, bounded by idle TTL, LRU cap and history budget
+context_budget = None  # keeps each OpenAI prompt within its token budget, summarizing old turns
+persona_registry = None  # donor personas from personas/*.json, hot-reloaded
+tts_jobs = None  # replies whose text went out first are synthesized here (see tts_jobs.py)
+tts_backend = None  # ElevenLabs, hedged with an offline engine when it is slow or down (see tts_backends.py)
+reply_cache = None  # opening-turn replies per persona, when REPLY_CACHE_ENABLED (see reply_cache.py)
+turn_results = None  # finished and running turns by idempotency key, for client retries (see idempotency.py)
 
-# Store conversation history per session (in-memory, simple approach)
-conversations = {}
+pending_speech = OrderedDict()  # audio_id -> reply text waiting for a lazy /api/audio request, oldest first
+pending_speech_lock = threading.Lock()
 
+# Identical concurrent LLM and TTS calls share one vendor request
+llm_flights = SingleFlight("llm")
+tts_flights = SingleFlight("tts")
 
-def transcribe_with_deepgram(audio_bytes: bytes, content_type: str) -> str:
-    """Transcribe audio using Deepgram API"""
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": content_type,
-    }
-    
-    params = {
-        "model": "nova-2",
-        "smart_format": "true",
-        "punctuate": "true",
-    }
-    
-    print("[STT] Sending audio to Deepgram...")
-    resp = requests.post(
-        "https://api.deepgram.com/v1/listen",
-        headers=headers,
-        params=params,
-        data=audio_bytes,
-    )
-    
-    if resp.status_code != 200:
-        print("[STT] Error:", resp.text)
-        return ""
-    
-    try:
-        data = resp.json()
-        transcript = data["results"]["channels"][0]["alternatives"][0]["transcript"]
-        print("[STT] Transcript:", transcript)
-        return transcript.strip()
-    except (KeyError, IndexError) as e:
-        print("[STT] Error parsing response:", e)
-        return ""
+# Background threads belong to the process that started them, so each worker starts its own
+_started_pid = None
+_started_lock = threading.Lock()
+
+
+def tts_cache_gauges() -> dict:
+    cache = get_tts_cache()
+    return cache.stats() if cache else {}
+
+
+def singleflight_gauges() -> dict:
+    return {f"{flights.name}_{name}": value
+            for flights in (llm_flights, tts_flights)
+            for name, value in flights.stats().items()}
+
+
+def register_gauges():
+    """Store and cache sizes alongside the stage latencies on /api/metrics"""
+    metrics.register_gauge("pitch_sessions_live", "Conversations held by this worker",
+                           lambda: sessions.stats()["live_sessions"])
+    metrics.register_gauge("pitch_audio_store_bytes", "Reply audio held for /api/audio",
+                           lambda: audio_store.stats().get("bytes", 0))
+    metrics.register_gauge("pitch_tts_cache", "TTS cache counters", tts_cache_gauges)
+    metrics.register_gauge("pitch_singleflight", "Vendor calls made, and requests coalesced onto them",
+                           singleflight_gauges)
+    metrics.register_gauge("pitch_personas", "Persona registry size, reloads and cached greetings",
+                           lambda: {k: v for k, v in persona_registry.stats().items() if k != "version"})
+    metrics.register_gauge("pitch_tts_jobs", "Background TTS jobs", lambda: tts_jobs.stats())
+    metrics.register_gauge("pitch_tts_hedge", "TTS calls won by each backend, hedged and failed over",
+                           lambda: tts_backend.stats())
+    if reply_cache is not None:
+        metrics.register_gauge("pitch_reply_cache", "Opening-turn reply cache hits and LLM seconds saved",
+                               reply_cache.stats)
+    metrics.register_gauge("pitch_idempotency", "Turns run under an idempotency key, and retries replayed",
+                           lambda: turn_results.stats())
+    metrics.register_gauge("pitch_admission", "Vendor slots in use, queue depth, shed and rate-limited requests",
+                           admission.stats)
+
+
+def create_app() -> Flask:
+    """Load .env, validate the configuration and build the app (no threads or vendor clients yet)"""
+    global config, audio_store, audio_janitor, sessions, context_budget, persona_registry, tts_jobs, reply_cache, \
+        tts_backend, turn_results
+    started = time.perf_counter()
+    load_dotenv(dotenv_path=env_path)
+    configure_logging()
+    log.info("Loading .env from %s (exists: %s)", env_path, env_path.exists())
+
+    config = ApiConfig()
+    log.info("API keys loaded", extra={
+        "eleven": bool(config.eleven_api_key),
+        "deepgram": bool(config.deepgram_api_key),
+        "openai": bool(config.openai_api_key),
+    })
+    config.validate()
+
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for frontend requests
+    app.config['MAX_CONTENT_LENGTH'] = config.max_upload_bytes
+    app.register_blueprint(bp)
+
+    audio_out_dir.mkdir(exist_ok=True)
+    log.info("Audio output directory: %s", audio_out_dir)
+    audio_store = create_audio_store(audio_out_dir)
+    log.info("Audio store: %s", audio_store.stats()['backend'])
+    audio_janitor = create_audio_janitor(audio_out_dir)
+    sessions = create_session_store()
+    context_budget = create_context_manager()
+    persona_registry = get_registry()
+    tts_backend = create_hedged_tts(ElevenLabsBackend(CHATBOT_VOICE_ID))
+    tts_jobs = create_tts_jobs(synthesize_with_elevenlabs)  # pool threads start with the first job
+    reply_cache = create_reply_cache()
+    turn_results = create_turn_results()
+    register_gauges()
+
+    factory_seconds = time.perf_counter() - started
+    metrics.observe("startup", IMPORT_SECONDS + factory_seconds)
+    total_ms = (IMPORT_SECONDS + factory_seconds) * 1000
+    log.log(logging.WARNING if total_ms > config.startup_budget_ms else logging.INFO,
+            "Startup took %.0f ms (budget %.0f ms)", total_ms, config.startup_budget_ms,
+            extra={"import_ms": round(IMPORT_SECONDS * 1000), "create_app_ms": round(factory_seconds * 1000)})
+    return app
+
+
+@bp.before_app_request
+def start_background_work():
+    """Start this process's background threads on its first request"""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _started_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        audio_janitor.start()
+        # Generate greeting audio up front so sessions open without waiting on TTS
+        if warm_up_enabled():
+            persona_registry.warm_up(synthesize_vendor_speech)
 
 
 def get_chatbot_reply(conversation: list, user_text: str, case_study: str) -> str:
-    """Get reply from OpenAI"""
-    conversation.append({"role": "user", "content": user_text})
-    
-    print("[OpenAI] Generating reply...")
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=conversation,
-        max_tokens=256,
-    )
-    
-    reply = completion.choices[0].message.content
+    """Get reply from OpenAI (streamed internally so time to first token is measured)"""
+    return "".join(stream_chatbot_reply(conversation, user_text, case_study))
+
+
+def stream_chatbot_reply(conversation: list, user_text: str, case_study: str = None):
+    """
+    Stream reply text deltas, recording the full reply when done.
+    Opening turns may be answered from the reply cache instead of OpenAI.
+    If the reply fails or the stream is closed early, the user's message is taken back out.
+    """
+    user_message = {"role": "user", "content": user_text}
+    conversation.append(user_message)
+    try:
+        conversation[:] = context_budget.fit(conversation)
+
+        persona_key = persona_registry.get(case_study).key
+        reply = reply_cache.get(persona_key, conversation) if reply_cache is not None else None
+        if reply is not None:
+            log.debug("Served a reply from the reply cache")
+            yield reply
+        else:
+            started = time.perf_counter()
+            reply = yield from stream_llm_reply(conversation)
+            if reply_cache is not None:
+                reply_cache.put(persona_key, conversation, reply, time.perf_counter() - started)
+    except BaseException:
+        undo_turn(conversation, [user_message])
+        raise
+
     conversation.append({"role": "assistant", "content": reply})
-    
-    print("[OpenAI] Reply:", reply)
+    log.debug("Reply: %s", reply)
+
+
+def undo_turn(conversation: list, messages: list):
+    """Take a failed turn's messages back out, so a retry doesn't add a second copy"""
+    conversation[:] = [m for m in conversation if all(m is not message for message in messages)]
+
+
+def messages_since(conversation: list, before: list) -> list:
+    """The user and assistant messages added since `before` was copied (a new summary isn't one of them)"""
+    return [m for m in conversation if m["role"] != "system" and all(m is not old for old in before)]
+
+
+def stream_llm_reply(conversation: list):
+    """
+    Stream reply text deltas from OpenAI and return the whole reply.
+    A request identical to one already in flight waits for that reply instead.
+    """
+    key = request_key(LLM_MODEL, LLM_MAX_TOKENS, [[m["role"], normalize_text(m["content"] or "")] for m in conversation])
+    while True:
+        flight, leader = llm_flights.join(key)
+        if leader:
+            break
+        try:
+            reply = flight.wait()
+        except Abandoned:
+            continue  # the leader's client went away; make the call (or follow whoever does)
+        log.debug("Shared an identical in-flight LLM request")
+        if reply:
+            yield reply
+        return reply
+
+    parts = []
+    try:
+        with metrics.timed("llm"):
+            started = time.perf_counter()
+            stream = providers.create_chat_completion(conversation, max_tokens=LLM_MAX_TOKENS, stream=True,
+                                                      model=LLM_MODEL)
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        metrics.observe("llm_first_token", time.perf_counter() - started)
+                    parts.append(delta)
+                    yield delta
+    except Exception as e:
+        llm_flights.finish(key, flight, error=e)
+        raise
+    except BaseException:
+        llm_flights.abandon(key, flight)
+        raise
+    reply = "".join(parts)
+    llm_flights.finish(key, flight, result=reply)
     return reply
 
 
-def synthesize_with_elevenlabs(text: str, session_id: str) -> str:
-    """Convert text to speech using ElevenLabs"""
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{CHATBOT_VOICE_ID}"
-    headers = {
-        "xi-api-key": ELEVEN_API_KEY,
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "text": text,
-        "model_id": "eleven_multilingual_v2",
-        "voice_settings": {
-            "stability": 0.6,
-            "similarity_boost": 0.85,
-        },
-    }
-    
-    print("[TTS] Requesting audio from ElevenLabs...")
-    print(f"[TTS] Text to convert: {text[:100]}...")
-    
-    resp = requests.post(url, headers=headers, json=payload, stream=True)
-    
-    if resp.status_code != 200:
-        print("[TTS] Error:", resp.text)
-        return ""
-    
-    print(f"[TTS] Received audio response")
-    print(f"[TTS] Content-Type: {resp.headers.get('content-type')}")
-    
-    # Use absolute path to project root's audio_out directory
-    output_path = audio_out_dir / f"reply_{session_id}.mp3"
-    
-    # Delete old audio file if it exists
-    if output_path.exists():
-        os.remove(output_path)
-        print(f"[TTS] Deleted old audio file: {output_path}")
-    
-    # Write the audio file in chunks to ensure complete write
-    with open(output_path, "wb") as f:
-        for chunk in resp.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-    
-    file_size = os.path.getsize(output_path)
-    print(f"[TTS] Saved audio to {output_path}")
-    print(f"[TTS] File size on disk: {file_size} bytes")
-    
-    if file_size == 0:
-        print("[TTS] ERROR: File is empty!")
+def synthesize_speech(text: str) -> bytes:
+    """
+    Audio for `text` in the donor's voice, or the offline voice if ElevenLabs is
+    slow or down; b"" on failure. Identical concurrent requests share one call.
+    """
+    key = request_key("hedged", cache_key(CHATBOT_VOICE_ID, providers.TTS_MODEL_ID, providers.TTS_VOICE_SETTINGS, text))
+    return tts_flights.do(key, lambda: tts_backend.synthesize(text))
+
+
+def synthesize_vendor_speech(text: str) -> bytes:
+    """ElevenLabs only, for audio kept long-term (greetings) that shouldn't be the offline voice"""
+    key = cache_key(CHATBOT_VOICE_ID, providers.TTS_MODEL_ID, providers.TTS_VOICE_SETTINGS, text)
+    return tts_flights.do(key, lambda: providers.synthesize_to_bytes(text, CHATBOT_VOICE_ID))
+
+
+def synthesize_with_elevenlabs(text: str, audio_id: str) -> str:
+    """Convert text to speech using ElevenLabs and keep it in the audio store"""
+    audio = synthesize_speech(text)
+    if not audio:
         return ""
     
-    return output_path
-
-
-def get_system_prompt(case_study: str) -> str:
-    """Get system prompt based on case study"""
-    prompts = {
-        "template1": (
-            # ROLE & BACKGROUND
-            "You are Dr. Jennifer Walker, a 55-year-old African American Biology Professor at the University of Hawaii, Honolulu. "
-            "You hold a PhD in Genetics and Genomics from CalTech, an MS in Molecular Biology from Harvard, and a BS in Biology from UT Austin. "
-            "You previously worked in private industry and hold lucrative gene patents. You're married to Fabio, a surf instructor, "
-            "and have an adopted daughter from Somalia named Margaret who's in her mid-20s with an interest in art. "
-            
-            # PERSONALITY & BEHAVIOR
-            "You're easily distracted because you manage many responsibilities. You're not open to casual chatter and will try to quickly end "
-            "conversations that aren't interesting or important. You're often checking your phone. You appreciate professionalism and respect for your time. "
-            "You have no patience for overly personal or casual approaches - maintain professional distance. "
-            
-            # INTERESTS & VALUES
-            "You love animals (you have a Rottweiler), the outdoors, sailing, sea life, and surfing competitions. "
-            "You dislike crowded places and soda. You've given to conservation and human rights causes in the past. "
-            "Your Twitter likes show aquatic animals. "
-            
-            # CONVERSATION STYLE
-            "Keep responses brief (1-2 sentences max) and business-like. Show mild impatience if the pitch lacks focus or wastes time. "
-            "Ask direct, pointed questions about impact, budget, and outcomes. If someone tries to be overly casual or personal, become noticeably less engaged. "
-            "Show interest when they mention conservation, marine life, human rights, or demonstrate clear metrics and professionalism. "
-            
-            # EVALUATION CRITERIA
-            "You want to see: (1) Clear, measurable impact (especially conservation or human rights related), "
-            "(2) Respect for your time with concise communication, (3) Professional tone, (4) Specific budget and outcomes, "
-            "(5) Regular updates and accountability. "
-            
-            # RED FLAGS
-            "You'll disengage if they: waste time with small talk, are vague about impact, lack financial clarity, "
-            "try to be too familiar or casual, or don't have a clear ask. "
-            
-            # CONVERSATION PROGRESSION
-            "Start by politely asking about their work and its purpose, while keeping it focused. "
-            "If they're focused and professional, ask about measurable outcomes. "
-            "Then probe on budget and sustainability. "
-            "If they maintain professionalism and show clear impact, ask how you'd be kept informed. "
-            "Show subtle interest if they mention marine conservation, animal welfare, or human rights."
-        ),
-        "template2": (
-            "You are a [ROLE] interviewing a [SUBJECT]. "
-            "Focus on [KEY TOPICS]. "
-            "Be [TONE]. Keep responses [LENGTH]."
-        ),
-        "template3": (
-            "You are a [ROLE] interviewing a [SUBJECT]. "
-            "Ask about [KEY TOPICS]. "
-            "Balance [ASPECT 1] with [ASPECT 2]. Keep responses [LENGTH]."
-        ),
+    with metrics.timed("audio_write"):
+        audio_store.put(audio_id, audio)
+    log.debug("Stored %d bytes of audio", len(audio), extra={"audio_id": audio_id})
+    return audio_id
+
+
+def defer_speech(text: str, audio_id: str) -> str:
+    """Remember reply text so /api/audio/<audio_id> can synthesize it if it is ever requested"""
+    with pending_speech_lock:
+        pending_speech[audio_id] = text
+        while len(pending_speech) > config.lazy_tts_max_pending:
+            pending_speech.popitem(last=False)
+    return audio_id
+
+
+def synthesize_deferred(audio_id: str) -> bytes:
+    """Run TTS for a deferred reply and keep the result in the audio store; b"" if there is none"""
+    with pending_speech_lock:
+        text = pending_speech.get(audio_id)
+    if text is None or not synthesize_with_elevenlabs(text, audio_id):
+        return b""
+    with pending_speech_lock:
+        pending_speech.pop(audio_id, None)
+    return audio_store.get(audio_id) or b""
+
+
+def normalize_content_type(content_type: str) -> str:
+    """Strip codec parameters from browser MIME types before sending to Deepgram"""
+    content_type = content_type or "audio/webm"
+    if 'webm' in content_type.lower():
+        return "audio/webm"
+    if 'mp4' in content_type.lower() or 'm4a' in content_type.lower():
+        return "audio/mp4"
+    return content_type.split(';')[0].strip().lower()
+
+
+def reply_to_transcript(session_id: str, case_study: str, transcript: str, async_audio: bool = False):
+    """
+    Steps 2 and 3 of a turn: LLM reply and TTS; returns the /api/chat payload, or None if TTS failed.
+    With `async_audio` TTS is queued instead, and audio_url answers once it's done.
+    The exchange is only kept in the session's history if the turn succeeds,
+    so TTS runs before the session is released.
+    """
+    with sessions.conversation(session_id, lambda: get_system_prompt(case_study)) as conversation:
+        reply = get_chatbot_reply(conversation, transcript, case_study)
+        exchange = conversation[-2:]
+
+        # Create unique audio ID using timestamp to avoid caching issues
+        audio_id = f"{session_id}_{int(time.time() * 1000)}"
+        if async_audio:
+            tts_jobs.submit(audio_id, reply)
+        elif not synthesize_with_elevenlabs(reply, audio_id):
+            log.warning("TTS failed", extra={"session": session_id, "stage": "tts"})
+            undo_turn(conversation, exchange)
+            return None
+
+    return {
+        "transcript": transcript,
+        "reply": reply,
+        "audio_url": f"/api/audio/{audio_id}",
+        "audio_pending": async_audio,
     }
-    return prompts.get(case_study, prompts["template1"])
 
 
-@app.route('/api/chat', methods=['POST'])
+def check_session_rate(session_id: str):
+    """429 response if the session is taking turns faster than SESSION_TURNS_PER_MINUTE, else None"""
+    wait = admission.get_session_limiter().check(session_id)
+    if not wait:
+        return None
+    log.info("Session over its turn rate", extra={"session": session_id})
+    return jsonify({"error": "Too many turns, slow down"}), 429, {"Retry-After": str(math.ceil(wait))}
+
+
+def idempotency_key(data) -> str:
+    """The client's key for this turn (Idempotency-Key header or idempotency_key field), or None"""
+    return (request.headers.get('Idempotency-Key') or data.get('idempotency_key') or '').strip() or None
+
+
+def idempotent_turn(session_id: str, key: str, run_turn):
+    """
+    Return run_turn()'s response, running it at most once per (session, key):
+    a retry gets the stored JSON of a successful turn, or waits for it if it's still running.
+    """
+    if key is None:
+        return run_turn()
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency key too long (limit is {MAX_KEY_LENGTH} characters)"}), 400
+    record, replay = turn_results.claim(request_key("turn", session_id, key),
+                                        admission.get_config().turn_deadline_seconds)
+    if replay is not None:
+        log.info("Replayed a retried turn", extra={"session": session_id})
+        return jsonify(replay), 200, {"Idempotent-Replayed": "true"}
+    payload = None
+    try:
+        response = current_app.make_response(run_turn())
+        if response.status_code == 200 and response.is_json:
+            payload = response.get_json()
+        return response
+    finally:
+        turn_results.finish(record, payload)  # failed turns release the key, so a retry runs them again
+
+
+def wants_async_audio(value) -> bool:
+    """Parse an async_audio request field, falling back to CHAT_ASYNC_AUDIO"""
+    if value is None or value == "":
+        return config.chat_async_audio
+    return str(value).lower() in ("1", "true", "yes")
+
+
+@bp.route('/api/chat', methods=['POST'])
 def chat():
     """Handle audio upload, transcription, LLM response, and TTS"""
+    started = time.perf_counter()
     try:
-        print("\n[API] Received chat request")
-        
         # Get audio file and metadata
         if 'audio' not in request.files:
-            print("[API] Error: No audio file in request")
+            log.warning("No audio file in request")
             return jsonify({"error": "No audio file provided"}), 400
         
         audio_file = request.files['audio']
         session_id = request.form.get('session_id', 'default')
-        case_study = request.form.get('case_study', 'saas')
-        
-        print(f"[API] Session: {session_id}, Case Study: {case_study}")
-        print(f"[API] Audio file: {audio_file.filename}, Content-Type: {audio_file.content_type}")
-        
+        case_study = request.form.get('case_study')
+        async_audio = wants_async_audio(request.form.get('async_audio'))
+
+        # A retry with the same idempotency key replays this turn instead of running it again;
+        # that is checked first, so admission and the session's turn rate only apply to new turns
+        return idempotent_turn(session_id, idempotency_key(request.form),
+                               lambda: voice_turn(audio_file, session_id, case_study, async_audio, started))
+    
+    except providers.CircuitOpenError as e:
+        log.warning("Vendor unavailable: %s", e)
+        return jsonify({"error": str(e)}), 503
+    
+    except (HTTPException, admission.Overloaded, admission.DeadlineExceeded, TurnInProgress):
+        raise  # e.g. 413 from MAX_CONTENT_LENGTH or a shed request, answered by its error handler
+    
+    except Exception as e:
+        log.exception("Chat turn failed")
+        return jsonify({"error": str(e)}), 500
+
+
+def voice_turn(audio_file, session_id: str, case_study: str, async_audio: bool, started: float):
+    """The body of /api/chat once the request is parsed: STT, LLM reply and TTS"""
+    admission.admit()  # shed before any vendor work if a vendor's queue is already full
+    limited = check_session_rate(session_id)
+    if limited:
+        return limited
+    
+    with admission.turn_deadline():
         # Read audio bytes
-        audio_bytes = audio_file.read()
-        content_type = audio_file.content_type or "audio/webm"
-        
-        # If it's WebM, try to detect if it has codecs specified
-        if 'webm' in content_type.lower():
-            content_type = "audio/webm"
-        elif 'mp4' in content_type.lower() or 'm4a' in content_type.lower():
-            content_type = "audio/mp4"
-        
-        print(f"[API] Audio size: {len(audio_bytes)} bytes")
-        print(f"[API] Content-Type being sent to Deepgram: {content_type}")
-        
-        # Initialize conversation if new session
-        if session_id not in conversations:
-            print(f"[API] Creating new conversation for session {session_id}")
-            conversations[session_id] = [
-                {"role": "system", "content": get_system_prompt(case_study)}
-            ]
+        with metrics.timed("upload_read"):
+            audio_bytes = audio_file.read()
+        content_type = normalize_content_type(audio_file.content_type)
+        log.debug("Received %d bytes of %s audio", len(audio_bytes), content_type, extra={"session": session_id})
+        with metrics.timed("transcode"):
+            audio_bytes, content_type = prepare_for_stt(audio_bytes, content_type)
         
         # Step 1: Transcribe audio
-        print("[API] Step 1: Transcribing audio...")
         transcript = transcribe_with_deepgram(audio_bytes, content_type)
         if not transcript:
-            print("[API] Error: Transcription failed or empty")
+            log.warning("Transcription failed or empty", extra={"session": session_id, "stage": "stt"})
             return jsonify({"error": "Transcription failed - no speech detected"}), 500
         
-        print(f"[API] Transcript: {transcript}")
-        
-        # Step 2: Get LLM response
-        print("[API] Step 2: Getting LLM response...")
-        reply = get_chatbot_reply(conversations[session_id], transcript, case_study)
-        print(f"[API] Reply: {reply}")
-        
-        # Step 3: Convert to speech
-        print("[API] Step 3: Converting to speech...")
-        # Create unique audio ID using timestamp to avoid caching issues
-        audio_id = f"{session_id}_{int(time.time() * 1000)}"
-        audio_path = synthesize_with_elevenlabs(reply, audio_id)
-        if not audio_path:
-            print("[API] Error: TTS failed")
+        # Steps 2 and 3: Get LLM response and convert it to speech
+        payload = reply_to_transcript(session_id, case_study, transcript, async_audio)
+        if payload is None:
             return jsonify({"error": "TTS failed"}), 500
-        
-        print(f"[API] Success! Audio saved to {audio_path}")
-        
-        # Return response
-        return jsonify({
-            "transcript": transcript,
-            "reply": reply,
-            "audio_url": f"/api/audio/{audio_id}"
-        })
     
+    duration = time.perf_counter() - started
+    metrics.observe("turn", duration)
+    log.info("Chat turn complete", extra={
+        "session": session_id, "case_study": case_study, "stage": "turn", "duration_ms": round(duration * 1000),
+    })
+    
+    return jsonify(payload)
+
+
+@bp.route('/api/chat/text', methods=['POST'])
+def chat_text():
+    """
+    Typed turn: no STT, and no TTS unless the client fetches the audio.
+
+    Accepts JSON or form fields: message, session_id, case_study, and
+    tts = "lazy" (default; audio_url is synthesized on first request),
+    "async" (synthesis starts now, in the background) or "none" (no
+    audio_url). Shares sessions with /api/chat, and its idempotency keys.
+    """
+    started = time.perf_counter()
+    data = request.get_json(silent=True) or request.form
+    message = (data.get('message') or '').strip()
+    session_id = data.get('session_id') or 'default'
+    case_study = data.get('case_study')
+    tts = (data.get('tts') or 'lazy').lower()
+
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+    if len(message) > config.text_message_max_chars:
+        return jsonify({"error": f"Message too long (limit is {config.text_message_max_chars} characters)"}), 400
+    if tts not in ("lazy", "async", "none"):
+        return jsonify({"error": "tts must be 'lazy', 'async' or 'none'"}), 400
+    return idempotent_turn(session_id, idempotency_key(data),
+                           lambda: text_turn(message, session_id, case_study, tts, started))
+
+
+def text_turn(message: str, session_id: str, case_study: str, tts: str, started: float):
+    """The body of /api/chat/text once the request is validated: LLM reply, and TTS as asked"""
+    admission.admit(["openai"])
+    limited = check_session_rate(session_id)
+    if limited:
+        return limited
+
+    try:
+        with admission.turn_deadline():
+            with sessions.conversation(session_id, lambda: get_system_prompt(case_study)) as conversation:
+                reply = get_chatbot_reply(conversation, message, case_study)
+    except providers.CircuitOpenError as e:
+        log.warning("Vendor unavailable: %s", e)
+        return jsonify({"error": str(e)}), 503
+    except (admission.Overloaded, admission.DeadlineExceeded):
+        raise
     except Exception as e:
-        print(f"[API] EXCEPTION: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Text turn failed")
         return jsonify({"error": str(e)}), 500
 
+    audio_url = None
+    if tts != "none" and reply:
+        audio_id = f"{session_id}_{int(time.time() * 1000)}"
+        if tts == "async":
+            tts_jobs.submit(audio_id, reply)
+        else:
+            defer_speech(reply, audio_id)
+        audio_url = f"/api/audio/{audio_id}"
+
+    duration = time.perf_counter() - started
+    metrics.observe("text_turn", duration)
+    log.info("Text turn complete", extra={
+        "session": session_id, "case_study": case_study, "stage": "text_turn", "duration_ms": round(duration * 1000),
+    })
+    return jsonify({"reply": reply, "audio_url": audio_url})
+
+
+@bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same inputs as /api/chat, but the reply is sent back as Server-Sent Events.
+
+    Events, in order:
+      transcript  {"transcript"}
+      segment     {"index", "text", "audio_url", "elapsed_ms"} one per sentence
+      done        {"reply", "segments", "elapsed_ms"}
+      error       {"error"} if a stage fails ({"error", "index"} if a segment's TTS fails)
+    A turn that ends in an error isn't kept in the session's history.
+    """
+    started = time.perf_counter()
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    audio_file = request.files['audio']
+    session_id = request.form.get('session_id', 'default')
+    case_study = request.form.get('case_study')
+    admission.admit()  # shed before any vendor work if a vendor's queue is already full
+    limited = check_session_rate(session_id)
+    if limited:
+        return limited
+    deadline_seconds = admission.get_config().turn_deadline_seconds
+
+    with admission.turn_deadline(deadline_seconds):
+        with metrics.timed("upload_read"):
+            audio_bytes = audio_file.read()
+        content_type = normalize_content_type(audio_file.content_type)
+        with metrics.timed("transcode"):
+            audio_bytes, content_type = prepare_for_stt(audio_bytes, content_type)
+
+        transcript = transcribe_with_deepgram(audio_bytes, content_type)
+    if not transcript:
+        return jsonify({"error": "Transcription failed - no speech detected"}), 500
+
+    audio_id = f"{session_id}_{int(time.time() * 1000)}"
+
+    def synthesize_segment(index, sentence):
+        return synthesize_with_elevenlabs(sentence, f"{audio_id}_{index}")
+
+    def generate():
+        yield sse_event("transcript", {"transcript": transcript})
+        sentences = []
+        try:
+            # The rest of the turn's deadline; the generator runs after chat_stream() has returned
+            with admission.turn_deadline(deadline_seconds - (time.perf_counter() - started)), \
+                    sessions.conversation(session_id, lambda: get_system_prompt(case_study)) as conversation:
+                before = list(conversation)
+                failed_index = None
+                try:
+                    deltas = stream_chatbot_reply(conversation, transcript, case_study)
+                    # closing(): the LLM stream is stopped before the turn is taken back out
+                    with closing(stream_segments(iter_sentences(deltas), synthesize_segment)) as segments:
+                        for index, sentence, segment_id in segments:
+                            if not segment_id:
+                                failed_index = index
+                                break
+                            sentences.append(sentence)
+                            yield sse_event("segment", {
+                                "index": index,
+                                "text": sentence,
+                                "audio_url": f"/api/audio/{audio_id}_{index}",
+                                "elapsed_ms": elapsed_ms(started),
+                            })
+                except BaseException:
+                    undo_turn(conversation, messages_since(conversation, before))
+                    raise
+                if failed_index is not None:
+                    # Same as /api/chat: a turn the user never heard isn't kept in the history
+                    undo_turn(conversation, messages_since(conversation, before))
+                    yield sse_event("error", {"error": "TTS failed", "index": failed_index})
+                    return
+            yield sse_event("done", {
+                "reply": " ".join(sentences),
+                "segments": len(sentences),
+                "elapsed_ms": elapsed_ms(started),
+            })
+            log.info("Streaming chat turn complete", extra={
+                "session": session_id, "case_study": case_study, "stage": "turn",
+                "segments": len(sentences), "duration_ms": elapsed_ms(started),
+            })
+        except Exception as e:
+            log.exception("Streaming chat turn failed", extra={"session": session_id})
+            yield sse_event("error", {"error": str(e)})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the stream
+    return response
+
+
+@sock.route('/api/stt/stream', bp=bp)
+def stt_stream(ws):
+    """
+    Transcribe while the user is still recording, then run the rest of the turn.
 
-@app.route('/api/audio/<session_id>', methods=['GET'])
+    Query params: session_id, case_study, content_type (the MediaRecorder MIME type).
+    Browser -> server: binary MediaRecorder chunks, then {"type": "finalize"} on release.
+    Server -> browser (JSON text frames):
+      partial     {"transcript"} interim text while recording
+      transcript  {"transcript"} final text, right after finalize
+      reply       same fields as the /api/chat response
+      error       {"error"}
+    If the live Deepgram stream can't be opened or breaks, the buffered
+    audio goes to the batch endpoint instead.
+    """
+    session_id = request.args.get('session_id', 'default')
+    case_study = request.args.get('case_study')
+    content_type = normalize_content_type(request.args.get('content_type'))
+    async_audio = wants_async_audio(request.args.get('async_audio'))
+    if admission.get_session_limiter().check(session_id):
+        ws.send(json.dumps({"type": "error", "error": "Too many turns, slow down"}))
+        return
+
+    send_lock = threading.Lock()  # partials are sent from the Deepgram reader thread
+
+    def send(event_type: str, **data):
+        with send_lock:
+            ws.send(json.dumps({"type": event_type, **data}))
+
+    stream = None
+    try:
+        stream = DeepgramStream(on_partial=lambda text: send("partial", transcript=text))
+    except (providers.ProviderError, admission.Overloaded) as e:
+        log.warning("Live STT unavailable, will transcribe on release: %s", e, extra={"session": session_id})
+
+    audio = bytearray()
+    try:
+        while True:
+            message = ws.receive(timeout=config.stt_stream_idle_seconds)
+            if message is None:
+                send("error", error="Timed out waiting for audio")
+                return
+            if isinstance(message, str):
+                if json.loads(message).get("type") == "finalize":
+                    break
+                continue
+            audio += message
+            if len(audio) > config.stt_stream_max_bytes:
+                send("error", error="Recording too long")
+                return
+            if stream is not None:
+                try:
+                    stream.send(message)
+                except providers.ProviderError as e:
+                    log.warning("Live STT broke off: %s", e, extra={"session": session_id})
+                    stream.close()
+                    stream = None
+
+        # Step 1: the transcript is (almost) done by the time the button is released
+        started = time.perf_counter()
+        with admission.turn_deadline():
+            transcript = None
+            if stream is not None:
+                try:
+                    transcript = stream.finish()
+                except providers.ProviderError as e:
+                    log.warning("Live STT failed, falling back to batch: %s", e, extra={"session": session_id})
+                stream = None
+            if transcript is None:
+                transcript = transcribe_with_deepgram(bytes(audio), content_type)
+            send("transcript", transcript=transcript)
+            if not transcript:
+                send("error", error="Transcription failed - no speech detected")
+                return
+
+            payload = reply_to_transcript(session_id, case_study, transcript, async_audio)
+            if payload is None:
+                send("error", error="TTS failed")
+                return
+        send("reply", **payload)
+
+        duration = time.perf_counter() - started
+        metrics.observe("turn", duration)
+        log.info("Streamed-STT chat turn complete", extra={
+            "session": session_id, "case_study": case_study, "stage": "turn", "duration_ms": round(duration * 1000),
+        })
+
+    except (providers.CircuitOpenError, admission.Overloaded) as e:
+        log.warning("Vendor unavailable: %s", e)
+        send("error", error=str(e))
+
+    except admission.DeadlineExceeded as e:
+        log.warning("Streamed-STT chat turn ran out of time: %s", e, extra={"session": session_id})
+        send("error", error="The reply took too long, please try again")
+
+    except Exception as e:
+        log.exception("Streamed-STT chat turn failed", extra={"session": session_id})
+        send("error", error=str(e))
+
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+@bp.route('/api/audio/<session_id>', methods=['GET'])
 def get_audio(session_id):
-    """Serve the generated audio file"""
-    # Use absolute path to project root's audio_out directory
-    audio_path = audio_out_dir / f"reply_{session_id}.mp3"
-    print(f"[Audio] Request for session: {session_id}")
-    print(f"[Audio] Looking for file: {audio_path}")
-    print(f"[Audio] File exists: {audio_path.exists()}")
-    
-    if audio_path.exists():
-        print(f"[Audio] Serving file: {audio_path}")
-        print(f"[Audio] File size: {os.path.getsize(audio_path)} bytes")
+    """Serve the generated audio from the audio store, waiting for it if TTS is still running"""
+    status = tts_jobs.wait(session_id, config.audio_wait_seconds)
+    if status == FAILED:
+        return jsonify({"error": "TTS failed"}), 502
+    if status == PENDING:
+        return jsonify({"error": "Audio not ready yet"}), 503, {"Retry-After": "1"}
+    with metrics.timed("audio_serve"):
+        audio = audio_store.get(session_id)
+        if audio is None:
+            # Text-turn replies are only synthesized once someone asks to hear them
+            audio = synthesize_deferred(session_id) or None
         
-        # Send file with proper headers
-        response = send_file(
-            str(audio_path), 
-            mimetype='audio/mpeg',
-            as_attachment=False,
-            download_name=f'reply_{session_id}.mp3'
-        )
-        response.headers['Accept-Ranges'] = 'bytes'
-        response.headers['Cache-Control'] = 'no-cache'
-        return response
-    
-    print(f"[Audio] ERROR: File not found")
-    # List files in audio_out directory for debugging
-    if audio_out_dir.exists():
-        files = os.listdir(audio_out_dir)
-        print(f"[Audio] Files in audio_out: {files}")
+        if audio is not None:
+            # Send file with proper headers (BytesIO keeps Range requests working)
+            # MP3 from ElevenLabs, WAV if the offline fallback voiced it
+            mimetype, extension = audio_format(audio)
+            response = send_file(
+                io.BytesIO(audio),
+                mimetype=mimetype,
+                as_attachment=False,
+                download_name=f'reply_{session_id}.{extension}'
+            )
+            response.headers['Accept-Ranges'] = 'bytes'
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
     
+    log.info("Audio not found", extra={"audio_id": session_id})
+    metrics.record_error("audio_serve")
     return jsonify({"error": "Audio file not found"}), 404
 
 
-@app.route('/api/reset/<session_id>', methods=['POST'])
+@bp.route('/api/personas', methods=['GET'])
+def list_personas():
+    """Available personas with their prompt token counts and versions"""
+    return jsonify({**persona_registry.stats(), "personas": persona_registry.list()})
+
+
+@bp.route('/api/personas/reload', methods=['POST'])
+def reload_personas():
+    """Re-read personas/ now instead of waiting for the next reload check"""
+    try:
+        persona_registry.load()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(persona_registry.stats())
+
+
+@bp.route('/api/personas/<key>/greeting', methods=['POST'])
+def persona_greeting(key):
+    """Open a session with the persona's greeting; the audio comes from the warmed cache"""
+    persona = persona_registry.get(key)
+    session_id = request.form.get('session_id', 'default')
+    with sessions.conversation(session_id, lambda: persona.prompt) as conversation:
+        if len(conversation) == 1 and persona.greeting:
+            conversation.append({"role": "assistant", "content": persona.greeting})
+    return jsonify({
+        "text": persona.greeting,
+        "audio_url": f"/api/personas/{persona.key}/greeting.mp3?v={persona.version}" if persona.greeting else None,
+    })
+
+
+@bp.route('/api/personas/<key>/greeting.mp3', methods=['GET'])
+def persona_greeting_audio(key):
+    """Greeting audio for the persona's current version (synthesized now if not warmed yet)"""
+    persona = persona_registry.get(key)
+    with metrics.timed("audio_serve"):
+        audio = persona_registry.get_greeting_audio(
+            persona, synthesize_vendor_speech)
+    if not audio:
+        return jsonify({"error": "Greeting audio unavailable"}), 404
+    response = send_file(io.BytesIO(audio), mimetype='audio/mpeg', as_attachment=False,
+                         download_name=f'greeting_{persona.key}.mp3')
+    response.headers['Accept-Ranges'] = 'bytes'
+    # The URL carries the persona version, so a new greeting gets a new URL
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+@bp.route('/api/storage/stats', methods=['GET'])
+def storage_stats():
+    """Audio store usage and audio_out/ retention counters"""
+    return jsonify({
+        "audio_store": audio_store.stats(),
+        "audio_janitor": audio_janitor.stats(),
+    })
+
+
+@bp.route('/api/sessions/stats', methods=['GET'])
+def session_stats():
+    """Live sessions, memory held by conversation history, and summarization counters"""
+    return jsonify({**sessions.stats(), "context": context_budget.stats()})
+
+
+@bp.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latency histograms and request/error counters in Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.app_errorhandler(413)
+def upload_too_large(error):
+    """JSON error for uploads over MAX_UPLOAD_BYTES"""
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    log.warning("Rejected upload over %d bytes", limit)
+    return jsonify({"error": f"Upload too large (limit is {limit} bytes)"}), 413
+
+
+@bp.app_errorhandler(admission.Overloaded)
+def vendor_overloaded(error):
+    """503 with Retry-After for requests shed by a vendor's concurrency limit"""
+    log.warning("Shed request: %s", error, extra={"vendor": error.vendor})
+    return jsonify({"error": str(error)}), 503, {"Retry-After": str(error.retry_after)}
+
+
+@bp.app_errorhandler(admission.DeadlineExceeded)
+def turn_deadline_exceeded(error):
+    """504 for turns that ran past TURN_DEADLINE_SECONDS"""
+    log.warning("Turn ran out of time: %s", error)
+    metrics.record_error("turn")
+    return jsonify({"error": "The reply took too long, please try again"}), 504
+
+
+@bp.app_errorhandler(TurnInProgress)
+def turn_in_progress(error):
+    """409 with Retry-After for a retry whose original turn is still running"""
+    log.info("Retry gave up waiting for its turn")
+    return jsonify({"error": str(error)}), 409, {"Retry-After": str(error.retry_after)}
+
+
+@bp.after_app_request
+def count_request(response):
+    """Count every response by route template and status"""
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.record_request(route, response.status_code)
+    return response
+
+
+@bp.route('/api/reset/<session_id>', methods=['POST'])
 def reset_conversation(session_id):
     """Reset conversation history for a session"""
-    if session_id in conversations:
-        del conversations[session_id]
+    sessions.reset(session_id)
     return jsonify({"message": "Conversation reset"})
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
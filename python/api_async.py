@@ -0,0 +1,242 @@
+"""
+Asyncio (ASGI) variant of python/api.py.
+
+Serves the same routes with the same JSON contract, but every vendor call
+is awaited on pooled async clients, so a single process can keep hundreds
+of turns in flight instead of one per worker thread.
+
+Conversations go through the same bounded session store as api.py
+(session_store.py, or the database with SESSION_STORE=database), and
+vendor calls through the same admission limits, session turn rate and
+turn deadline (admission.py): a full vendor queue sheds the turn with 503,
+a turn past TURN_DEADLINE_SECONDS gets 504. The store is synchronous, so
+history is read and written on a worker thread, and the session's lock is
+never held across an await: concurrent turns on one session don't see
+each other's reply.
+
+Build the app with `create_app()`, as for api.py; importing this module
+has no side effects. The factory loads .env, checks the API keys and
+creates the stores; the audio janitor starts when the server starts
+serving. Run with any ASGI server, from the python/ directory:
+    hypercorn 'api_async:create_app()' --bind 0.0.0.0:8080
+    uvicorn --factory api_async:create_app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from quart import Blueprint, Quart, Response, current_app, request, jsonify
+from quart_cors import cors
+from werkzeug.exceptions import HTTPException
+
+import admission
+import providers
+from audio_codec import prepare_for_stt
+from audio_janitor import create_audio_janitor
+from audio_store import audio_format, create_audio_store
+from prompts import get_system_prompt
+from session_store import create_session_store
+from logging_setup import configure_logging
+
+log = logging.getLogger("api_async")
+
+project_root = Path(__file__).parent.parent
+env_path = project_root / '.env'
+
+bp = Blueprint("api_async", __name__)
+
+# Voice ID for ElevenLabs
+CHATBOT_VOICE_ID = "Xb7hH8MSUJpSbSDYk0k2"  # Alice
+
+# Set up by create_app(); the routes below use them
+audio_out_dir = project_root / "audio_out"
+audio_store = None  # reply audio between TTS and /api/audio/<id> (memory by default, see audio_store.py)
+audio_janitor = None  # deletes old reply files from audio_out/, started with the server
+sessions = None  # conversation history per session, bounded by idle TTL, LRU cap and history budget
+
+
+def create_app() -> Quart:
+    """Load .env, check the API keys and build the app (no threads or vendor clients yet)"""
+    global audio_store, audio_janitor, sessions
+    load_dotenv(dotenv_path=env_path)
+    configure_logging()
+
+    missing = [key for key in ("ELEVEN_API_KEY", "DEEPGRAM_API_KEY", "OPENAI_API_KEY") if not os.getenv(key)]
+    if missing:
+        raise RuntimeError(f"Missing API keys in .env file: {', '.join(missing)}")
+
+    app = cors(Quart(__name__))  # Enable CORS for frontend requests
+    # Reject oversized uploads from the Content-Length header, before reading the body
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_BYTES") or 10 * 1024 * 1024)
+    app.register_blueprint(bp)
+
+    audio_out_dir.mkdir(exist_ok=True)
+    audio_store = create_audio_store(audio_out_dir)
+    audio_janitor = create_audio_janitor(audio_out_dir)
+    sessions = create_session_store()
+    return app
+
+
+def normalize_content_type(content_type: str) -> str:
+    """Strip codec parameters from browser MIME types before sending to Deepgram"""
+    content_type = content_type or "audio/webm"
+    if 'webm' in content_type.lower():
+        return "audio/webm"
+    if 'mp4' in content_type.lower() or 'm4a' in content_type.lower():
+        return "audio/mp4"
+    return content_type.split(';')[0].strip().lower()
+
+
+def read_history(session_id: str, case_study: str) -> list:
+    """A copy of the session's messages (blocking; call through asyncio.to_thread)"""
+    with sessions.conversation(session_id, lambda: get_system_prompt(case_study)) as conversation:
+        return list(conversation)
+
+
+def record_exchange(session_id: str, case_study: str, user_text: str, reply: str):
+    """Append a finished turn to the session (blocking; call through asyncio.to_thread)"""
+    with sessions.conversation(session_id, lambda: get_system_prompt(case_study)) as conversation:
+        conversation.append({"role": "user", "content": user_text})
+        conversation.append({"role": "assistant", "content": reply})
+
+
+async def get_chatbot_reply(session_id: str, case_study: str, user_text: str) -> str:
+    """Get reply from OpenAI; the exchange is recorded once TTS has succeeded"""
+    history = await asyncio.to_thread(read_history, session_id, case_study)
+    completion = await providers.create_chat_completion_async(
+        history + [{"role": "user", "content": user_text}], max_tokens=256)
+    return completion.choices[0].message.content
+
+
+async def synthesize_with_elevenlabs(text: str, audio_id: str) -> str:
+    """Convert text to speech and keep it in the audio store"""
+    audio = await providers.synthesize_with_elevenlabs_async(text, CHATBOT_VOICE_ID)
+    if not audio:
+        return ""
+    # The disk backend blocks, so keep it off the event loop
+    await asyncio.to_thread(audio_store.put, audio_id, audio)
+    return audio_id
+
+
+@bp.before_app_serving
+async def startup():
+    audio_janitor.start()
+
+
+@bp.after_app_serving
+async def shutdown():
+    audio_janitor.stop()
+    await providers.close_async_clients()
+
+
+@bp.route('/api/chat', methods=['POST'])
+async def chat():
+    """Handle audio upload, transcription, LLM response, and TTS"""
+    try:
+        files = await request.files
+        form = await request.form
+
+        if 'audio' not in files:
+            return jsonify({"error": "No audio file provided"}), 400
+
+        audio_file = files['audio']
+        session_id = form.get('session_id', 'default')
+        case_study = form.get('case_study')
+
+        admission.admit()  # shed before any vendor work if a vendor's queue is already full
+        wait = admission.get_session_limiter().check(session_id)
+        if wait:
+            return jsonify({"error": "Too many turns, slow down"}), 429, {"Retry-After": str(math.ceil(wait))}
+
+        with admission.turn_deadline():
+            audio_bytes = audio_file.read()
+            content_type = normalize_content_type(audio_file.content_type)
+            # Decoding and encoding are CPU-bound, so keep them off the event loop
+            audio_bytes, content_type = await asyncio.to_thread(prepare_for_stt, audio_bytes, content_type)
+
+            transcript = await providers.transcribe_with_deepgram_async(audio_bytes, content_type)
+            if not transcript:
+                return jsonify({"error": "Transcription failed - no speech detected"}), 500
+
+            reply = await get_chatbot_reply(session_id, case_study, transcript)
+
+            audio_id = f"{session_id}_{int(time.time() * 1000)}"
+            if not await synthesize_with_elevenlabs(reply, audio_id):
+                return jsonify({"error": "TTS failed"}), 500
+        await asyncio.to_thread(record_exchange, session_id, case_study, transcript, reply)
+
+        return jsonify({
+            "transcript": transcript,
+            "reply": reply,
+            "audio_url": f"/api/audio/{audio_id}"
+        })
+
+    except providers.CircuitOpenError as e:
+        log.warning("Vendor unavailable: %s", e)
+        return jsonify({"error": str(e)}), 503
+
+    except (HTTPException, admission.Overloaded, admission.DeadlineExceeded):
+        raise  # e.g. 413 from MAX_CONTENT_LENGTH or a shed request, answered by its error handler
+
+    except Exception as e:
+        log.exception("Chat turn failed")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.app_errorhandler(413)
+async def upload_too_large(error):
+    """JSON error for uploads over MAX_UPLOAD_BYTES"""
+    return jsonify({"error": f"Upload too large (limit is {current_app.config['MAX_CONTENT_LENGTH']} bytes)"}), 413
+
+
+@bp.app_errorhandler(admission.Overloaded)
+async def vendor_overloaded(error):
+    """503 with Retry-After for requests shed by a vendor's concurrency limit"""
+    log.warning("Shed request: %s", error, extra={"vendor": error.vendor})
+    return jsonify({"error": str(error)}), 503, {"Retry-After": str(error.retry_after)}
+
+
+@bp.app_errorhandler(admission.DeadlineExceeded)
+async def turn_deadline_exceeded(error):
+    """504 for turns that ran past TURN_DEADLINE_SECONDS"""
+    log.warning("Turn ran out of time: %s", error)
+    return jsonify({"error": "The reply took too long, please try again"}), 504
+
+
+@bp.route('/api/audio/<session_id>', methods=['GET'])
+async def get_audio(session_id):
+    """Serve the generated audio from the audio store"""
+    audio = await asyncio.to_thread(audio_store.get, session_id)
+    if audio is None:
+        return jsonify({"error": "Audio file not found"}), 404
+
+    # A plain Response: send_file's filename keyword differs between Quart releases
+    mimetype, _ = audio_format(audio)
+    response = Response(audio, mimetype=mimetype)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = 'no-cache'
+    return await response.make_conditional(request, accept_ranges=True, complete_length=len(audio))
+
+
+@bp.route('/api/storage/stats', methods=['GET'])
+async def storage_stats():
+    """Audio store usage and audio_out/ retention counters"""
+    return jsonify({
+        "audio_store": audio_store.stats(),
+        "audio_janitor": audio_janitor.stats(),
+    })
+
+
+@bp.route('/api/reset/<session_id>', methods=['POST'])
+async def reset_conversation(session_id):
+    """Reset conversation history for a session"""
+    await asyncio.to_thread(sessions.reset, session_id)
+    return jsonify({"message": "Conversation reset"})
+
+
+if __name__ == '__main__':
+    create_app().run(host='0.0.0.0', port=8080)
@@ -0,0 +1,102 @@
+"""
+Shrink speech audio before it goes to Deepgram.
+
+Uncompressed uploads (WAV, and FLAC/Ogg at high sample rates) are
+decoded, downmixed to mono, resampled to 16 kHz and re-encoded with a
+compact codec. Deepgram's models run at 16 kHz anyway, so nothing is
+lost. An 8 s stereo 48 kHz capture (1.5 MB) becomes ~150 KB of FLAC or
+~27 KB of Opus (see bench_upload.py). Resampling plus FLAC takes ~40 ms
+there; Opus is ~6x smaller but ~0.5 s slower to encode, so it only pays
+off on uplinks slower than ~2 Mbps. Browser MediaRecorder
+uploads (webm/mp4) are already Opus/AAC and pass through untouched;
+main.js asks for 16 kHz mono at a speech bitrate instead.
+
+Configuration (environment variables):
+    STT_UPLOAD_CODEC  flac (default), opus, or none to send audio as recorded
+
+Needs the optional `soundfile` package (libsndfile); without it audio is
+sent as-is.
+"""
+import io
+import logging
+import os
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # optional: uploads are then sent to STT as recorded
+    soundfile = None
+
+log = logging.getLogger(__name__)
+
+TARGET_RATE = 16000
+
+# soundfile (format, subtype) and the Content-Type Deepgram expects for each codec
+CODECS = {
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+}
+
+# Uploads soundfile can decode, and that are worth re-encoding
+DECODABLE_TYPES = {"audio/wav", "audio/wave", "audio/x-wav", "audio/flac", "audio/x-flac", "audio/ogg"}
+
+
+def get_upload_codec() -> str:
+    codec = (os.getenv("STT_UPLOAD_CODEC") or "flac").lower()
+    return codec if codec in CODECS else "none"
+
+
+def lowpass_kernel(cutoff: float, taps: int = 63) -> np.ndarray:
+    """Hamming-windowed sinc low-pass; `cutoff` is a fraction of the sample rate"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+
+def to_mono_16k(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Downmix (frames, channels) float audio to mono and resample it to 16 kHz"""
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    if rate == TARGET_RATE:
+        return samples.astype(np.float32)
+    if rate > TARGET_RATE:
+        # Keep what's above the new Nyquist frequency from aliasing into the speech band
+        samples = np.convolve(samples, lowpass_kernel(0.45 * TARGET_RATE / rate), mode="same")
+    duration = len(samples) / rate
+    positions = np.arange(int(duration * TARGET_RATE)) * (rate / TARGET_RATE)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def encode_speech(samples: np.ndarray, rate: int, codec: str) -> tuple:
+    """Encode float or int16 audio as mono 16 kHz `codec`; returns (bytes, content_type)"""
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32) / 32768.0
+    mono = to_mono_16k(samples, rate)
+    file_format, subtype, content_type = CODECS[codec]
+    buffer = io.BytesIO()
+    soundfile.write(buffer, mono, TARGET_RATE, format=file_format, subtype=subtype)
+    return buffer.getvalue(), content_type
+
+
+def prepare_for_stt(audio_bytes: bytes, content_type: str) -> tuple:
+    """
+    Re-encode an upload as compact mono 16 kHz speech when that helps;
+    returns (bytes, content_type), unchanged if it doesn't or can't.
+    """
+    codec = get_upload_codec()
+    if soundfile is None or codec == "none" or content_type not in DECODABLE_TYPES:
+        return audio_bytes, content_type
+    try:
+        samples, rate = soundfile.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+        if content_type == CODECS[codec][2] and rate == TARGET_RATE and samples.shape[1] == 1:
+            return audio_bytes, content_type  # already what we'd produce
+        encoded, encoded_type = encode_speech(samples, rate, codec)
+    except (RuntimeError, ValueError, TypeError) as e:  # soundfile.LibsndfileError is a RuntimeError
+        log.warning("Could not re-encode %s upload, sending as-is: %s", content_type, e)
+        return audio_bytes, content_type
+
+    if len(encoded) >= len(audio_bytes):
+        return audio_bytes, content_type
+    log.debug("Re-encoded %d bytes of %s as %d bytes of %s", len(audio_bytes), content_type, len(encoded), encoded_type)
+    return encoded, encoded_type
@@ -0,0 +1,135 @@
+"""
+Background retention for reply audio files in audio_out/.
+
+A daemon thread sweeps the directory every AUDIO_SWEEP_INTERVAL_SECONDS.
+Files older than AUDIO_RETENTION_SECONDS are deleted, and if the rest
+still exceed AUDIO_QUOTA_BYTES the oldest are deleted until it fits.
+Only files this app writes (reply_*) are touched.
+"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_SECONDS = 60 * 60
+DEFAULT_QUOTA_BYTES = 500 * 1024 * 1024
+DEFAULT_INTERVAL_SECONDS = 60
+
+MANAGED_PREFIX = "reply_"
+
+
+class AudioJanitor:
+    def __init__(self, directory,
+                 max_age_seconds: float = DEFAULT_RETENTION_SECONDS,
+                 max_bytes: int = DEFAULT_QUOTA_BYTES,
+                 interval_seconds: float = DEFAULT_INTERVAL_SECONDS):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+
+        self.sweeps = 0
+        self.files_deleted = 0
+        self.bytes_reclaimed = 0
+        self.files_remaining = 0
+        self.bytes_remaining = 0
+        self.last_sweep_seconds = 0.0
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _delete(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False  # another worker's janitor got there first
+        return True
+
+    def sweep(self) -> dict:
+        """Run one retention pass; returns what it deleted"""
+        started = time.perf_counter()
+        now = time.time()
+
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(MANAGED_PREFIX) and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()  # oldest first
+
+        deleted = 0
+        reclaimed = 0
+        kept = []
+        for mtime, size, path in files:
+            if now - mtime > self.max_age_seconds:
+                if self._delete(path):
+                    deleted += 1
+                    reclaimed += size
+            else:
+                kept.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in kept)
+        while kept and total > self.max_bytes:
+            _, size, path = kept.pop(0)
+            total -= size
+            if self._delete(path):
+                deleted += 1
+                reclaimed += size
+
+        with self.lock:
+            self.sweeps += 1
+            self.files_deleted += deleted
+            self.bytes_reclaimed += reclaimed
+            self.files_remaining = len(kept)
+            self.bytes_remaining = total
+            self.last_sweep_seconds = time.perf_counter() - started
+
+        if deleted:
+            log.info("Deleted %d files, reclaimed %d bytes", deleted, reclaimed)
+        return {"deleted": deleted, "reclaimed_bytes": reclaimed}
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sweep()
+            except OSError as e:
+                log.warning("Sweep failed: %s", e)
+            self.stop_event.wait(self.interval_seconds)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="audio-janitor", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "sweeps": self.sweeps,
+                "files_deleted": self.files_deleted,
+                "bytes_reclaimed": self.bytes_reclaimed,
+                "files_remaining": self.files_remaining,
+                "bytes_remaining": self.bytes_remaining,
+                "last_sweep_seconds": round(self.last_sweep_seconds, 4),
+                "max_age_seconds": self.max_age_seconds,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def create_audio_janitor(directory) -> AudioJanitor:
+    """Janitor configured from AUDIO_RETENTION_SECONDS / AUDIO_QUOTA_BYTES / AUDIO_SWEEP_INTERVAL_SECONDS"""
+    return AudioJanitor(
+        directory,
+        max_age_seconds=float(os.getenv("AUDIO_RETENTION_SECONDS") or DEFAULT_RETENTION_SECONDS),
+        max_bytes=int(os.getenv("AUDIO_QUOTA_BYTES") or DEFAULT_QUOTA_BYTES),
+        interval_seconds=float(os.getenv("AUDIO_SWEEP_INTERVAL_SECONDS") or DEFAULT_INTERVAL_SECONDS),
+    )
@@ -0,0 +1,150 @@
+"""
+Where synthesized reply audio lives between TTS and /api/audio/<id>.
+
+    memory  (default) size-capped, TTL-expiring in-process store; a fresh
+            reply never touches disk
+    disk    reply_<id>.<ext> files under audio_out/, the original behaviour
+            (.mp3 from ElevenLabs, .wav/.aiff from the offline voices)
+
+Select with AUDIO_STORE=memory|disk. The memory backend is tuned with
+AUDIO_STORE_MAX_BYTES and AUDIO_STORE_TTL_SECONDS.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 15 * 60
+
+# Leading bytes of the formats the offline TTS engines write; anything else is ElevenLabs MP3
+AUDIO_FORMATS = [(b"RIFF", "audio/wav", "wav"), (b"FORM", "audio/aiff", "aiff")]
+MP3_FORMAT = ("audio/mpeg", "mp3")
+EXTENSIONS = [MP3_FORMAT[1]] + [extension for _, _, extension in AUDIO_FORMATS]
+
+
+def audio_format(audio: bytes) -> tuple:
+    """(MIME type, file extension) of synthesized audio"""
+    for magic, mimetype, extension in AUDIO_FORMATS:
+        if audio[:len(magic)] == magic:
+            return mimetype, extension
+    return MP3_FORMAT
+
+
+class MemoryAudioStore:
+    """Audio bytes in memory, expired after `ttl_seconds`, oldest evicted past `max_bytes`"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.items = OrderedDict()  # audio_id -> (data, expires_at), oldest first
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _drop(self, audio_id: str):
+        data, _ = self.items.pop(audio_id)
+        self.total_bytes -= len(data)
+
+    def _expire(self, now: float):
+        # Items are in insertion order and share one TTL, so expired ones are at the front
+        while self.items:
+            audio_id, (_, expires_at) = next(iter(self.items.items()))
+            if expires_at > now:
+                break
+            self._drop(audio_id)
+
+    def put(self, audio_id: str, data: bytes):
+        now = time.monotonic()
+        with self.lock:
+            if audio_id in self.items:
+                self._drop(audio_id)
+            self.items[audio_id] = (data, now + self.ttl_seconds)
+            self.total_bytes += len(data)
+            self._expire(now)
+            while self.total_bytes > self.max_bytes and len(self.items) > 1:
+                self._drop(next(iter(self.items)))
+                self.evictions += 1
+
+    def get(self, audio_id: str) -> bytes:
+        with self.lock:
+            item = self.items.get(audio_id)
+            if item is None:
+                return None
+            data, expires_at = item
+            if expires_at <= time.monotonic():
+                self._drop(audio_id)
+                return None
+            return data
+
+    def delete(self, audio_id: str):
+        with self.lock:
+            if audio_id in self.items:
+                self._drop(audio_id)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "backend": "memory",
+                "items": len(self.items),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class DiskAudioStore:
+    """reply_<id>.<ext> files in a directory, the extension matching the audio format"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, audio_id: str, extension: str = MP3_FORMAT[1]) -> Path:
+        return self.directory / f"reply_{audio_id}.{extension}"
+
+    def put(self, audio_id: str, data: bytes):
+        _, extension = audio_format(data)
+        path = self.path_for(audio_id, extension)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)  # readers never see a partial file
+        for other in EXTENSIONS:
+            if other != extension:
+                self._remove(self.path_for(audio_id, other))  # an earlier copy in another format
+
+    def get(self, audio_id: str) -> bytes:
+        for extension in EXTENSIONS:
+            try:
+                return self.path_for(audio_id, extension).read_bytes()
+            except FileNotFoundError:
+                continue
+        return None
+
+    def delete(self, audio_id: str):
+        for extension in EXTENSIONS:
+            self._remove(self.path_for(audio_id, extension))
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {"backend": "disk", "directory": str(self.directory)}
+
+
+def create_audio_store(disk_directory):
+    """Build the store selected by AUDIO_STORE"""
+    backend = os.getenv("AUDIO_STORE", "memory").lower()
+    if backend == "disk":
+        return DiskAudioStore(disk_directory)
+    if backend != "memory":
+        raise ValueError(f"Unknown AUDIO_STORE backend: {backend}")
+    return MemoryAudioStore(
+        max_bytes=int(os.getenv("AUDIO_STORE_MAX_BYTES") or DEFAULT_MAX_BYTES),
+        ttl_seconds=float(os.getenv("AUDIO_STORE_TTL_SECONDS") or DEFAULT_TTL_SECONDS),
+    )
@@ -0,0 +1,129 @@
+"""
+Compare STT upload formats: bytes on the wire, encode time, and latency.
+
+For each format the recording is encoded as it would be by
+audio_codec.prepare_for_stt. Upload time is modeled for a given uplink.
+With --live, each variant is also sent to Deepgram (or whatever
+DEEPGRAM_BASE_URL points at) to measure end-to-end STT latency.
+
+    python python/bench_upload.py                      # synthetic 8 s capture
+    python python/bench_upload.py --wav take.wav --uplink-kbps 2000 --live
+    python python/bench_upload.py --json bench_upload.json
+"""
+import argparse
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+import soundfile
+from dotenv import load_dotenv
+
+import providers
+from audio_codec import TARGET_RATE, encode_speech, to_mono_16k
+
+
+def synthetic_capture(seconds: float = 8.0, rate: int = 48000) -> np.ndarray:
+    """Speech-like stereo capture: voiced harmonics with syllable-rate envelope, plus room noise"""
+    rng = np.random.default_rng(7)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 25 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 25))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None) * (np.sin(2 * np.pi * 0.25 * t) > -0.6)
+    fricatives = rng.normal(0, 0.05, len(t)) * (np.sin(2 * np.pi * 1.3 * t) > 0.8)
+    mono = 0.2 * voiced * envelope + fricatives + rng.normal(0, 0.003, len(t))
+    return np.stack([mono, 0.9 * mono], axis=1).astype(np.float32)
+
+
+def wav_bytes(samples: np.ndarray, rate: int) -> bytes:
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def variants(samples: np.ndarray, rate: int) -> dict:
+    """name -> function returning (bytes, content_type)"""
+    return {
+        "wav (as captured)": lambda: (wav_bytes(samples, rate), "audio/wav"),
+        "wav 16k mono": lambda: (wav_bytes(to_mono_16k(samples, rate), TARGET_RATE), "audio/wav"),
+        "flac 16k mono": lambda: encode_speech(samples, rate, "flac"),
+        "opus 16k mono": lambda: encode_speech(samples, rate, "opus"),
+    }
+
+
+def median_ms(fn, repeat: int) -> tuple:
+    """(last result, median wall time in ms)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare STT upload formats")
+    parser.add_argument("--wav", help="recording to use instead of a synthetic 8 s capture")
+    parser.add_argument("--uplink-kbps", type=float, default=1000, help="modeled uplink bandwidth")
+    parser.add_argument("--rtt-ms", type=float, default=60, help="modeled round trip to the STT vendor")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="also time real STT requests")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.wav:
+        samples, rate = soundfile.read(args.wav, dtype="float32", always_2d=True)
+    else:
+        samples, rate = synthetic_capture(), 48000
+    duration = len(samples) / rate
+    print(f"Input: {duration:.1f} s, {rate} Hz, {samples.shape[1]} channel(s); "
+          f"uplink {args.uplink_kbps:.0f} kbps, RTT {args.rtt_ms:.0f} ms\n")
+
+    if args.live:
+        load_dotenv()
+
+    results = []
+    for name, encode in variants(samples, rate).items():
+        (audio, content_type), encode_ms = median_ms(encode, args.repeat)
+        upload_ms = len(audio) * 8 / args.uplink_kbps + args.rtt_ms
+        result = {
+            "format": name,
+            "content_type": content_type,
+            "bytes": len(audio),
+            "kbps": len(audio) * 8 / 1000 / duration,
+            "encode_ms": encode_ms,
+            "modeled_upload_ms": upload_ms,
+            "modeled_total_ms": encode_ms + upload_ms,
+        }
+        if args.live:
+            transcript, stt_ms = median_ms(lambda: providers.transcribe_with_deepgram(audio, content_type), args.repeat)
+            result["live_stt_ms"] = stt_ms
+            result["transcript"] = transcript
+        results.append(result)
+
+    header = f"{'format':<20}{'bytes':>10}{'kbps':>8}{'encode ms':>11}{'upload ms':>11}{'total ms':>10}"
+    if args.live:
+        header += f"{'live STT ms':>13}"
+    print(header)
+    for r in results:
+        row = (f"{r['format']:<20}{r['bytes']:>10}{r['kbps']:>8.0f}{r['encode_ms']:>11.0f}"
+               f"{r['modeled_upload_ms']:>11.0f}{r['modeled_total_ms']:>10.0f}")
+        if args.live:
+            row += f"{r['live_stt_ms']:>13.0f}"
+        print(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "input": {"seconds": duration, "rate": rate, "channels": samples.shape[1]},
+                "uplink_kbps": args.uplink_kbps,
+                "rtt_ms": args.rtt_ms,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 import os
 import time
 import wave
-import subprocess
-import requests
 import pyaudio
 from dotenv import load_dotenv
-from openai import OpenAI
+
+import metrics
+import providers
+from audio_codec import prepare_for_stt
+from playback import PCM_FORMAT, PCM_RATE, StreamPlayer
+from vad import Endpointer
+from logging_setup import configure_logging
+from context_budget import ContextManager, count_message_tokens, count_text_tokens
 
 # Load env vars
 
 load_dotenv()
+configure_logging()  # vendor and context logs; LOG_LEVEL=DEBUG for payloads
 
 ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
 DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
@@ -22,40 +28,46 @@ if not DEEPGRAM_API_KEY:
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY not set in .env")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 # Voice IDs from ElevenLabs account
 VOICE_PLAYER = "Xb7hH8MSUJpSbSDYk0k2"    # Alice
 CHATBOT_VOICE_ID = VOICE_PLAYER
 
 # Settings
-RECORD_SECONDS = 10                # speaking time per turn (was 5)
-COUNTDOWN_SECONDS = 3              # countdown before recording
+RECORD_SECONDS = 10                # longest utterance per turn
+SILENCE_SECONDS = 0.8              # pause that ends a turn
+START_TIMEOUT_SECONDS = 8          # give up on a round if nobody speaks
 TOKEN_LIMIT_PER_REPLY = 256        # max tokens per OpenAI reply
-MAX_HISTORY_MESSAGES = 12          # keep system + last N-1 messages
+CONTEXT_TOKEN_BUDGET = 1500        # prompt tokens per call; older turns get summarized
 TOTAL_CONVERSATION_TOKEN_LIMIT = 3000  # hard cap on total tokens used
+# Speaking over the reply stops it (CHATBOT_BARGE_IN=1); use headphones, or the reply itself can trigger it
+BARGE_IN = os.getenv("CHATBOT_BARGE_IN", "0").lower() in ("1", "true", "yes")
 
 os.makedirs("audio_out", exist_ok=True)
 
 
-# Mic recording with countdown
+# Mic recording with voice-activity endpointing
 
-def record_with_countdown(output_filename="audio_out/mic_input.wav",
-                          record_seconds=RECORD_SECONDS,
-                          rate=16000):
-    chunk = 1024
+def record_utterance(pa: pyaudio.PyAudio,
+                     player: StreamPlayer = None,
+                     output_filename="audio_out/mic_input.wav",
+                     max_seconds=RECORD_SECONDS,
+                     rate=16000):
+    """
+    Record from the mic until the speaker stops talking, and save the
+    utterance (leading/trailing silence trimmed) as a WAV file.
+    Returns the file path, or None if nobody spoke before the timeout.
+
+    The mic opens while `player` is still playing the previous reply, so
+    listening starts the moment it ends. With BARGE_IN, speech during
+    playback stops the reply and becomes the start of the utterance.
+    """
+    chunk = 480  # 30 ms, one VAD frame
     fmt = pyaudio.paInt16
     channels = 1
 
-    print("\n[Mic] Recording will start in:")
-    for i in range(COUNTDOWN_SECONDS, 0, -1):
-        print(f"  {i}...")
-        time.sleep(1)
+    endpointer = Endpointer(rate=rate, silence_seconds=SILENCE_SECONDS)
 
-    print(f"[Mic] Recording now for {record_seconds} seconds. Speak!")
-    p = pyaudio.PyAudio()
-
-    stream = p.open(
+    stream = pa.open(
         format=fmt,
         channels=channels,
         rate=rate,
@@ -63,22 +75,52 @@ def record_with_countdown(output_filename="audio_out/mic_input.wav",
         frames_per_buffer=chunk,
     )
 
-    frames = []
-    for _ in range(0, int(rate / chunk * record_seconds)):
-        data = stream.read(chunk)
-        frames.append(data)
-
-    print("[Mic] Done recording.\n")
+    if player is not None and player.playing:
+        # Mic is ready; keep its buffer drained until the reply ends or the user talks over it
+        while player.playing:
+            data = stream.read(chunk, exception_on_overflow=False)
+            if BARGE_IN:
+                endpointer.process(data)  # calibrated against the reply's bleed, so only louder speech counts
+                if endpointer.speech_started:
+                    print("[Mic] Barge-in, stopping the reply.")
+                    player.stop()
+                    break
+        if not endpointer.speech_started:
+            endpointer = Endpointer(rate=rate, silence_seconds=SILENCE_SECONDS)  # recalibrate in the quiet
+
+    if not endpointer.speech_started:
+        print("\n[Mic] Listening... start speaking when ready.")
+    started = time.perf_counter()
+    speech_at = None
+    with metrics.timed("record"):
+        while not endpointer.ended:
+            data = stream.read(chunk, exception_on_overflow=False)
+            if endpointer.process(data):
+                break
+            now = time.perf_counter()
+            if not endpointer.speech_started:
+                if now - started > START_TIMEOUT_SECONDS:
+                    break
+                continue
+            speech_at = speech_at or now
+            if now - speech_at > max_seconds:
+                print("[Mic] Reached the maximum utterance length.")
+                break
 
     stream.stop_stream()
     stream.close()
-    p.terminate()
+
+    audio = endpointer.audio()
+    if not audio:
+        print("[Mic] No speech detected.\n")
+        return None
+    print(f"[Mic] Done recording ({len(audio) / 2 / rate:.1f} s of speech).\n")
 
     wf = wave.open(output_filename, "wb")
     wf.setnchannels(channels)
-    wf.setsampwidth(p.get_sample_size(fmt))
+    wf.setsampwidth(pa.get_sample_size(fmt))
     wf.setframerate(rate)
-    wf.writeframes(b"".join(frames))
+    wf.writeframes(audio)
     wf.close()
 
     return output_filename
@@ -92,94 +134,36 @@ def transcribe_with_deepgram(audio_path: str) -> str:
     else:
         content_type = "audio/mp3"
 
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": content_type,
-    }
-
-    params = {
-        "model": "nova-2",
-        "smart_format": "true",
-        "punctuate": "true",
-        "keywords": "aquarium:2,donation:2,pledge:2,campaign:2,donor:2",
-    }
-
     with open(audio_path, "rb") as f:
         audio_bytes = f.read()
 
-    print("[STT] Sending audio to Deepgram...")
-    resp = requests.post(
-        "https://api.deepgram.com/v1/listen",
-        headers=headers,
-        params=params,
-        data=audio_bytes,
-    )
-
-    print(f"[STT] Status: {resp.status_code}")
-    if resp.status_code != 200:
-        print("[STT] Error body:", resp.text)
-        return ""
-
-    try:
-        data = resp.json()
-        transcript = data["results"]["channels"][0]["alternatives"][0]["transcript"]
-    except (KeyError, IndexError) as e:
-        print("[STT] Unexpected response structure:", e)
-        return ""
-
-    print("[STT] Transcript:", transcript)
-    return transcript.strip()
-
-
-# ElevenLabs TTS
+    # 16 kHz mono FLAC, or Opus on slow uplinks (STT_UPLOAD_CODEC=opus)
+    recorded_size = len(audio_bytes)
+    with metrics.timed("transcode"):
+        audio_bytes, content_type = prepare_for_stt(audio_bytes, content_type)
+    print(f"[STT] Uploading {len(audio_bytes) / 1024:.0f} KB {content_type} (recorded {recorded_size / 1024:.0f} KB)")
 
-def synthesize_with_elevenlabs(text: str,
-                               output_path="audio_out/bot_reply.mp3") -> str:
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{CHATBOT_VOICE_ID}"
-    headers = {
-        "xi-api-key": ELEVEN_API_KEY,
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "text": text,
-        "model_id": "eleven_multilingual_v2",
-        "voice_settings": {
-            "stability": 0.6,
-            "similarity_boost": 0.85,
-        },
-    }
-
-    print("[TTS] Requesting audio from ElevenLabs...")
-    resp = requests.post(url, headers=headers, json=payload)
-    print(f"[TTS] Status: {resp.status_code}")
+    return providers.transcribe_with_deepgram(
+        audio_bytes,
+        content_type,
+        keywords="aquarium:2,donation:2,pledge:2,campaign:2,donor:2",
+    )
 
-    if resp.status_code != 200:
-        print("[TTS] Error body:", resp.text)
-        return ""
 
-    with open(output_path, "wb") as f:
-        f.write(resp.content)
+# ElevenLabs TTS, played as it streams
 
-    print(f"[TTS] Saved reply audio to {output_path}")
-    return output_path
+def speak(pa: pyaudio.PyAudio, text: str, round_started: float) -> StreamPlayer:
+    """Start playing `text` in the donor's voice; returns at once with the playing StreamPlayer"""
+    player = StreamPlayer(pa, rate=PCM_RATE)
+    print("[Audio] Playing reply...")
+    player.play(providers.stream_speech(text, CHATBOT_VOICE_ID, PCM_FORMAT),
+                on_first_audio=lambda: metrics.observe("turn", time.perf_counter() - round_started))
+    return player
 
 
 # OpenAI Chatbot + token budgeting
 
-def trim_history(conversation):
-    """Keep system message + last N messages for context."""
-    if len(conversation) <= MAX_HISTORY_MESSAGES:
-        return conversation
-    system_msg = conversation[0]
-    recent = conversation[-(MAX_HISTORY_MESSAGES - 1):]
-    return [system_msg] + recent
-
-
-def estimate_tokens_from_text(text: str) -> int:
-    """Crude fallback estimate if usage is missing."""
-    # Very rough: assume ~1 token per word * 1.3
-    words = len(text.split())
-    return int(words * 1.3)
+context_budget = ContextManager(budget_tokens=CONTEXT_TOKEN_BUDGET)
 
 
 def get_chatbot_reply(conversation, user_text: str,
@@ -189,14 +173,11 @@ def get_chatbot_reply(conversation, user_text: str,
     return (reply, tokens_for_this_call, new_total_tokens).
     """
     conversation.append({"role": "user", "content": user_text})
-    conversation[:] = trim_history(conversation)
+    conversation[:] = context_budget.fit(conversation)
 
     print("[OpenAI] Generating chatbot reply...")
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=conversation,
-        max_tokens=TOKEN_LIMIT_PER_REPLY,
-    )
+    with metrics.timed("llm"):
+        completion = providers.create_chat_completion(conversation, max_tokens=TOKEN_LIMIT_PER_REPLY)
 
     reply = completion.choices[0].message.content
     conversation.append({"role": "assistant", "content": reply})
@@ -209,12 +190,12 @@ def get_chatbot_reply(conversation, user_text: str,
         print(f"[OpenAI] Tokens this call - prompt: {usage.prompt_tokens}, "
               f"completion: {usage.completion_tokens}, total: {usage.total_tokens}")
     else:
-        # Fallback estimate
-        tokens_this_call = estimate_tokens_from_text(user_text) + estimate_tokens_from_text(reply)
-        print(f"[OpenAI] Approximated tokens this call: {tokens_this_call}")
+        # Count locally with the model's tokenizer
+        tokens_this_call = count_message_tokens(conversation[:-1]) + count_text_tokens(reply)
+        print(f"[OpenAI] Counted tokens this call: {tokens_this_call}")
 
     new_total = tokens_used_so_far + tokens_this_call
-    print(f"[OpenAI] Total tokens used so far (approx): {new_total}")
+    print(f"[OpenAI] Total tokens used so far: {new_total}")
 
     print("[OpenAI] Reply:", reply)
     return reply, tokens_this_call, new_total
@@ -238,64 +219,78 @@ def main():
 
     print("=== Auto-Loop Voice Fundraising Chatbot ===")
     print("Flow each round:")
-    print(f"  - Countdown, then record ~{RECORD_SECONDS} seconds")
+    print(f"  - Record until you pause for {SILENCE_SECONDS} s (max {RECORD_SECONDS} s)")
     print("  - Transcribe with Deepgram")
     print("  - Get reply from OpenAI (with per-reply token limit)")
-    print("  - Speak reply with ElevenLabs")
+    print("  - Speak reply with ElevenLabs (the mic opens while it plays)")
+    if BARGE_IN:
+        print("  - Start talking during the reply to cut it off")
     print(f"Total conversation token budget: ~{TOTAL_CONVERSATION_TOKEN_LIMIT}")
     print("Say 'quit' / 'exit' / 'stop' in your audio to end.\n")
     print("Ctrl+C in the terminal will also stop it manually.\n")
 
-    round_num = 1
-    while True:
-        # Stop if token budget exhausted
-        if tokens_used_so_far >= TOTAL_CONVERSATION_TOKEN_LIMIT:
-            print("\n[Main] Total token budget reached. Ending conversation.")
-            break
-
-        print(f"\n=== Round {round_num} ===")
-
-        # 1) Record
-        audio_in = record_with_countdown()
+    pa = pyaudio.PyAudio()
+    player = None
+    try:
+        round_num = 1
+        while True:
+            # Stop if token budget exhausted
+            if tokens_used_so_far >= TOTAL_CONVERSATION_TOKEN_LIMIT:
+                print("\n[Main] Total token budget reached. Ending conversation.")
+                break
+
+            print(f"\n=== Round {round_num} ===")
+
+            # 1) Record
+            audio_in = record_utterance(pa, player)
+            round_started = time.perf_counter()
+            if not audio_in:
+                round_num += 1
+                continue
+
+            # 2) STT
+            user_text = transcribe_with_deepgram(audio_in)
+            if not user_text:
+                print("[Main] No transcript, skipping this round.")
+                round_num += 1
+                continue
+
+            print(f"\n[You]: {user_text}\n")
+
+            # Spoken quit
+            lower = user_text.lower()
+            if any(word in lower for word in ["quit", "exit", "stop"]):
+                print("[Main] Heard quit command. Exiting chatbot.")
+                break
+
+            # 3) OpenAI reply (update token usage)
+            bot_reply, tokens_this_call, tokens_used_so_far = get_chatbot_reply(
+                conversation, user_text, tokens_used_so_far
+            )
+
+            # If we blew past budget with this call, tell user and stop after TTS
+            budget_exceeded = tokens_used_so_far >= TOTAL_CONVERSATION_TOKEN_LIMIT
+
+            # 4) TTS, streamed to the speaker; the next round's recording overlaps its end
+            player = speak(pa, bot_reply, round_started)
+
+            if budget_exceeded:
+                player.wait()
+                print("\n[Main] Token budget reached after this reply. Ending conversation.")
+                break
 
-        # 2) STT
-        user_text = transcribe_with_deepgram(audio_in)
-        if not user_text:
-            print("[Main] No transcript, skipping this round.")
             round_num += 1
-            continue
-
-        print(f"\n[You]: {user_text}\n")
-
-        # Spoken quit
-        lower = user_text.lower()
-        if any(word in lower for word in ["quit", "exit", "stop"]):
-            print("[Main] Heard quit command. Exiting chatbot.")
-            break
-
-        # 3) OpenAI reply (update token usage)
-        bot_reply, tokens_this_call, tokens_used_so_far = get_chatbot_reply(
-            conversation, user_text, tokens_used_so_far
-        )
-
-        # If we blew past budget with this call, tell user and stop after TTS
-        budget_exceeded = tokens_used_so_far >= TOTAL_CONVERSATION_TOKEN_LIMIT
-
-        # 4) TTS
-        bot_audio = synthesize_with_elevenlabs(bot_reply)
-        if bot_audio:
-            print("[Audio] Playing reply...")
-            try:
-                subprocess.run(["afplay", bot_audio])
-            except FileNotFoundError:
-                print("[Audio] 'afplay' not found. On macOS it should be available by default.")
-
-        if budget_exceeded:
-            print("\n[Main] Token budget reached after this reply. Ending conversation.")
-            break
-
-        round_num += 1
+    finally:
+        if player is not None:
+            player.stop()  # e.g. Ctrl+C while a reply is playing
+            player.wait(1)
+        pa.terminate()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # Also printed after Ctrl+C
+        print("\n[Metrics] Stage latencies this session (ms):")
+        print(metrics.format_summary())
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+Token-accurate prompt budgeting for the OpenAI calls.
+
+Tokens are counted locally with tiktoken using the model's own encoding,
+loaded on first use. If it can't be loaded (not installed, or offline
+with a cold cache), counts are estimated at four characters per token.
+When a conversation goes over its budget, the oldest turns are folded
+into a compact running summary. That summary is kept as a second system
+message, so the prompt keeps the system prompt, the summary and as many
+recent turns as fit.
+
+Configuration (environment variables):
+    CONTEXT_TOKEN_BUDGET          prompt tokens allowed per call (default 2000)
+    CONTEXT_KEEP_RECENT_MESSAGES  newest messages never folded (default 4)
+    CONTEXT_SUMMARY_MAX_TOKENS    size of the running summary (default 150)
+"""
+import logging
+import os
+import threading
+
+import providers
+
+log = logging.getLogger(__name__)
+
+MODEL = "gpt-4o-mini"
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+
+# Chat format overhead per message and for priming the reply (OpenAI cookbook)
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+# After folding, fill only this share of the room left for turns, so we
+# don't have to summarize again on the very next turn
+FILL_RATIO = 0.75
+
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_KEEP_RECENT_MESSAGES = 4
+DEFAULT_SUMMARY_MAX_TOKENS = 150
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep a compact running summary of a fundraising practice conversation between a "
+    "trainee and a donor persona. Keep names, numbers, asks, commitments, the donor's concerns "
+    "and how engaged the donor is. Reply with the updated summary only, in plain prose."
+)
+
+# Rough chars-per-token ratio, only used if the tokenizer can't be loaded
+FALLBACK_CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    The model's tiktoken encoding, or None if it can't be loaded. tiktoken
+    downloads the BPE file on first use (cached under TIKTOKEN_CACHE_DIR),
+    so an offline node must not fail the turn over it.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken  # the encoding is loaded (and maybe downloaded) here, never at startup
+
+                    try:
+                        _encoding = tiktoken.encoding_for_model(MODEL)
+                    except KeyError:
+                        _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    log.warning("Tokenizer unavailable, estimating tokens from length: %s", e)
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_text_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return -(-len(text or "") // FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text or ""))
+
+
+def count_message_tokens(messages: list) -> int:
+    """Prompt tokens the chat completions API will bill for `messages`"""
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_text_tokens(message["role"]) + count_text_tokens(message.get("content"))
+    return total
+
+
+def is_summary(message: dict) -> bool:
+    return message["role"] == "system" and (message.get("content") or "").startswith(SUMMARY_PREFIX)
+
+
+def summarize_messages(previous_summary: str, messages: list, max_tokens: int) -> str:
+    """Fold `messages` into `previous_summary` with a small LLM call"""
+    turns = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{turns}"},
+    ]
+    completion = providers.create_chat_completion(prompt, max_tokens=max_tokens)
+    return completion.choices[0].message.content.strip()
+
+
+class ContextManager:
+    def __init__(self,
+                 budget_tokens: int = DEFAULT_TOKEN_BUDGET,
+                 keep_recent_messages: int = DEFAULT_KEEP_RECENT_MESSAGES,
+                 summary_max_tokens: int = DEFAULT_SUMMARY_MAX_TOKENS,
+                 summarizer=summarize_messages):
+        self.budget_tokens = budget_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer
+
+        self.lock = threading.Lock()
+        self.summaries = 0
+        self.folded_messages = 0
+        self.summary_failures = 0
+
+    def fit(self, messages: list) -> list:
+        """Return `messages` within the token budget, folding old turns into the summary"""
+        if count_message_tokens(messages) <= self.budget_tokens:
+            return messages
+
+        head = messages[:1]
+        has_summary = len(messages) > 1 and is_summary(messages[1])
+        old_summary = messages[1]["content"][len(SUMMARY_PREFIX):] if has_summary else ""
+        history = messages[2:] if has_summary else messages[1:]
+
+        # Room left for turns once the system prompt and a full-size summary are in
+        summary_allowance = TOKENS_PER_MESSAGE + count_text_tokens(SUMMARY_PREFIX) + self.summary_max_tokens
+        room = (self.budget_tokens - count_message_tokens(head) - summary_allowance) * FILL_RATIO
+
+        split = len(history)
+        used = 0
+        while split > 0:
+            cost = count_message_tokens([history[split - 1]]) - REPLY_PRIMING_TOKENS
+            kept_count = len(history) - split
+            if kept_count >= self.keep_recent_messages and used + cost > room:
+                break
+            used += cost
+            split -= 1
+        # Don't open the kept history with an assistant reply to a folded question
+        while split < len(history) - 1 and history[split]["role"] == "assistant":
+            split += 1
+
+        folded, kept = history[:split], history[split:]
+        if not folded:
+            return messages
+
+        try:
+            summary = self.summarizer(old_summary, folded, self.summary_max_tokens)
+            with self.lock:
+                self.summaries += 1
+                self.folded_messages += len(folded)
+            log.info("Folded %d messages into the running summary", len(folded))
+        except Exception as e:
+            # Better to lose the oldest turns than to fail the reply
+            log.warning("Summarization failed, dropping %d old messages: %s", len(folded), e)
+            summary = old_summary
+            with self.lock:
+                self.summary_failures += 1
+
+        summary_messages = [{"role": "system", "content": SUMMARY_PREFIX + summary}] if summary else []
+        return head + summary_messages + kept
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "budget_tokens": self.budget_tokens,
+                "summaries": self.summaries,
+                "folded_messages": self.folded_messages,
+                "summary_failures": self.summary_failures,
+            }
+
+
+def create_context_manager() -> ContextManager:
+    """Context manager configured from CONTEXT_* env vars"""
+    return ContextManager(
+        budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET),
+        keep_recent_messages=int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES") or DEFAULT_KEEP_RECENT_MESSAGES),
+        summary_max_tokens=int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS") or DEFAULT_SUMMARY_MAX_TOKENS),
+    )
@@ -0,0 +1,394 @@
+"""
+Database-backed conversation store, so any API worker can serve any session.
+
+The source of truth is the conversation_sessions / conversation_messages
+tables (models.py). Each worker keeps a read-through cache of the sessions
+it has served. On every turn it checks the session row with a single
+indexed query, and reloads only if another worker has appended since.
+New messages are queued and written behind in batches: one transaction
+every SESSION_DB_FLUSH_INTERVAL_SECONDS, or sooner once
+SESSION_DB_FLUSH_BATCH turns are waiting. The writer thread starts on
+the first write in each process, so a store created in a gunicorn
+--preload master still flushes in every forked worker. Queued turns are
+flushed once more at exit.
+
+Message seqs are taken from the session row when a batch is written
+(message_count is bumped in the same transaction), so two workers that
+both took a turn before either flushed append one after the other rather
+than colliding. A worker that finds the row ahead of its cache flushes
+its own queue before reloading, so nothing queued is lost. A write that
+fails goes back on the queue, and is given up (and logged) only after
+MAX_WRITE_ATTEMPTS flushes.
+
+Same interface as session_store.SessionStore. Enable with
+SESSION_STORE=database; works against SQLite
+(DATABASE_URL=sqlite:///pitch_simulator.db) as well as MySQL.
+"""
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy import and_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import contains_eager
+
+from session_store import message_bytes, trim_messages
+
+# database.py and models.py live at the project root
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from database import SessionLocal  # noqa: E402
+from models import ConversationMessage, ConversationSession  # noqa: E402
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 0.2
+DEFAULT_FLUSH_BATCH = 50
+MAX_WRITE_ATTEMPTS = 5
+
+
+class CachedSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages = []
+        # The row's message_count as of the last load, plus what this worker has written
+        # since with nobody else in between; a row ahead of this has turns we haven't seen
+        self.synced_count = 0
+        self.stale = True  # load from the database before use
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+
+
+def split_pinned(messages: list):
+    """(leading system messages, the rest)"""
+    pinned = 0
+    while pinned < len(messages) and messages[pinned]["role"] == "system":
+        pinned += 1
+    return messages[:pinned], messages[pinned:]
+
+
+class DatabaseSessionStore:
+    def __init__(self,
+                 session_factory=SessionLocal,
+                 max_sessions: int = 1000,
+                 idle_ttl_seconds: float = 3600,
+                 max_history_messages: int = 40,
+                 max_history_chars: int = 32000,
+                 flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 flush_batch: int = DEFAULT_FLUSH_BATCH):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_history_messages = max_history_messages
+        self.max_history_chars = max_history_chars
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_batch = flush_batch
+
+        self.cache = OrderedDict()  # session_id -> CachedSession, least recently used first
+        self.lock = threading.Lock()
+
+        self.pending = {}  # session_id -> merged write for the next flush
+        self.pending_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_wakeup = threading.Event()
+        self.stop_event = threading.Event()
+
+        self.cache_hits = 0
+        self.db_loads = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.flush_errors = 0
+
+        # Threads don't survive fork(), so the writer belongs to the process that started it
+        self.thread = None
+        self.writer_pid = None
+        self.writer_lock = threading.Lock()
+        atexit.register(self.close)
+
+    # Cache
+
+    def _get_cached(self, session_id: str) -> CachedSession:
+        now = time.monotonic()
+        with self.lock:
+            session = self.cache.get(session_id)
+            if session is None:
+                session = CachedSession(session_id)
+                self.cache[session_id] = session
+            else:
+                self.cache.move_to_end(session_id)
+            session.last_access = now
+            # The database keeps everything, so dropping cache entries is always safe
+            while self.cache:
+                oldest = next(iter(self.cache.values()))
+                if len(self.cache) <= self.max_sessions and now - oldest.last_access <= self.idle_ttl_seconds:
+                    break
+                self.cache.popitem(last=False)
+            return session
+
+    def _has_pending(self, session_id: str) -> bool:
+        with self.pending_lock:
+            return session_id in self.pending
+
+    def _refresh(self, session: CachedSession, system_prompt_factory):
+        """Bring a cached session up to date with the database (caller holds session.lock)"""
+        if not session.stale:
+            # One indexed lookup: has another worker appended or reset since?
+            db = self.session_factory()
+            try:
+                row = db.query(ConversationSession.message_count) \
+                    .filter(ConversationSession.session_id == session.session_id).one_or_none()
+            finally:
+                db.close()
+            if row is not None and row.message_count == session.synced_count:
+                with self.lock:
+                    self.cache_hits += 1
+                return
+            if row is None and self._has_pending(session.session_id):
+                return  # created here, not flushed yet
+
+        # Write out this worker's queued turns first (waiting for a batch already on its way),
+        # so the reload has them and nothing queued is reloaded over
+        self.flush()
+
+        db = self.session_factory()
+        try:
+            # One indexed query for the row plus its live window of messages
+            row = db.query(ConversationSession) \
+                .outerjoin(ConversationMessage, and_(
+                    ConversationMessage.session_pk == ConversationSession.id,
+                    ConversationMessage.seq >= ConversationSession.window_start_seq,
+                )) \
+                .options(contains_eager(ConversationSession.messages)) \
+                .filter(ConversationSession.session_id == session.session_id) \
+                .one_or_none()
+            with self.lock:
+                self.db_loads += 1
+        finally:
+            db.close()
+
+        if row is None:
+            session.messages = [{"role": "system", "content": system_prompt_factory()}]
+            session.synced_count = 0
+        else:
+            session.messages = [{"role": "system", "content": row.system_prompt}]
+            if row.summary:
+                session.messages.append({"role": "system", "content": row.summary})
+            session.messages += [{"role": m.role, "content": m.content} for m in row.messages]
+            session.synced_count = row.message_count
+        session.stale = False
+
+    @contextmanager
+    def conversation(self, session_id: str, system_prompt_factory):
+        """Hold the session's lock and yield its (trimmed) message list"""
+        session = self._get_cached(session_id)
+        with session.lock:
+            self._refresh(session, system_prompt_factory)
+            messages = session.messages
+            messages[:] = trim_messages(messages, self.max_history_messages, self.max_history_chars)
+
+            # Keep references to the messages we started with, so new ones can be told apart by identity
+            _, history = split_pinned(messages)
+            known = {id(message) for message in history}
+            try:
+                yield messages
+            finally:
+                messages[:] = trim_messages(messages, self.max_history_messages, self.max_history_chars)
+                self._record(session, messages, known)
+
+    def _record(self, session: CachedSession, messages: list, known: set):
+        """Queue the new messages for the database; their seqs are assigned when they're written"""
+        pinned, history = split_pinned(messages)
+        new_rows = [(message["role"], message["content"]) for message in history if id(message) not in known]
+        kept = len(history) - len(new_rows)  # loaded messages still in the window: the last `kept` before synced_count
+        session.size_bytes = message_bytes(messages)
+        session.last_access = time.monotonic()
+
+        write = {
+            "system_prompt": pinned[0]["content"],
+            "summary": pinned[1]["content"] if len(pinned) > 1 else None,
+            # Seq of the first message in the window; anything another worker appended since is after it
+            "window_start_seq": session.synced_count - kept,
+            "messages": new_rows,
+            "attempts": 0,
+        }
+        with self.pending_lock:
+            queued = self.pending.get(session.session_id)
+            if queued is not None:
+                write["messages"] = queued["messages"] + new_rows
+                write["attempts"] = queued["attempts"]
+            self.pending[session.session_id] = write
+            waiting = len(self.pending)
+        self._start_writer()
+        if waiting >= self.flush_batch:
+            self.flush_wakeup.set()
+
+    # Write-behind
+
+    def _start_writer(self):
+        """Start this process's writer thread on its first write"""
+        if self.writer_pid == os.getpid():
+            return
+        with self.writer_lock:
+            if self.writer_pid == os.getpid():
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._flush_loop, name="session-writer", daemon=True)
+            self.thread.start()
+            self.writer_pid = os.getpid()
+
+    def _flush_loop(self):
+        while not self.stop_event.is_set():
+            self.flush_wakeup.wait(self.flush_interval_seconds)
+            self.flush_wakeup.clear()
+            self.flush()
+
+    def _apply(self, db, writes: dict) -> dict:
+        """
+        Append each session's queued messages at the end of its row; returns
+        session_id -> (first seq written, message_count after)
+        """
+        appended = {}
+        for session_id, write in writes.items():
+            added = len(write["messages"])
+            # Bumping the count takes the row's write lock, so concurrent workers get consecutive seq ranges
+            bumped = db.query(ConversationSession) \
+                .filter(ConversationSession.session_id == session_id) \
+                .update({ConversationSession.message_count: ConversationSession.message_count + added},
+                        synchronize_session=False)
+            if bumped:
+                row = db.query(ConversationSession).filter(ConversationSession.session_id == session_id).one()
+            else:
+                row = ConversationSession(session_id=session_id, system_prompt=write["system_prompt"],
+                                          window_start_seq=0, message_count=added)
+                db.add(row)
+                db.flush()
+            first_seq = row.message_count - added
+            row.summary = write["summary"]
+            row.window_start_seq = max(0, min(write["window_start_seq"], first_seq))
+            db.add_all(
+                ConversationMessage(session_pk=row.id, seq=first_seq + offset, role=role, content=content)
+                for offset, (role, content) in enumerate(write["messages"])
+            )
+            appended[session_id] = (first_seq, row.message_count)
+        return appended
+
+    def flush(self):
+        """Write all queued turns; batches go in one transaction"""
+        with self.flush_lock:
+            with self.pending_lock:
+                writes, self.pending = self.pending, {}
+            if not writes:
+                return
+
+            db = self.session_factory()
+            try:
+                try:
+                    appended = self._apply(db, writes)
+                    db.commit()
+                    failed = {}
+                except SQLAlchemyError as e:
+                    # Fall back to one transaction per session so one conflict doesn't sink the batch
+                    db.rollback()
+                    log.warning("Batch write failed, retrying per session: %s", e)
+                    appended, failed = {}, {}
+                    for session_id, write in writes.items():
+                        try:
+                            appended.update(self._apply(db, {session_id: write}))
+                            db.commit()
+                        except SQLAlchemyError as e:
+                            db.rollback()
+                            failed[session_id] = write
+                            log.warning("Write failed, will retry: %s", e, extra={"session": session_id})
+            finally:
+                db.close()
+
+            dropped = self._requeue(failed)
+            with self.lock:
+                for session_id, (first_seq, count) in appended.items():
+                    session = self.cache.get(session_id)
+                    if session is None:
+                        continue
+                    if session.synced_count == first_seq:
+                        session.synced_count = count
+                    else:
+                        session.stale = True  # another worker appended in between; reload on next use
+                for session_id in failed:
+                    if session_id in self.cache:
+                        self.cache[session_id].stale = True
+                self.flushes += 1
+                self.flush_errors += dropped
+                self.flushed_messages += sum(len(writes[session_id]["messages"]) for session_id in appended)
+
+    def _requeue(self, failed: dict) -> int:
+        """Put failed writes back ahead of anything queued since; returns how many were given up on"""
+        dropped = 0
+        with self.pending_lock:
+            for session_id, write in failed.items():
+                write["attempts"] += 1
+                if write["attempts"] >= MAX_WRITE_ATTEMPTS:
+                    log.error("Gave up writing %d messages after %d attempts", len(write["messages"]),
+                              write["attempts"], extra={"session": session_id})
+                    dropped += 1
+                    continue
+                newer = self.pending.get(session_id)
+                if newer is not None:
+                    write = {**newer, "messages": write["messages"] + newer["messages"],
+                             "attempts": write["attempts"]}
+                self.pending[session_id] = write
+        return dropped
+
+    def close(self):
+        """Stop this process's writer and flush whatever is still queued"""
+        self.stop_event.set()
+        self.flush_wakeup.set()
+        if self.writer_pid == os.getpid() and self.thread is not None:
+            self.thread.join(timeout=5)
+        self.flush()
+
+    # Same interface as SessionStore
+
+    def reset(self, session_id: str):
+        # Hold the flush lock so an in-flight batch can't re-create the session afterwards
+        with self.flush_lock:
+            with self.pending_lock:
+                self.pending.pop(session_id, None)
+            with self.lock:
+                self.cache.pop(session_id, None)
+            db = self.session_factory()
+            try:
+                row = db.query(ConversationSession).filter(ConversationSession.session_id == session_id).one_or_none()
+                if row is not None:
+                    # Explicit, since SQLite only honours ON DELETE CASCADE with foreign_keys enabled
+                    db.query(ConversationMessage).filter(ConversationMessage.session_pk == row.id).delete()
+                    db.delete(row)
+                    db.commit()
+            finally:
+                db.close()
+
+    def stats(self) -> dict:
+        with self.pending_lock:
+            pending_messages = sum(len(write["messages"]) for write in self.pending.values())
+        with self.lock:
+            sessions = list(self.cache.values())
+            return {
+                "backend": "database",
+                "live_sessions": len(sessions),
+                "messages": sum(len(s.messages) for s in sessions),
+                "memory_bytes": sum(s.size_bytes for s in sessions),
+                "cache_hits": self.cache_hits,
+                "db_loads": self.db_loads,
+                "pending_messages": pending_messages,
+                "flushes": self.flushes,
+                "flushed_messages": self.flushed_messages,
+                "flush_errors": self.flush_errors,
+                "max_sessions": self.max_sessions,
+            }
@@ -0,0 +1,85 @@
+"""
+Local stand-in for Deepgram's streaming /v1/listen WebSocket.
+
+Speaks just enough of the protocol for stt_stream.DeepgramStream: every
+binary frame "recognizes" the next word of a fixed transcript and sends it
+as an interim result, every few words are confirmed with an is_final
+result, and {"type": "CloseStream"} flushes the rest and closes the socket.
+
+    python python/fake_stt_server.py --port 9001 --finalize-delay 0.05
+    DEEPGRAM_BASE_URL=http://localhost:9001 python python/api.py
+"""
+import argparse
+import json
+import logging
+import time
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+from logging_setup import configure_logging
+
+log = logging.getLogger("fake_stt_server")
+
+DEFAULT_TRANSCRIPT = "Hi, I'm calling from the aquarium about our new education campaign."
+WORDS_PER_FINAL = 4
+
+
+def results(words: list, is_final: bool) -> str:
+    return json.dumps({
+        "type": "Results",
+        "is_final": is_final,
+        "speech_final": is_final,
+        "channel": {"alternatives": [{"transcript": " ".join(words), "confidence": 0.99}]},
+    })
+
+
+def make_handler(transcript: str, finalize_delay: float):
+    words = transcript.split()
+
+    def handler(ws):
+        heard = 0  # words recognized so far
+        confirmed = 0  # words already sent in an is_final result
+        received = 0
+        try:
+            for message in ws:
+                if isinstance(message, bytes):
+                    received += len(message)
+                    if heard < len(words):
+                        heard += 1
+                        ws.send(results(words[confirmed:heard], is_final=False))
+                        if heard - confirmed >= WORDS_PER_FINAL:
+                            ws.send(results(words[confirmed:heard], is_final=True))
+                            confirmed = heard
+                    continue
+
+                if json.loads(message).get("type") == "CloseStream":
+                    time.sleep(finalize_delay)  # endpointing the last partial word
+                    if heard > confirmed:
+                        ws.send(results(words[confirmed:heard], is_final=True))
+                    ws.send(json.dumps({"type": "Metadata", "duration": 0}))
+                    break
+        except ConnectionClosed:
+            pass
+        log.info("Stream closed after %d bytes, %d words", received, heard)
+
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--transcript", default=DEFAULT_TRANSCRIPT)
+    parser.add_argument("--finalize-delay", type=float, default=0.05,
+                        help="seconds between CloseStream and the last final result")
+    args = parser.parse_args()
+
+    configure_logging()
+    with serve(make_handler(args.transcript, args.finalize_delay), args.host, args.port) as server:
+        log.info("Fake streaming STT listening on ws://%s:%d/v1/listen", args.host, args.port)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Local stand-ins for the Deepgram, OpenAI and ElevenLabs HTTP APIs.
+
+One threaded server answers all three, so the API can be load-tested
+without spending credits:
+
+    POST /v1/listen                    Deepgram pre-recorded transcription
+    POST /v1/chat/completions          OpenAI chat (JSON or streamed SSE)
+    POST /v1/text-to-speech/<voice>    ElevenLabs TTS (chunked MP3-like bytes)
+
+Each vendor has a base latency with lognormal jitter (so the tail is
+long, like the real thing), an error rate (answered with 503, which the
+providers retry) and a payload size. Replies are random words, so the
+TTS cache doesn't turn a load test into a cache benchmark.
+
+    python python/fake_vendors.py --port 9100 --llm-first-token-ms 350 --error-rate 0.01
+    DEEPGRAM_BASE_URL=http://localhost:9100 ELEVEN_BASE_URL=http://localhost:9100 \\
+        OPENAI_BASE_URL=http://localhost:9100/v1 python python/api.py
+
+loadtest.py starts this server (and the API) for you.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logging_setup import configure_logging
+
+log = logging.getLogger("fake_vendors")
+
+WORDS = ("the and our donors impact program students research budget conservation "
+         "partners grant community measure results funding outcomes year plan team").split()
+
+
+class VendorProfile:
+    """Latency, jitter, error rate and payload sizes for the fake vendors"""
+
+    def __init__(self,
+                 stt_ms: float = 300,
+                 stt_words: int = 20,
+                 llm_first_token_ms: float = 400,
+                 llm_token_ms: float = 15,
+                 llm_tokens: int = 60,
+                 tts_first_byte_ms: float = 250,
+                 tts_bytes: int = 48000,
+                 tts_stream_ms: float = 400,
+                 jitter: float = 0.25,
+                 error_rate: float = 0.0,
+                 seed: int = None):
+        self.stt_ms = stt_ms
+        self.stt_words = stt_words
+        self.llm_first_token_ms = llm_first_token_ms
+        self.llm_token_ms = llm_token_ms
+        self.llm_tokens = llm_tokens
+        self.tts_first_byte_ms = tts_first_byte_ms
+        self.tts_bytes = tts_bytes
+        self.tts_stream_ms = tts_stream_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def delay(self, ms: float):
+        """Sleep `ms` scaled by lognormal jitter (median `ms`)"""
+        if ms <= 0:
+            return
+        with self.lock:
+            factor = self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        time.sleep(ms * factor / 1000)
+
+    def fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def words(self, count: int) -> list:
+        with self.lock:
+            return [self.random.choice(WORDS) for _ in range(count)]
+
+
+def make_handler(profile: VendorProfile):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real vendors
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+        def send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if profile.fails():
+                self.send_json(503, {"error": "fake vendor overloaded"})
+            elif self.path.startswith("/v1/listen"):
+                self.listen(body)
+            elif self.path.startswith("/v1/chat/completions"):
+                self.chat(json.loads(body or b"{}"))
+            elif self.path.startswith("/v1/text-to-speech/"):
+                self.speak(json.loads(body or b"{}"))
+            else:
+                self.send_json(404, {"error": f"unknown path {self.path}"})
+
+        def listen(self, audio: bytes):
+            profile.delay(profile.stt_ms)
+            transcript = " ".join(profile.words(profile.stt_words)).capitalize() + "."
+            self.send_json(200, {"results": {"channels": [{"alternatives": [
+                {"transcript": transcript, "confidence": 0.98},
+            ]}]}})
+
+        def chat(self, request: dict):
+            tokens = profile.words(min(request.get("max_tokens") or profile.llm_tokens, profile.llm_tokens))
+            created = int(time.time())
+            profile.delay(profile.llm_first_token_ms)
+            if not request.get("stream"):
+                profile.delay(profile.llm_token_ms * len(tokens))
+                self.send_json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": created,
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": " ".join(tokens).capitalize() + "."}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                if i:
+                    profile.delay(profile.llm_token_ms)
+                text = (token.capitalize() if i == 0 else " " + token) + ("." if i == len(tokens) - 1 else "")
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                }
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+
+        def speak(self, request: dict):
+            profile.delay(profile.tts_first_byte_ms)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            audio = b"ID3" + os.urandom(max(profile.tts_bytes - 3, 0))
+            chunks = [audio[i:i + 8192] for i in range(0, len(audio), 8192)]
+            for i, chunk in enumerate(chunks):
+                if i:
+                    profile.delay(profile.tts_stream_ms / len(chunks))
+                self.write_chunk(chunk)
+            self.write_chunk(b"")
+
+    return Handler
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--stt-ms", type=float, default=300, help="Deepgram response time")
+    parser.add_argument("--stt-words", type=int, default=20, help="words per transcript")
+    parser.add_argument("--llm-first-token-ms", type=float, default=400)
+    parser.add_argument("--llm-token-ms", type=float, default=15, help="time between streamed tokens")
+    parser.add_argument("--llm-tokens", type=int, default=60, help="tokens per reply")
+    parser.add_argument("--tts-first-byte-ms", type=float, default=250)
+    parser.add_argument("--tts-bytes", type=int, default=48000, help="MP3 bytes per reply")
+    parser.add_argument("--tts-stream-ms", type=float, default=400, help="time to stream the rest of the audio")
+    parser.add_argument("--jitter", type=float, default=0.25, help="lognormal sigma applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of vendor calls answered with 503")
+    parser.add_argument("--seed", type=int, help="seed for jitter, errors and reply text")
+
+
+def profile_from_args(args) -> VendorProfile:
+    return VendorProfile(
+        stt_ms=args.stt_ms, stt_words=args.stt_words,
+        llm_first_token_ms=args.llm_first_token_ms, llm_token_ms=args.llm_token_ms, llm_tokens=args.llm_tokens,
+        tts_first_byte_ms=args.tts_first_byte_ms, tts_bytes=args.tts_bytes, tts_stream_ms=args.tts_stream_ms,
+        jitter=args.jitter, error_rate=args.error_rate, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    configure_logging()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(profile_from_args(args)))
+    server.daemon_threads = True
+    log.info("Fake Deepgram/OpenAI/ElevenLabs listening on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
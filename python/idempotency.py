@@ -0,0 +1,153 @@
+"""
+Idempotency keys for turns, so a retried request doesn't run twice.
+
+A client that times out waiting for /api/chat can't tell whether its
+turn ran. If it simply sends the audio again, Deepgram, OpenAI and
+ElevenLabs are paid twice, and the session's history gets a second copy
+of the same user/assistant pair. Instead the client sends an
+Idempotency-Key header (or idempotency_key field) that stays the same
+across retries of one turn:
+
+    record, replay = turn_results.claim(key, wait_seconds)
+    if replay is not None:
+        return jsonify(replay)          # the turn already ran
+    try:
+        payload = run_the_turn()
+    finally:
+        turn_results.finish(record, payload)
+
+The first request with a key runs the turn. A retry that arrives while
+it is still running waits for it (up to the turn deadline), and then
+gets the same transcript, reply and audio_url. A retry after it finished
+gets the stored result straight away. Only successful turns are kept.
+If the turn failed, the key is released and the retry runs it again (a
+waiting retry takes it over).
+
+Results live in this worker's memory for IDEMPOTENCY_TTL_SECONDS. With
+several workers, a retry only finds its turn when it reaches the same
+worker, e.g. with sticky sessions.
+
+Configuration (environment variables):
+    IDEMPOTENCY_TTL_SECONDS    how long a finished turn can be replayed (default 600)
+    IDEMPOTENCY_MAX_KEYS       turns remembered per worker, oldest dropped first (default 10000)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_KEYS = 10000
+MAX_KEY_LENGTH = 200
+
+
+class TurnInProgress(Exception):
+    """A retry waited as long as it may, and the original request is still running"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("This turn is still being processed, try again shortly")
+        self.retry_after = retry_after
+
+
+class TurnRecord:
+    """One key's turn; `done` is set when it succeeds (payload) or is released (payload None)"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.done = threading.Event()
+        self.payload = None
+        self.updated = time.monotonic()
+
+
+class TurnResults:
+    """Results of recent turns by idempotency key, and the turns still running"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_keys: int = DEFAULT_MAX_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self.records = OrderedDict()  # key -> TurnRecord, oldest first
+        self.lock = threading.Lock()
+        self.claimed = 0  # turns run under a key
+        self.replayed = 0  # retries answered with a stored result
+        self.waited = 0  # retries that waited for the original to finish
+        self.taken_over = 0  # retries that ran the turn after the original failed
+        self.in_progress = 0  # retries that gave up waiting
+        self.evictions = 0
+
+    def _expire(self):
+        """Drop finished turns older than the TTL, and the oldest ones beyond max_keys"""
+        now = time.monotonic()
+        while self.records:
+            key, record = next(iter(self.records.items()))
+            expired = record.done.is_set() and now - record.updated > self.ttl_seconds
+            if not expired and len(self.records) <= self.max_keys:
+                break
+            del self.records[key]
+            self.evictions += 1
+
+    def claim(self, key: str, wait_seconds: float) -> tuple:
+        """
+        (record, None) if this request should run the turn, or (None, payload) to
+        replay a finished one. Waits up to `wait_seconds` for a turn that is still
+        running, then raises TurnInProgress.
+        """
+        give_up = time.monotonic() + wait_seconds
+        waiting = taking_over = False
+        while True:
+            with self.lock:
+                self._expire()
+                record = self.records.get(key)
+                if record is None:
+                    record = self.records[key] = TurnRecord(key)
+                    self.claimed += 1
+                    self.taken_over += taking_over
+                    return record, None
+                if record.done.is_set():
+                    self.replayed += 1
+                    return None, record.payload
+                if not waiting:
+                    waiting = True
+                    self.waited += 1
+            left = give_up - time.monotonic()
+            if left <= 0 or not record.done.wait(left):
+                with self.lock:
+                    self.in_progress += 1
+                raise TurnInProgress()
+            taking_over = record.payload is None  # it failed and released the key; run it here
+            log.debug("Retry waited for its original turn (%s)", "failed" if taking_over else "done")
+
+    def finish(self, record: TurnRecord, payload: dict = None):
+        """Store a successful turn's payload for replays, or release the key if it failed (payload None)"""
+        with self.lock:
+            current = self.records.get(record.key) is record
+            if payload is not None:
+                record.payload = payload
+                record.updated = time.monotonic()
+                if current:
+                    self.records.move_to_end(record.key)
+            elif current:
+                del self.records[record.key]
+        record.done.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "keys": len(self.records),
+                "claimed": self.claimed,
+                "replayed": self.replayed,
+                "waited": self.waited,
+                "taken_over": self.taken_over,
+                "in_progress": self.in_progress,
+                "evictions": self.evictions,
+            }
+
+
+def create_turn_results() -> TurnResults:
+    """TurnResults configured from the environment"""
+    return TurnResults(
+        ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS") or DEFAULT_TTL_SECONDS),
+        max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS") or DEFAULT_MAX_KEYS),
+    )
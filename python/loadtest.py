@@ -0,0 +1,403 @@
+"""
+Load test for the Flask API against local fake vendors.
+
+Starts fake_vendors.py and the API (`flask run`, threaded) as separate
+processes pointed at each other, then runs `--concurrency` simulated
+users. Each user holds a session: it uploads a recording to /api/chat,
+fetches the reply's audio_url, and starts a new session every
+`--turns-per-session` turns.
+
+The report has client-side p50/p95/p99 for the chat request, the audio
+download and the whole turn, throughput, and the server's per-stage
+breakdown (the /api/metrics histograms, diffed over the run). Results are
+saved as JSON; `--compare` checks them against an earlier run and exits 1
+if p95 latency or throughput regressed by more than `--max-regression`.
+
+    python python/loadtest.py --concurrency 8 --duration 60 --out loadtest/baseline.json
+    python python/loadtest.py --concurrency 8 --duration 60 --compare loadtest/baseline.json
+    python python/loadtest.py --upload wav -- --error-rate 0.02 --llm-first-token-ms 800
+
+Arguments after `--` go to fake_vendors.py (latency, jitter, error rate,
+payload sizes; see `python python/fake_vendors.py --help`). With `--url`
+the test targets an API you started yourself and no processes are
+spawned; point that API at the fake vendors (or real ones) yourself.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from bench_upload import synthetic_capture, wav_bytes
+from audio_codec import encode_speech
+from fake_vendors import add_profile_arguments
+from metrics import BUCKETS, QUANTILES, Histogram
+
+HERE = Path(__file__).parent
+SCHEMA_VERSION = 1
+SERVER_LOG = Path(tempfile.gettempdir()) / "loadtest_servers.log"
+
+BUCKET_LINE = re.compile(r'^pitch_stage_duration_seconds_bucket\{stage="([^"]+)",le="([^"]+)"\} (\d+)$')
+SUM_LINE = re.compile(r'^pitch_stage_duration_seconds_sum\{stage="([^"]+)"\} ([0-9.e+-]+)$')
+ERROR_LINE = re.compile(r'^pitch_stage_errors_total\{stage="([^"]+)"\} (\d+)$')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    """Poll `url` until anything answers; fail early if the process died"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[1]} exited with {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f} s")
+
+
+def start_stack(vendor_args: list, api_env: dict) -> tuple:
+    """Start fake vendors and the API, logging to SERVER_LOG; returns (api_url, [processes])"""
+    vendor_port, api_port = free_port(), free_port()
+    server_log = open(SERVER_LOG, "w")
+    vendors = subprocess.Popen(
+        [sys.executable, str(HERE / "fake_vendors.py"), "--port", str(vendor_port), *vendor_args],
+        cwd=HERE, stdout=server_log, stderr=subprocess.STDOUT,
+    )
+    wait_until_up(f"http://127.0.0.1:{vendor_port}/", vendors)
+
+    vendor_url = f"http://127.0.0.1:{vendor_port}"
+    env = {
+        **os.environ,
+        "DEEPGRAM_API_KEY": "loadtest", "OPENAI_API_KEY": "loadtest", "ELEVEN_API_KEY": "loadtest",
+        "DEEPGRAM_BASE_URL": vendor_url, "ELEVEN_BASE_URL": vendor_url, "OPENAI_BASE_URL": f"{vendor_url}/v1",
+        "TTS_CACHE_ENABLED": "0",
+        "LOG_LEVEL": "WARNING",
+        **api_env,
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "api", "run", "--port", str(api_port), "--with-threads"],
+        cwd=HERE, env=env, stdout=server_log, stderr=subprocess.STDOUT,
+    )
+    api_url = f"http://127.0.0.1:{api_port}"
+    try:
+        wait_until_up(f"{api_url}/api/metrics", api)
+    except RuntimeError:
+        vendors.terminate()
+        raise
+    return api_url, [api, vendors]
+
+
+def make_upload(kind: str) -> tuple:
+    """(bytes, content_type, filename) for an 8 s utterance as the browser or a WAV client would send it"""
+    samples, rate = synthetic_capture(), 48000
+    if kind == "wav":
+        return wav_bytes(samples, rate), "audio/wav", "recording.wav"
+    # MediaRecorder sends ~24 kbps Opus that the API passes straight through; Ogg
+    # Opus labelled as webm is the same size and takes the same path
+    audio, _ = encode_speech(samples, rate, "opus")
+    return audio, "audio/webm", "recording.webm"
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of `values`"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def latency_summary(values: list) -> dict:
+    summary = {f"p{round(q * 100)}": percentile(values, q) for q in QUANTILES}
+    summary["mean"] = sum(values) / len(values) if values else 0.0
+    summary["max"] = max(values, default=0.0)
+    summary["count"] = len(values)
+    return summary
+
+
+def scrape_stages(api_url: str) -> dict:
+    """stage -> {"buckets": [cumulative counts], "sum": seconds, "errors": count} from /api/metrics"""
+    stages = {}
+    text = requests.get(f"{api_url}/api/metrics", timeout=10).text
+    for line in text.splitlines():
+        if match := BUCKET_LINE.match(line):
+            stage, _, count = match.groups()
+            stages.setdefault(stage, {"buckets": [], "sum": 0.0, "errors": 0})["buckets"].append(int(count))
+        elif match := SUM_LINE.match(line):
+            stages[match.group(1)]["sum"] = float(match.group(2))
+        elif match := ERROR_LINE.match(line):
+            stages.setdefault(match.group(1), {"buckets": [], "sum": 0.0, "errors": 0})["errors"] = int(match.group(2))
+    return stages
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """Per-stage count, mean, p50/p95/p99 (ms) and errors for what happened between two scrapes"""
+    breakdown = {}
+    for stage, now in sorted(after.items()):
+        then = before.get(stage, {"buckets": [], "sum": 0.0, "errors": 0})
+        if not now["buckets"]:
+            continue
+        cumulative = [n - (then["buckets"][i] if i < len(then["buckets"]) else 0)
+                      for i, n in enumerate(now["buckets"])]
+        histogram = Histogram(BUCKETS)
+        histogram.counts = [c - (cumulative[i - 1] if i else 0) for i, c in enumerate(cumulative)]
+        histogram.count = cumulative[-1]
+        if not histogram.count:
+            continue
+        histogram.sum = now["sum"] - then["sum"]
+        breakdown[stage] = {
+            "count": histogram.count,
+            "mean_ms": histogram.sum / histogram.count * 1000,
+            **{f"p{round(q * 100)}_ms": histogram.quantile(q) * 1000 for q in QUANTILES},
+            "errors": now["errors"] - then["errors"],
+        }
+    return breakdown
+
+
+class User(threading.Thread):
+    """One simulated user: chat turns back to back on its own session"""
+
+    def __init__(self, index: int, api_url: str, upload: tuple, args, deadline: float, results: list, lock):
+        super().__init__(name=f"user-{index}", daemon=True)
+        self.index = index
+        self.api_url = api_url
+        self.upload = upload
+        self.args = args
+        self.deadline = deadline
+        self.results = results
+        self.lock = lock
+        self.http = requests.Session()
+
+    def turn(self, session_id: str) -> dict:
+        audio, content_type, filename = self.upload
+        result = {"ok": False}
+        started = time.perf_counter()
+        try:
+            resp = self.http.post(
+                f"{self.api_url}/api/chat",
+                files={"audio": (filename, audio, content_type)},
+                data={"session_id": session_id, "case_study": self.args.case_study},
+                timeout=self.args.timeout,
+            )
+            result["chat_s"] = time.perf_counter() - started
+            result["status"] = resp.status_code
+            if resp.status_code != 200:
+                result["error"] = resp.json().get("error", resp.text[:200]) if resp.content else str(resp.status_code)
+                return result
+
+            audio_started = time.perf_counter()
+            reply_audio = self.http.get(f"{self.api_url}{resp.json()['audio_url']}", timeout=self.args.timeout)
+            result["audio_s"] = time.perf_counter() - audio_started
+            if reply_audio.status_code != 200:
+                result["status"] = reply_audio.status_code
+                result["error"] = "audio fetch failed"
+                return result
+            result["audio_bytes"] = len(reply_audio.content)
+            result["ok"] = True
+        except (requests.RequestException, ValueError) as e:
+            result["error"] = type(e).__name__
+        finally:
+            result["turn_s"] = time.perf_counter() - started
+        return result
+
+    def run(self):
+        session = 0
+        while time.monotonic() < self.deadline:
+            session_id = f"loadtest_{self.index}_{session}"
+            for _ in range(self.args.turns_per_session):
+                if time.monotonic() >= self.deadline:
+                    break
+                result = self.turn(session_id)
+                with self.lock:
+                    self.results.append(result)
+                if self.args.think_ms:
+                    time.sleep(self.args.think_ms / 1000)
+            self.http.post(f"{self.api_url}/api/reset/{session_id}", timeout=self.args.timeout)
+            session += 1
+
+
+def run_load(api_url: str, upload: tuple, args) -> tuple:
+    """Warm up, then run the users for --duration seconds; returns (results, elapsed, stages)"""
+    warmup = User(-1, api_url, upload, args, 0, [], threading.Lock())
+    for i in range(args.warmup_turns):
+        warmup.turn(f"loadtest_warmup_{i}")
+
+    before = scrape_stages(api_url)
+    results, lock = [], threading.Lock()
+    started = time.monotonic()
+    deadline = started + args.duration
+    users = [User(i, api_url, upload, args, deadline, results, lock) for i in range(args.concurrency)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+    return results, elapsed, stage_breakdown(before, scrape_stages(api_url))
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            key = f"{r.get('status', 'no response')}: {r.get('error', '')}"
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        "turns": len(results),
+        "ok": len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_turns_per_s": len(ok) / elapsed if elapsed else 0.0,
+        "chat_ms": latency_summary([r["chat_s"] * 1000 for r in ok]),
+        "audio_ms": latency_summary([r["audio_s"] * 1000 for r in ok]),
+        "turn_ms": latency_summary([r["turn_s"] * 1000 for r in ok]),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_report(report: dict):
+    client = report["client"]
+    print(f"\n{client['turns']} turns in {client['elapsed_s']:.1f} s "
+          f"({client['throughput_turns_per_s']:.2f} turns/s, {client['error_rate']:.1%} errors)")
+    for error, count in sorted(client["errors"].items(), key=lambda e: -e[1]):
+        print(f"  {count:>5} x {error}")
+
+    print(f"\n{'client':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'max ms':>9}")
+    for name in ("chat_ms", "audio_ms", "turn_ms"):
+        s = client[name]
+        print(f"{name[:-3]:<18}{s['p50']:>9.0f}{s['p95']:>9.0f}{s['p99']:>9.0f}{s['mean']:>9.0f}{s['max']:>9.0f}")
+
+    print(f"\n{'server stage':<18}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'errors':>8}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<18}{s['count']:>7}{s['p50_ms']:>9.0f}{s['p95_ms']:>9.0f}{s['p99_ms']:>9.0f}"
+              f"{s['mean_ms']:>9.0f}{s['errors']:>8}")
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Print the change from `baseline`; False if p95 latency or throughput regressed past the limit"""
+    print(f"\nCompared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('started_at', '?')}):")
+    if baseline.get("config") != report["config"]:
+        print("  note: the runs used different settings")
+    ok = True
+    rows = [("throughput turns/s", "throughput_turns_per_s", None, True)]
+    rows += [(f"{name[:-3]} p95 ms", name, "p95", False) for name in ("chat_ms", "audio_ms", "turn_ms")]
+    for label, key, field, higher_is_better in rows:
+        old = baseline["client"][key] if field is None else baseline["client"][key][field]
+        new = report["client"][key] if field is None else report["client"][key][field]
+        change = (new - old) / old if old else 0.0
+        regressed = -change > max_regression if higher_is_better else change > max_regression
+        ok = ok and not regressed
+        print(f"  {label:<20}{old:>10.1f} -> {new:>10.1f}  {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    for stage, s in report["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old and old["p95_ms"]:
+            print(f"  {stage + ' p95 ms':<20}{old['p95_ms']:>10.1f} -> {s['p95_ms']:>10.1f}  "
+                  f"{(s['p95_ms'] - old['p95_ms']) / old['p95_ms']:>+7.1%}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat against fake vendors",
+                                     usage="%(prog)s [options] [-- fake_vendors options]")
+    parser.add_argument("--url", help="API to test instead of starting one (with the fake vendors)")
+    parser.add_argument("--concurrency", type=int, default=4, help="simultaneous users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--turns-per-session", type=int, default=4)
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a user's turns")
+    parser.add_argument("--warmup-turns", type=int, default=2, help="turns before measuring")
+    parser.add_argument("--upload", choices=("browser", "wav"), default="browser",
+                        help="browser: 24 kbps Opus as MediaRecorder sends; wav: 48 kHz stereo (exercises transcoding)")
+    parser.add_argument("--case-study", default="template1")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--api-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the spawned API (repeatable)")
+    parser.add_argument("--out", help="save results as JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="allowed fractional p95/throughput regression for --compare")
+    argv = sys.argv[1:]
+    vendor_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    vendor_parser = argparse.ArgumentParser(prog="fake_vendors.py")
+    add_profile_arguments(vendor_parser)
+    vendor_profile = vars(vendor_parser.parse_args(vendor_args))
+    api_env = dict(item.split("=", 1) for item in args.api_env)
+
+    upload = make_upload(args.upload)
+    print(f"Upload: {len(upload[0])} bytes of {upload[1]}; {args.concurrency} users for {args.duration:.0f} s")
+    if not args.url:
+        print(f"Server output: {SERVER_LOG}")
+
+    processes = []
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    try:
+        if args.url:
+            api_url = args.url.rstrip("/")
+        else:
+            api_url, processes = start_stack(vendor_args, api_env)
+        results, elapsed, stages = run_load(api_url, upload, args)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "turns_per_session": args.turns_per_session,
+            "think_ms": args.think_ms,
+            "upload": args.upload,
+            "upload_bytes": len(upload[0]),
+            "case_study": args.case_study,
+            "api_env": api_env,
+            "vendors": None if args.url else vendor_profile,
+        },
+        "client": summarize(results, elapsed),
+        "stages": stages,
+    }
+    print_report(report)
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
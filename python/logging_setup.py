@@ -0,0 +1,128 @@
+"""
+Logging for the API servers and chatbot.py.
+
+Call `configure_logging()` once at startup, then log through module loggers:
+
+    log = logging.getLogger(__name__)
+    log.info("Turn complete", extra={"session": session_id, "stage": "turn", "duration_ms": 812})
+    log.debug("Transcript: %s", transcript)
+
+Records are put on an in-memory queue and written by a background
+listener thread, so request threads never wait on stdout. Forking
+(gunicorn --preload) drains the queue first, and both processes then
+run their own listener. Arguments are
+only formatted by the listener, and calls below the configured level
+return before building a record at all, so debug payload logging costs
+nothing when it's off.
+
+Configuration (environment variables):
+    LOG_LEVEL   DEBUG, INFO (default), WARNING or ERROR
+    LOG_FORMAT  text (default, "message key=value ...") or json (one object per line)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_lock = threading.Lock()
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """Structured fields passed with `extra=`"""
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class InProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record):
+        # The stock prepare() formats the message here to make the record
+        # picklable; the queue never leaves this process, so skip that work
+        return record
+
+
+def configure_logging():
+    """Route all logging through a queue to stdout; safe to call more than once"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        level = getattr(logging, (os.getenv("LOG_LEVEL") or "INFO").upper(), logging.INFO)
+        formatter = JsonFormatter() if (os.getenv("LOG_FORMAT") or "text").lower() == "json" else TextFormatter()
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(formatter)
+
+        records = queue.SimpleQueue()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(InProcessQueueHandler(records))
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)  # drain what's queued on exit
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _stop_before_fork():
+    """Drain the queue before forking, so no record is inherited (and written twice) by the child"""
+    _lock.acquire()
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    """Each side of the fork gets its own writer thread on the (now empty) queue"""
+    global _listener, _lock
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+    _lock.release()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_stop_before_fork,
+                        after_in_parent=_restart_after_fork,
+                        after_in_child=_restart_after_fork)
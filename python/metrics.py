@@ -0,0 +1,188 @@
+"""
+In-process latency and error metrics for the voice pipeline.
+
+Stages record their duration into per-stage histograms:
+
+    with metrics.timed("stt"):
+        transcript = transcribe(...)
+
+    metrics.observe("llm_first_token", seconds)
+
+An exception inside `timed()` also counts as an error for that stage.
+`render_prometheus()` produces the text exposition format served at
+/api/metrics, and `summary()` gives p50/p95/p99 per stage (chatbot.py
+prints it at the end of a session). Metrics are per process; with
+several workers, scrape each one or aggregate the histogram buckets.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds; covers ~5 ms disk reads up to slow 30 s vendor calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket (like histogram_quantile)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            in_bucket = self.counts[i]
+            if cumulative + in_bucket >= rank and in_bucket:
+                return lower + (bound - lower) * (rank - cumulative) / in_bucket
+            cumulative += in_bucket
+            lower = bound
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # stage -> Histogram
+        self.errors = {}  # stage -> count
+        self.requests = {}  # (route, status) -> count
+        self.gauges = {}  # name -> (help, callback returning {labels tuple: value})
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def record_error(self, stage: str):
+        with self.lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def record_request(self, route: str, status: int):
+        with self.lock:
+            key = (route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def register_gauge(self, name: str, help_text: str, callback):
+        """`callback()` returns a number, or a dict of {label value: number} for a `key` label"""
+        self.gauges[name] = (help_text, callback)
+
+    @contextmanager
+    def timed(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record_error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def summary(self) -> dict:
+        """{stage: {"count", "mean", "p50", "p95", "p99", "errors"}} in seconds"""
+        with self.lock:
+            stages = set(self.histograms) | set(self.errors)
+            result = {}
+            for stage in sorted(stages):
+                histogram = self.histograms.get(stage) or Histogram()
+                result[stage] = {
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    **{f"p{int(q * 100)}": histogram.quantile(q) for q in QUANTILES},
+                    "errors": self.errors.get(stage, 0),
+                }
+            return result
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            lines.append("# HELP pitch_stage_duration_seconds Duration of each pipeline stage")
+            lines.append("# TYPE pitch_stage_duration_seconds histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'pitch_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'pitch_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'pitch_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'pitch_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines.append("# HELP pitch_stage_duration_quantile_seconds Estimated p50/p95/p99 per stage")
+            lines.append("# TYPE pitch_stage_duration_quantile_seconds gauge")
+            for stage, histogram in sorted(self.histograms.items()):
+                for q in QUANTILES:
+                    lines.append(
+                        f'pitch_stage_duration_quantile_seconds{{stage="{stage}",quantile="{q}"}} '
+                        f'{histogram.quantile(q):.6f}'
+                    )
+
+            lines.append("# HELP pitch_stage_errors_total Failed calls per pipeline stage")
+            lines.append("# TYPE pitch_stage_errors_total counter")
+            for stage, count in sorted(self.errors.items()):
+                lines.append(f'pitch_stage_errors_total{{stage="{stage}"}} {count}')
+
+            lines.append("# HELP pitch_requests_total API requests by route and status")
+            lines.append("# TYPE pitch_requests_total counter")
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f'pitch_requests_total{{route="{route}",status="{status}"}} {count}')
+
+            gauges = list(self.gauges.items())
+
+        # Gauge callbacks take their own locks, so run them outside ours
+        for name, (help_text, callback) in sorted(gauges):
+            try:
+                value = callback()
+            except Exception as e:
+                log.warning("Gauge %s failed: %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'{name}{{key="{key}"}} {item}')
+            else:
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        """Human-readable per-stage table, in milliseconds"""
+        rows = [f"{'stage':<18}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}"]
+        for stage, s in self.summary().items():
+            rows.append(
+                f"{stage:<18}{s['count']:>7}{s['p50'] * 1000:>9.0f}{s['p95'] * 1000:>9.0f}"
+                f"{s['p99'] * 1000:>9.0f}{s['errors']:>8}"
+            )
+        return "\n".join(rows)
+
+
+# Process-wide registry used by api.py, providers.py and chatbot.py
+registry = Registry()
+observe = registry.observe
+record_error = registry.record_error
+record_request = registry.record_request
+register_gauge = registry.register_gauge
+timed = registry.timed
+summary = registry.summary
+render_prometheus = registry.render_prometheus
+format_summary = registry.format_summary
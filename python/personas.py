@@ -0,0 +1,257 @@
+"""
+Donor persona registry.
+
+Personas live in personas/<key>.json at the project root:
+
+    {
+      "name": "Dr. Jennifer Walker",
+      "greeting": "Hello. ... What does your organization do?",
+      "prompt": ["ROLE & BACKGROUND ...", "PERSONALITY & BEHAVIOR ...", ...]
+    }
+
+The prompt sections are joined with spaces into the system prompt. Each
+persona gets its token count and a version hash (of its file) when loaded.
+The registry as a whole gets a version too. Workers poll the directory at
+most every PERSONA_RELOAD_CHECK_SECONDS and pick up edits without a
+restart; a file that fails to parse keeps its previous version.
+
+Greeting audio is synthesized once per persona version and kept in
+memory (and in the TTS cache). With PERSONA_WARMUP=1 (default) it is
+generated in the background at startup, so a session's opening line is
+served instantly.
+
+Configuration (environment variables):
+    PERSONAS_DIR                   default <project root>/personas
+    PERSONA_DEFAULT                persona for unknown keys (default template1)
+    PERSONA_RELOAD_CHECK_SECONDS   0 disables hot reload (default 2)
+    PERSONA_WARMUP                 pre-generate greeting audio at startup (default 1)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from context_budget import count_text_tokens
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PERSONAS_DIR = Path(__file__).parent.parent / "personas"
+DEFAULT_PERSONA = "template1"
+DEFAULT_RELOAD_CHECK_SECONDS = 2
+# Unknown keys come from clients, so only a few recent (and truncated) ones are remembered
+MAX_UNKNOWN_KEYS = 100
+MAX_LOGGED_KEY_CHARS = 64
+
+
+class Persona:
+    def __init__(self, key: str, name: str, prompt: str, greeting: str, version: str):
+        self.key = key
+        self.name = name
+        self.prompt = prompt
+        self.greeting = greeting
+        self.version = version
+        self._token_count = None
+
+    @property
+    def token_count(self) -> int:
+        """Prompt size in tokens, counted on first use so loading personas never waits on the tokenizer"""
+        if self._token_count is None:
+            self._token_count = count_text_tokens(self.prompt)
+        return self._token_count
+
+    def info(self) -> dict:
+        return {
+            "key": self.key,
+            "name": self.name,
+            "greeting": self.greeting,
+            "version": self.version,
+            "prompt_tokens": self.token_count,
+        }
+
+
+def load_persona(path: Path) -> Persona:
+    raw = path.read_bytes()
+    data = json.loads(raw)
+    prompt = data["prompt"]
+    if isinstance(prompt, list):
+        prompt = " ".join(section.strip() for section in prompt)
+    return Persona(
+        key=path.stem,
+        name=data.get("name", path.stem),
+        prompt=prompt,
+        greeting=data.get("greeting", ""),
+        version=hashlib.sha256(raw).hexdigest()[:12],
+    )
+
+
+class PersonaRegistry:
+    def __init__(self,
+                 directory=DEFAULT_PERSONAS_DIR,
+                 default_key: str = DEFAULT_PERSONA,
+                 reload_check_seconds: float = DEFAULT_RELOAD_CHECK_SECONDS):
+        self.directory = Path(directory)
+        self.default_key = default_key
+        self.reload_check_seconds = reload_check_seconds
+
+        self.personas = {}  # key -> Persona; replaced wholesale on reload
+        self.version = ""
+        self.fingerprint = None
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.unknown_keys = OrderedDict()  # recently seen unknown keys, least recent first
+        self.unknown_lookups = 0
+        self.unknown_lock = threading.Lock()
+
+        self.greeting_audio = {}  # (key, version) -> MP3 bytes
+        self.greeting_lock = threading.Lock()
+        self.synthesize = None  # set by warm_up(); re-warms after a reload
+
+        self.load()
+
+    def _fingerprint(self) -> tuple:
+        return tuple(sorted(
+            (path.name, stat.st_mtime_ns, stat.st_size)
+            for path in self.directory.glob("*.json")
+            for stat in [path.stat()]
+        ))
+
+    def load(self):
+        """(Re)read every persona file"""
+        with self.lock:
+            fingerprint = self._fingerprint()
+            personas = {}
+            for path in sorted(self.directory.glob("*.json")):
+                try:
+                    personas[path.stem] = load_persona(path)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    previous = self.personas.get(path.stem)
+                    log.error("Could not load persona %s, %s: %s", path.name,
+                              "keeping the previous version" if previous else "skipping it", e)
+                    if previous:
+                        personas[path.stem] = previous
+            if self.default_key not in personas:
+                raise ValueError(f"Default persona {self.default_key!r} not found in {self.directory}")
+
+            changed = [key for key, persona in personas.items()
+                       if key not in self.personas or self.personas[key].version != persona.version]
+            self.personas = personas
+            self.version = hashlib.sha256(
+                "".join(f"{key}:{p.version};" for key, p in sorted(personas.items())).encode()
+            ).hexdigest()[:12]
+            self.fingerprint = fingerprint
+            self.last_check = time.monotonic()
+            self.loads += 1
+
+        log.info("Loaded %d personas (version %s)", len(personas), self.version,
+                 extra={"changed": ",".join(changed)})
+        if self.synthesize and changed and self.loads > 1:
+            self._start_warm_up(changed)
+
+    def maybe_reload(self):
+        """Reload if the directory changed; checks the file list at most every reload_check_seconds"""
+        if not self.reload_check_seconds or time.monotonic() - self.last_check < self.reload_check_seconds:
+            return
+        self.last_check = time.monotonic()
+        try:
+            if self._fingerprint() != self.fingerprint:
+                self.load()
+        except (OSError, ValueError) as e:
+            log.error("Persona reload failed, keeping version %s: %s", self.version, e)
+
+    def get(self, key: str) -> Persona:
+        """The persona for `key`, or the default persona (logged once per recently seen unknown key)"""
+        self.maybe_reload()
+        personas = self.personas
+        persona = personas.get(key) if key else None
+        if persona is None:
+            if key:
+                self._note_unknown(key[:MAX_LOGGED_KEY_CHARS])
+            persona = personas[self.default_key]
+        return persona
+
+    def _note_unknown(self, key: str):
+        with self.unknown_lock:
+            self.unknown_lookups += 1
+            if key in self.unknown_keys:
+                self.unknown_keys.move_to_end(key)
+                return
+            self.unknown_keys[key] = None
+            while len(self.unknown_keys) > MAX_UNKNOWN_KEYS:
+                self.unknown_keys.popitem(last=False)
+        log.warning("Unknown persona %r, using %r", key, self.default_key)
+
+    def list(self) -> list:
+        self.maybe_reload()
+        return [persona.info() for _, persona in sorted(self.personas.items())]
+
+    # Greeting audio
+
+    def get_greeting_audio(self, persona: Persona, synthesize) -> bytes:
+        """Greeting MP3 for this persona version, synthesized on first use; b"" on failure"""
+        cache_key = (persona.key, persona.version)
+        audio = self.greeting_audio.get(cache_key)
+        if audio is None and persona.greeting:
+            audio = synthesize(persona.greeting)
+            if audio:
+                with self.greeting_lock:
+                    # Drop audio for older versions of this persona
+                    for old in [k for k in self.greeting_audio if k[0] == persona.key]:
+                        del self.greeting_audio[old]
+                    self.greeting_audio[cache_key] = audio
+        return audio or b""
+
+    def _start_warm_up(self, keys):
+        def run():
+            started = time.perf_counter()
+            warmed = 0
+            for key in keys:
+                persona = self.personas.get(key)
+                try:
+                    if persona and self.get_greeting_audio(persona, self.synthesize):
+                        warmed += 1
+                except Exception as e:  # e.g. TTS shedding load; the greeting is made on first request instead
+                    log.warning("Could not warm the %s greeting: %s", key, e)
+            log.info("Warmed %d greetings in %.1f s", warmed, time.perf_counter() - started)
+
+        threading.Thread(target=run, name="persona-warmup", daemon=True).start()
+
+    def warm_up(self, synthesize):
+        """Generate every persona's greeting audio in the background (and again after reloads)"""
+        self.synthesize = synthesize
+        self._start_warm_up(list(self.personas))
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "personas": len(self.personas),
+            "loads": self.loads,
+            "greetings_cached": len(self.greeting_audio),
+            "unknown_lookups": self.unknown_lookups,
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> PersonaRegistry:
+    """Process-wide registry configured from PERSONAS_DIR / PERSONA_* env vars"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PersonaRegistry(
+                    directory=os.getenv("PERSONAS_DIR") or DEFAULT_PERSONAS_DIR,
+                    default_key=os.getenv("PERSONA_DEFAULT") or DEFAULT_PERSONA,
+                    reload_check_seconds=float(os.getenv("PERSONA_RELOAD_CHECK_SECONDS") or DEFAULT_RELOAD_CHECK_SECONDS),
+                )
+    return _registry
+
+
+def warm_up_enabled() -> bool:
+    return (os.getenv("PERSONA_WARMUP") or "1").lower() not in ("0", "false", "no")
@@ -0,0 +1,88 @@
+"""
+In-process, streamed playback of the donor's replies for chatbot.py.
+
+ElevenLabs is asked for raw 16-bit mono PCM (output_format=pcm_22050),
+so chunks can go straight to a PyAudio output stream as they arrive.
+Playback starts with the first chunk, with no MP3 decoder, no file on
+disk and no platform player (afplay). It runs on its own thread, so
+the next round's microphone can open while the reply is still playing.
+stop() cuts it short (barge-in).
+"""
+import logging
+import threading
+import time
+
+import pyaudio
+
+log = logging.getLogger(__name__)
+
+PCM_FORMAT = "pcm_22050"  # ElevenLabs output_format
+PCM_RATE = 22050
+WRITE_FRAMES = 1024  # ~46 ms per write, so stop() takes effect quickly
+
+
+class StreamPlayer:
+    """Plays an iterable of PCM chunks on a background thread"""
+
+    def __init__(self, pa: pyaudio.PyAudio, rate: int = PCM_RATE):
+        self.pa = pa
+        self.rate = rate
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+        self.thread = None
+        self.bytes_played = 0
+
+    @property
+    def playing(self) -> bool:
+        return self.thread is not None and not self.finished.is_set()
+
+    def play(self, chunks, on_first_audio=None):
+        """Start playing `chunks`; `on_first_audio()` is called when the first sound goes out"""
+        self.thread = threading.Thread(target=self._run, args=(chunks, on_first_audio), name="playback", daemon=True)
+        self.thread.start()
+
+    def _run(self, chunks, on_first_audio):
+        stream = None
+        pending = b""  # odd trailing byte of a chunk (samples are 2 bytes)
+        step = WRITE_FRAMES * 2
+        started = time.perf_counter()
+        try:
+            for chunk in chunks:
+                if self.stopped.is_set():
+                    break
+                if stream is None:
+                    stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True,
+                                          frames_per_buffer=WRITE_FRAMES)
+                    if on_first_audio:
+                        on_first_audio()
+                data = pending + chunk
+                whole = len(data) - len(data) % 2
+                pending = data[whole:]
+                for i in range(0, whole, step):
+                    if self.stopped.is_set():
+                        break
+                    stream.write(data[i:min(i + step, whole)])
+                    self.bytes_played += min(step, whole - i)
+        except Exception:
+            log.exception("Playback failed")
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()  # releases the TTS request if playback stopped early
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            if not self.bytes_played:
+                log.warning("No audio to play", extra={"stage": "tts"})
+            log.debug("Played %.1f s of audio in %.1f s", self.bytes_played / 2 / self.rate,
+                      time.perf_counter() - started)
+            self.finished.set()
+
+    def stop(self):
+        """Stop as soon as the current write finishes"""
+        self.stopped.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """True once playback has ended (or never started)"""
+        if self.thread is None:
+            return True
+        return self.finished.wait(timeout)
@@ -0,0 +1,7 @@
+"""Donor persona system prompts shared by the Flask and ASGI apps (loaded from personas/, see personas.py)"""
+from personas import get_registry
+
+
+def get_system_prompt(case_study: str) -> str:
+    """Get system prompt based on case study (the default persona for unknown keys)"""
+    return get_registry().get(case_study).prompt
@@ -0,0 +1,823 @@
+"""
+Shared vendor clients for Deepgram (STT), OpenAI (LLM) and ElevenLabs (TTS).
+
+python/api.py, python/api_async.py and python/chatbot.py go through
+this module so every
+call gets pooled keep-alive connections, per-stage timeouts, bounded
+retries on 429/5xx and a per-vendor circuit breaker. The *_async
+functions are the asyncio equivalents, built on httpx.AsyncClient and
+AsyncOpenAI, and share the same breakers, concurrency limits and turn
+deadline.
+
+Configuration (environment variables, read on first use):
+    DEEPGRAM_BASE_URL / OPENAI_BASE_URL / ELEVEN_BASE_URL
+        Point a vendor at a local stand-in server.
+    {STT,LLM,TTS}_CONNECT_TIMEOUT / {STT,LLM,TTS}_READ_TIMEOUT
+        Per-stage timeouts in seconds.
+    PROVIDER_MAX_RETRIES, PROVIDER_BACKOFF_BASE, PROVIDER_BACKOFF_MAX
+        Retry policy for 429/5xx and connection errors.
+    PROVIDER_POOL_SIZE
+        Keep-alive connections kept per vendor host.
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS
+        Consecutive failed calls (counted once per call, after its retries;
+        429s count neither way) before a vendor is short-circuited, and how
+        long before a single trial request is let through again.
+    TTS_CACHE_ENABLED, TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES
+        Content-addressed TTS cache (see tts_cache.py).
+
+Each vendor call also takes a slot from the vendor's concurrency limiter
+and, inside a turn, has its timeouts cut to the turn's remaining time
+(see admission.py for the limits and the deadline).
+
+Clients are created on first use and belong to the process that made
+them: a forked worker (gunicorn --preload) drops the parent's and builds
+its own, so no connection pool or lock is shared across a fork.
+
+STT and TTS vendor calls are timed into the `stt`, `tts_first_byte` and
+`tts` stages of metrics.py; failed calls count as errors for the stage.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:  # the openai package takes ~1 s to import; it's loaded with the first client
+    from openai import AsyncOpenAI, OpenAI
+
+import admission
+import metrics
+from tts_cache import cache_key, get_tts_cache
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_VOICE_ID = "Xb7hH8MSUJpSbSDYk0k2"  # Alice
+TTS_MODEL_ID = "eleven_multilingual_v2"
+TTS_VOICE_SETTINGS = {
+    "stability": 0.6,
+    "similarity_boost": 0.85,
+}
+
+
+class ProviderError(Exception):
+    """A vendor call failed after retries"""
+
+
+class CircuitOpenError(ProviderError):
+    """The vendor's circuit breaker is open; the call was not attempted"""
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class ProviderConfig:
+    """Vendor endpoints, timeouts and retry policy, read once from the environment"""
+
+    def __init__(self):
+        self.deepgram_base_url = os.getenv("DEEPGRAM_BASE_URL", "https://api.deepgram.com").rstrip("/")
+        self.eleven_base_url = os.getenv("ELEVEN_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+        self.openai_base_url = os.getenv("OPENAI_BASE_URL")  # None = OpenAI default
+
+        # (connect, read) per stage
+        self.stt_timeout = (_env_float("STT_CONNECT_TIMEOUT", 3.05), _env_float("STT_READ_TIMEOUT", 20))
+        self.llm_timeout = (_env_float("LLM_CONNECT_TIMEOUT", 3.05), _env_float("LLM_READ_TIMEOUT", 30))
+        self.tts_timeout = (_env_float("TTS_CONNECT_TIMEOUT", 3.05), _env_float("TTS_READ_TIMEOUT", 20))
+
+        self.max_retries = _env_int("PROVIDER_MAX_RETRIES", 2)
+        self.backoff_base = _env_float("PROVIDER_BACKOFF_BASE", 0.25)
+        self.backoff_max = _env_float("PROVIDER_BACKOFF_MAX", 2.0)
+        self.pool_size = _env_int("PROVIDER_POOL_SIZE", 20)
+
+        self.breaker_threshold = _env_int("BREAKER_FAILURE_THRESHOLD", 5)
+        self.breaker_reset_seconds = _env_float("BREAKER_RESET_SECONDS", 30)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    While open every call fails fast; after `reset_seconds` one trial call
+    is allowed through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release(self):
+        """An allowed call ended without an outcome from the vendor (shed, out of time, cancelled): free the trial"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    log.warning("Circuit opened after %d failures", self.failures, extra={"vendor": self.name})
+                self.opened_at = time.monotonic()
+
+
+_config = None
+_session = None
+_openai_client = None
+_async_http_client = None
+_async_openai_client = None
+_breakers = {}
+_init_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """In a forked child, forget the parent's clients and locks; they're rebuilt on first use"""
+    global _config, _session, _openai_client, _async_http_client, _async_openai_client, _breakers, _init_lock
+    _config = None
+    _session = None
+    _openai_client = None
+    _async_http_client = None
+    _async_openai_client = None
+    _breakers = {}
+    _init_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_config() -> ProviderConfig:
+    global _config
+    if _config is None:
+        _config = ProviderConfig()
+    return _config
+
+
+def get_breaker(vendor: str) -> CircuitBreaker:
+    breaker = _breakers.get(vendor)
+    if breaker is None:
+        with _init_lock:
+            breaker = _breakers.get(vendor)
+            if breaker is None:
+                config = get_config()
+                breaker = CircuitBreaker(vendor, config.breaker_threshold, config.breaker_reset_seconds)
+                _breakers[vendor] = breaker
+    return breaker
+
+
+def get_session() -> requests.Session:
+    """Process-wide requests session with keep-alive pools for Deepgram and ElevenLabs"""
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                pool_size = get_config().pool_size
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_openai_client() -> "OpenAI":
+    """Process-wide OpenAI client on a pooled httpx transport"""
+    global _openai_client
+    if _openai_client is None:
+        with _init_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                config = get_config()
+                connect, read = config.llm_timeout
+                _openai_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=config.openai_base_url,
+                    max_retries=config.max_retries,
+                    timeout=httpx.Timeout(read, connect=connect),
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=config.pool_size,
+                            max_keepalive_connections=config.pool_size,
+                        ),
+                    ),
+                )
+    return _openai_client
+
+
+def backoff_delay(attempt: int, retry_after: str = None) -> float:
+    """Exponential backoff with full jitter, capped; honours a numeric Retry-After"""
+    config = get_config()
+    if retry_after:
+        try:
+            return min(float(retry_after), config.backoff_max)
+        except ValueError:
+            pass
+    return random.uniform(0, min(config.backoff_max, config.backoff_base * (2 ** attempt)))
+
+
+def post_with_retries(vendor: str, url: str, timeout, **kwargs) -> requests.Response:
+    """
+    POST through the shared session with retries and the vendor's breaker.
+
+    Returns the final response (which may still be a non-200); raises
+    ProviderError if the vendor could not be reached at all.
+    """
+    config = get_config()
+    breaker = get_breaker(vendor)
+    session = get_session()
+
+    request_timeout = admission.cap_timeout(timeout)  # before allow(), so running out of time never takes the trial
+    if not breaker.allow():
+        raise CircuitOpenError(f"{vendor} circuit is open")
+
+    # The breaker gets one outcome per call, from its last attempt, so the retries
+    # inside one slow call don't add up to an open circuit
+    error = None
+    try:
+        for attempt in range(config.max_retries + 1):
+            if attempt:
+                request_timeout = admission.cap_timeout(timeout)
+            try:
+                resp = session.post(url, timeout=request_timeout, **kwargs)
+            except requests.RequestException as e:
+                admission.check_deadline()  # a timeout cut short by the turn's deadline isn't worth retrying
+                if attempt < config.max_retries:
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                error = e
+                break
+
+            if resp.status_code in RETRY_STATUSES and attempt < config.max_retries:
+                delay = backoff_delay(attempt, resp.headers.get("Retry-After"))
+                resp.close()
+                time.sleep(delay)
+                continue
+            break
+    except BaseException:
+        breaker.release()
+        raise
+
+    if error is not None:
+        breaker.record_failure()
+        raise ProviderError(f"{vendor} request failed: {error}") from error
+    record_outcome(breaker, resp.status_code)
+    return resp
+
+
+def record_outcome(breaker: CircuitBreaker, status_code: int):
+    """Settle the breaker from a call's final status; a 429 says nothing about the vendor's health"""
+    if status_code == 429:
+        breaker.release()
+    elif status_code in RETRY_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+# Deepgram STT
+
+def transcribe_with_deepgram(audio_bytes: bytes, content_type: str, keywords: str = None) -> str:
+    """Transcribe audio using Deepgram API; returns "" on failure"""
+    config = get_config()
+    headers = {
+        "Authorization": f"Token {os.getenv('DEEPGRAM_API_KEY')}",
+        "Content-Type": content_type,
+    }
+
+    params = {
+        "model": "nova-2",
+        "smart_format": "true",
+        "punctuate": "true",
+    }
+    if keywords:
+        params["keywords"] = keywords
+
+    log.debug("Sending %d bytes to Deepgram", len(audio_bytes))
+    limiter = admission.get_limiter("deepgram")
+    acquired = limiter.acquire()
+    started = time.perf_counter()
+    try:
+        resp = post_with_retries(
+            "deepgram",
+            f"{config.deepgram_base_url}/v1/listen",
+            config.stt_timeout,
+            headers=headers,
+            params=params,
+            data=audio_bytes,
+        )
+    except ProviderError as e:
+        log.warning("STT request failed: %s", e, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+    finally:
+        limiter.release(acquired)
+        metrics.observe("stt", time.perf_counter() - started)
+
+    if resp.status_code != 200:
+        log.warning("STT returned %d: %s", resp.status_code, resp.text, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+
+    try:
+        data = resp.json()
+        transcript = data["results"]["channels"][0]["alternatives"][0]["transcript"]
+        log.debug("Transcript: %s", transcript)
+        return transcript.strip()
+    except (KeyError, IndexError) as e:
+        log.warning("Could not parse STT response: %s", e, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+
+
+# OpenAI LLM
+
+def create_chat_completion(messages: list, max_tokens: int, stream: bool = False, model: str = "gpt-4o-mini"):
+    """
+    chat.completions.create through the pooled client, the OpenAI breaker and
+    the OpenAI concurrency limit. A streamed completion keeps its slot until
+    it has been read to the end (or closed).
+    """
+    breaker = get_breaker("openai")
+    if breaker.state == "open":
+        raise CircuitOpenError("openai circuit is open")  # fail fast, without queueing for a slot
+    limiter = admission.get_limiter("openai")
+    acquired = limiter.acquire()
+    try:
+        options = {}
+        if admission.remaining() is not None:
+            connect, read = admission.cap_timeout(get_config().llm_timeout)
+            options["timeout"] = httpx.Timeout(read, connect=connect)
+        # Only now, with a slot and time left, may this call be the half-open trial
+        if not breaker.allow():
+            raise CircuitOpenError("openai circuit is open")
+        try:
+            completion = get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=stream,
+                **options,
+            )
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                breaker.release()  # rate limited (after the SDK's own retries), not down
+            else:
+                breaker.record_failure()
+            admission.check_deadline()  # a timeout cut short by the deadline is the deadline's error
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+    except BaseException:
+        limiter.release(acquired)
+        raise
+    breaker.record_success()
+    if stream:
+        return HeldStream(completion, lambda: limiter.release(acquired))
+    limiter.release(acquired)
+    return completion
+
+
+class HeldStream:
+    """
+    A streamed completion that holds a vendor slot until it is exhausted,
+    closed or garbage-collected; iterating past the turn's deadline raises
+    admission.DeadlineExceeded.
+    """
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                admission.check_deadline()
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+            if hasattr(self.stream, "close"):
+                self.stream.close()
+
+    def __del__(self):
+        self.close()
+
+
+# ElevenLabs TTS
+
+def request_elevenlabs_audio(text: str, voice_id: str = DEFAULT_VOICE_ID, output_format: str = None):
+    """
+    Start a streaming ElevenLabs request; returns the open response or None.
+    The caller iterates `resp.iter_content()` and must close the response.
+    `output_format` (e.g. "pcm_22050") overrides the default MP3.
+    """
+    config = get_config()
+    url = f"{config.eleven_base_url}/v1/text-to-speech/{voice_id}"
+    headers = {
+        "xi-api-key": os.getenv("ELEVEN_API_KEY"),
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "text": text,
+        "model_id": TTS_MODEL_ID,
+        "voice_settings": TTS_VOICE_SETTINGS,
+    }
+
+    log.debug("Requesting %d chars of audio from ElevenLabs", len(text))
+    try:
+        resp = post_with_retries("elevenlabs", url, config.tts_timeout, headers=headers, json=payload, stream=True,
+                                 params={"output_format": output_format} if output_format else None)
+    except ProviderError as e:
+        log.warning("TTS request failed: %s", e, extra={"stage": "tts"})
+        return None
+
+    if resp.status_code != 200:
+        log.warning("TTS returned %d: %s", resp.status_code, resp.text, extra={"stage": "tts"})
+        resp.close()
+        return None
+    return resp
+
+
+def download_elevenlabs_audio(text: str, voice_id: str = DEFAULT_VOICE_ID, on_first_byte=None, cancel=None) -> bytes:
+    """
+    Stream the whole MP3 for `text` from ElevenLabs (no cache); b"" on failure.
+    Once `cancel` (a threading.Event) is set the stream is closed and b"" returned.
+    """
+    started = time.perf_counter()
+    resp = request_elevenlabs_audio(text, voice_id)
+    if resp is None:
+        metrics.record_error("tts")
+        return b""
+
+    chunks = []
+    try:
+        for chunk in resp.iter_content(chunk_size=8192):
+            if cancel is not None and cancel.is_set():
+                log.debug("TTS cancelled after %d chunks", len(chunks), extra={"stage": "tts"})
+                return b""
+            if chunk:
+                if not chunks:
+                    metrics.observe("tts_first_byte", time.perf_counter() - started)
+                    if on_first_byte:
+                        on_first_byte()
+                chunks.append(chunk)
+    except requests.RequestException as e:
+        log.warning("TTS stream broke off: %s", e, extra={"stage": "tts"})
+        metrics.record_error("tts")
+        return b""
+    finally:
+        resp.close()
+        metrics.observe("tts", time.perf_counter() - started)
+
+    audio = b"".join(chunks)
+    if not audio:
+        log.warning("TTS returned no audio", extra={"stage": "tts"})
+        metrics.record_error("tts")
+    return audio
+
+
+def synthesize_to_bytes(text: str, voice_id: str = DEFAULT_VOICE_ID, on_first_byte=None, cancel=None) -> bytes:
+    """
+    Convert text to speech and return the MP3 bytes; returns b"" on failure.
+    Repeated (voice, settings, text) combinations are served from the TTS cache.
+    `on_first_byte()` is called when ElevenLabs starts streaming (not on cache hits);
+    setting `cancel` stops the download (nothing is cached).
+    """
+    cache = get_tts_cache()
+    key = cache_key(voice_id, TTS_MODEL_ID, TTS_VOICE_SETTINGS, text) if cache else None
+    if cache:
+        audio = cache.get(key)
+        if audio is not None:
+            log.debug("TTS cache hit")
+            return audio
+
+    with admission.get_limiter("elevenlabs").slot():
+        audio = download_elevenlabs_audio(text, voice_id, on_first_byte, cancel)
+    if not audio:
+        return b""
+
+    if cache:
+        cache.put(key, audio)
+    return audio
+
+
+def stream_speech(text: str, voice_id: str = DEFAULT_VOICE_ID, output_format: str = "pcm_22050"):
+    """
+    Yield audio chunks for `text` as ElevenLabs streams them, for playback
+    that starts with the first chunk. Complete streams go to the TTS cache
+    (keyed with the format); closing the generator early cancels the request.
+    """
+    cache = get_tts_cache()
+    key = cache_key(voice_id, TTS_MODEL_ID, {**TTS_VOICE_SETTINGS, "output_format": output_format}, text) if cache else None
+    if cache:
+        audio = cache.get(key)
+        if audio is not None:
+            log.debug("TTS cache hit")
+            yield audio
+            return
+
+    chunks = []
+    with admission.get_limiter("elevenlabs").slot():
+        started = time.perf_counter()
+        resp = request_elevenlabs_audio(text, voice_id, output_format)
+        if resp is None:
+            metrics.record_error("tts")
+            return
+        try:
+            for chunk in resp.iter_content(chunk_size=4096):
+                if chunk:
+                    if not chunks:
+                        metrics.observe("tts_first_byte", time.perf_counter() - started)
+                    chunks.append(chunk)
+                    yield chunk
+        except requests.RequestException as e:
+            log.warning("TTS stream broke off: %s", e, extra={"stage": "tts"})
+            metrics.record_error("tts")
+            return
+        finally:
+            resp.close()
+            metrics.observe("tts", time.perf_counter() - started)
+
+    if cache and chunks:
+        cache.put(key, b"".join(chunks), extension=output_format.split("_")[0])  # pcm_22050 -> .pcm
+
+
+def synthesize_with_elevenlabs(text: str, output_path, voice_id: str = DEFAULT_VOICE_ID) -> str:
+    """Convert text to speech and write it to `output_path`; returns "" on failure"""
+    audio = synthesize_to_bytes(text, voice_id)
+    if not audio:
+        return ""
+
+    with open(output_path, "wb") as f:
+        f.write(audio)
+
+    log.debug("Saved audio to %s", output_path)
+    return output_path
+
+
+# Async variants (python/api_async.py)
+
+def _httpx_timeout(timeout) -> httpx.Timeout:
+    connect, read = timeout
+    return httpx.Timeout(read, connect=connect)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled httpx.AsyncClient for Deepgram and ElevenLabs"""
+    global _async_http_client
+    if _async_http_client is None:
+        pool_size = get_config().pool_size
+        _async_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+    return _async_http_client
+
+
+def get_async_openai_client() -> "AsyncOpenAI":
+    """Process-wide AsyncOpenAI client on a pooled httpx transport"""
+    global _async_openai_client
+    if _async_openai_client is None:
+        from openai import AsyncOpenAI
+        config = get_config()
+        _async_openai_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=config.openai_base_url,
+            max_retries=config.max_retries,
+            timeout=_httpx_timeout(config.llm_timeout),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=config.pool_size,
+                    max_keepalive_connections=config.pool_size,
+                ),
+            ),
+        )
+    return _async_openai_client
+
+
+async def close_async_clients():
+    """Close pooled async connections (call on application shutdown)"""
+    global _async_http_client, _async_openai_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+    if _async_openai_client is not None:
+        await _async_openai_client.close()
+        _async_openai_client = None
+
+
+async def post_with_retries_async(vendor: str, url: str, timeout, **kwargs) -> httpx.Response:
+    """Async post_with_retries; the response body is fully read"""
+    config = get_config()
+    breaker = get_breaker(vendor)
+    http = get_async_http_client()
+
+    request_timeout = admission.cap_timeout(timeout)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{vendor} circuit is open")
+
+    error = None
+    try:
+        for attempt in range(config.max_retries + 1):
+            if attempt:
+                request_timeout = admission.cap_timeout(timeout)
+            try:
+                resp = await http.post(url, timeout=_httpx_timeout(request_timeout), **kwargs)
+            except httpx.HTTPError as e:
+                admission.check_deadline()
+                if attempt < config.max_retries:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                error = e
+                break
+
+            if resp.status_code in RETRY_STATUSES and attempt < config.max_retries:
+                await asyncio.sleep(backoff_delay(attempt, resp.headers.get("Retry-After")))
+                continue
+            break
+    except BaseException:
+        breaker.release()  # e.g. the request was cancelled
+        raise
+
+    if error is not None:
+        breaker.record_failure()
+        raise ProviderError(f"{vendor} request failed: {error}") from error
+    record_outcome(breaker, resp.status_code)
+    return resp
+
+
+async def transcribe_with_deepgram_async(audio_bytes: bytes, content_type: str, keywords: str = None) -> str:
+    """Async transcribe_with_deepgram; returns "" on failure"""
+    config = get_config()
+    headers = {
+        "Authorization": f"Token {os.getenv('DEEPGRAM_API_KEY')}",
+        "Content-Type": content_type,
+    }
+
+    params = {
+        "model": "nova-2",
+        "smart_format": "true",
+        "punctuate": "true",
+    }
+    if keywords:
+        params["keywords"] = keywords
+
+    limiter = admission.get_limiter("deepgram")
+    acquired = await limiter.acquire_async()
+    started = time.perf_counter()
+    try:
+        resp = await post_with_retries_async(
+            "deepgram",
+            f"{config.deepgram_base_url}/v1/listen",
+            config.stt_timeout,
+            headers=headers,
+            params=params,
+            content=audio_bytes,
+        )
+    except ProviderError as e:
+        log.warning("STT request failed: %s", e, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+    finally:
+        limiter.release(acquired)
+        metrics.observe("stt", time.perf_counter() - started)
+
+    if resp.status_code != 200:
+        log.warning("STT returned %d: %s", resp.status_code, resp.text, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+
+    try:
+        data = resp.json()
+        transcript = data["results"]["channels"][0]["alternatives"][0]["transcript"]
+        return transcript.strip()
+    except (KeyError, IndexError) as e:
+        log.warning("Could not parse STT response: %s", e, extra={"stage": "stt"})
+        metrics.record_error("stt")
+        return ""
+
+
+async def create_chat_completion_async(messages: list, max_tokens: int, stream: bool = False, model: str = "gpt-4o-mini"):
+    """Async create_chat_completion (a streamed completion does not hold its slot)"""
+    breaker = get_breaker("openai")
+    if breaker.state == "open":
+        raise CircuitOpenError("openai circuit is open")
+    limiter = admission.get_limiter("openai")
+    acquired = await limiter.acquire_async()
+    try:
+        options = {}
+        if admission.remaining() is not None:
+            options["timeout"] = _httpx_timeout(admission.cap_timeout(get_config().llm_timeout))
+        if not breaker.allow():
+            raise CircuitOpenError("openai circuit is open")
+        try:
+            completion = await get_async_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=stream,
+                **options,
+            )
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                breaker.release()
+            else:
+                breaker.record_failure()
+            admission.check_deadline()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+    finally:
+        limiter.release(acquired)
+    breaker.record_success()
+    return completion
+
+
+async def synthesize_with_elevenlabs_async(text: str, voice_id: str = DEFAULT_VOICE_ID) -> bytes:
+    """Async TTS; returns the MP3 bytes, or b"" on failure"""
+    config = get_config()
+    url = f"{config.eleven_base_url}/v1/text-to-speech/{voice_id}"
+    headers = {
+        "xi-api-key": os.getenv("ELEVEN_API_KEY"),
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "text": text,
+        "model_id": TTS_MODEL_ID,
+        "voice_settings": TTS_VOICE_SETTINGS,
+    }
+
+    cache = get_tts_cache()
+    key = cache_key(voice_id, TTS_MODEL_ID, TTS_VOICE_SETTINGS, text) if cache else None
+    if cache:
+        audio = await asyncio.to_thread(cache.get, key)
+        if audio is not None:
+            return audio
+
+    limiter = admission.get_limiter("elevenlabs")
+    acquired = await limiter.acquire_async()
+    started = time.perf_counter()
+    try:
+        resp = await post_with_retries_async("elevenlabs", url, config.tts_timeout, headers=headers, json=payload)
+    except ProviderError as e:
+        log.warning("TTS request failed: %s", e, extra={"stage": "tts"})
+        metrics.record_error("tts")
+        return b""
+    finally:
+        limiter.release(acquired)
+        metrics.observe("tts", time.perf_counter() - started)
+
+    if resp.status_code != 200:
+        log.warning("TTS returned %d: %s", resp.status_code, resp.text, extra={"stage": "tts"})
+        metrics.record_error("tts")
+        return b""
+
+    if cache:
+        await asyncio.to_thread(cache.put, key, resp.content)
+    return resp.content
@@ -0,0 +1,199 @@
+"""
+Cache of donor replies for the first turns of a conversation.
+
+Most sessions with a persona open with nearly the same pitch, so the
+first reply or two are nearly the same too. This cache keeps those
+replies, keyed on the persona and a normalized copy of the conversation
+before the latest user message. The latest utterance must match a cached
+one exactly (after normalization), or, with REPLY_CACHE_SIMILARITY below
+1, be close enough by character-trigram similarity.
+
+Each entry collects up to REPLY_CACHE_VARIANTS different replies before
+it starts answering. A hit then returns one of them at random, so
+trainees don't all hear the identical line. Entries expire after
+REPLY_CACHE_TTL_SECONDS, so a persona edit or a model change is picked
+up, and the cache holds at most REPLY_CACHE_MAX_ENTRIES utterances
+(least recently used go first).
+
+Configuration (environment variables):
+    REPLY_CACHE_ENABLED        opt in with 1/true (default off)
+    REPLY_CACHE_MAX_TURNS      user turns per conversation that may be served from the cache (default 2)
+    REPLY_CACHE_MAX_ENTRIES    cached utterances (default 2000)
+    REPLY_CACHE_TTL_SECONDS    entry lifetime (default 86400)
+    REPLY_CACHE_VARIANTS       replies collected per utterance before it is served (default 3)
+    REPLY_CACHE_SIMILARITY     trigram similarity needed for a fuzzy match; 1 = exact only (default 1)
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from singleflight import request_key
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_TURNS = 2
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_VARIANTS = 3
+DEFAULT_SIMILARITY = 1.0
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase words only: punctuation, accents and spacing don't change what was said"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9']+", text))
+
+
+def trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Entry:
+    def __init__(self, prefix: str, utterance: str):
+        self.prefix = prefix
+        self.utterance = utterance
+        self.grams = trigrams(utterance)
+        self.replies = []  # (reply, seconds the LLM took to write it)
+        self.created = time.monotonic()
+
+
+class ReplyCache:
+    """In-memory LRU of early-turn replies, keyed on (persona, conversation so far, utterance)"""
+
+    def __init__(self, max_turns: int = DEFAULT_MAX_TURNS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, variants: int = DEFAULT_VARIANTS,
+                 min_similarity: float = DEFAULT_SIMILARITY):
+        self.max_turns = max_turns
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variants = max(variants, 1)
+        self.min_similarity = min_similarity
+        self.entries = OrderedDict()  # (prefix, utterance) -> Entry, least recently used first
+        self.by_prefix = {}  # prefix -> {utterance: Entry}, for fuzzy lookups
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.filling = 0  # matched an entry that doesn't have all its variants yet
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    def eligible(self, conversation: list) -> bool:
+        """True while the conversation (ending with the new user message) is within the first turns"""
+        return sum(1 for m in conversation if m["role"] == "user") <= self.max_turns
+
+    def _split(self, persona_key: str, conversation: list) -> tuple:
+        """(prefix key for everything before the latest message, normalized latest user utterance)"""
+        history = [[m["role"], normalize_utterance(m["content"])] for m in conversation[:-1]]
+        return request_key(persona_key, history), normalize_utterance(conversation[-1]["content"])
+
+    def _remove(self, entry: Entry):
+        self.entries.pop((entry.prefix, entry.utterance), None)
+        siblings = self.by_prefix.get(entry.prefix)
+        if siblings is not None:
+            siblings.pop(entry.utterance, None)
+            if not siblings:
+                del self.by_prefix[entry.prefix]
+
+    def _find(self, prefix: str, utterance: str) -> tuple:
+        """(entry, fuzzy) for the utterance, or (None, False); drops expired entries on the way"""
+        now = time.monotonic()
+        siblings = self.by_prefix.get(prefix) or {}
+        for entry in [e for e in siblings.values() if now - e.created > self.ttl_seconds]:
+            self._remove(entry)
+        entry = siblings.get(utterance)
+        if entry is not None:
+            return entry, False
+        if self.min_similarity >= 1 or not siblings:
+            return None, False
+        grams = trigrams(utterance)
+        best, score = None, 0.0
+        for candidate in siblings.values():
+            s = similarity(grams, candidate.grams)
+            if s > score:
+                best, score = candidate, s
+        if best is not None and score >= self.min_similarity:
+            return best, True
+        return None, False
+
+    def get(self, persona_key: str, conversation: list) -> str:
+        """A cached reply to the conversation's latest user message, or None"""
+        if not self.eligible(conversation):
+            return None
+        prefix, utterance = self._split(persona_key, conversation)
+        with self.lock:
+            self.lookups += 1
+            entry, fuzzy = self._find(prefix, utterance)
+            if entry is None:
+                return None
+            self.entries.move_to_end((entry.prefix, entry.utterance))
+            if len(entry.replies) < self.variants:
+                self.filling += 1
+                return None
+            reply, seconds = random.choice(entry.replies)
+            self.hits += 1
+            self.fuzzy_hits += fuzzy
+            self.seconds_saved += seconds
+        log.debug("Reply cache hit%s", " (fuzzy)" if fuzzy else "", extra={"persona": persona_key})
+        return reply
+
+    def put(self, persona_key: str, conversation: list, reply: str, seconds: float):
+        """Remember `reply` (which took `seconds` to generate) as one variant for this point in the conversation"""
+        if not reply or not self.eligible(conversation):
+            return
+        prefix, utterance = self._split(persona_key, conversation)
+        with self.lock:
+            entry, _ = self._find(prefix, utterance)
+            if entry is None:
+                entry = Entry(prefix, utterance)
+                self.entries[(prefix, utterance)] = entry
+                self.by_prefix.setdefault(prefix, {})[utterance] = entry
+                while len(self.entries) > self.max_entries:
+                    _, oldest = self.entries.popitem(last=False)
+                    self._remove(oldest)
+                    self.evictions += 1
+            if len(entry.replies) < self.variants and all(r != reply for r, _ in entry.replies):
+                entry.replies.append((reply, seconds))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "filling": self.filling,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "seconds_saved": round(self.seconds_saved, 3),
+            }
+
+
+def create_reply_cache():
+    """ReplyCache configured from the environment; None unless REPLY_CACHE_ENABLED is set"""
+    if os.getenv("REPLY_CACHE_ENABLED", "0").lower() not in ("1", "true", "yes"):
+        return None
+    cache = ReplyCache(
+        max_turns=int(os.getenv("REPLY_CACHE_MAX_TURNS") or DEFAULT_MAX_TURNS),
+        max_entries=int(os.getenv("REPLY_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+        ttl_seconds=float(os.getenv("REPLY_CACHE_TTL_SECONDS") or DEFAULT_TTL_SECONDS),
+        variants=int(os.getenv("REPLY_CACHE_VARIANTS") or DEFAULT_VARIANTS),
+        min_similarity=float(os.getenv("REPLY_CACHE_SIMILARITY") or DEFAULT_SIMILARITY),
+    )
+    log.info("Reply cache enabled", extra={"max_turns": cache.max_turns, "variants": cache.variants,
+                                           "similarity": cache.min_similarity})
+    return cache
@@ -0,0 +1,172 @@
+"""
+Bounded, thread-safe conversation store for the API.
+
+Sessions are evicted after SESSION_IDLE_TTL_SECONDS without a request,
+and the least recently used ones are dropped once there are more than
+SESSION_MAX sessions. Each session's history is trimmed to its system
+messages (prompt and running summary) plus the most recent turns that fit
+SESSION_MAX_HISTORY_MESSAGES and SESSION_MAX_HISTORY_CHARS. This is a
+memory backstop; the prompt itself is kept within its token budget by
+context_budget.py.
+
+Use `conversation()` around anything that reads or appends messages; it
+holds the session's lock so concurrent requests on one session_id are
+applied one turn at a time.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_HISTORY_MESSAGES = 40
+DEFAULT_MAX_HISTORY_CHARS = 32000
+
+
+class Session:
+    def __init__(self, session_id: str, system_prompt: str):
+        self.session_id = session_id
+        self.messages = [{"role": "system", "content": system_prompt}]
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+        self.size_bytes = message_bytes(self.messages)
+
+
+def message_bytes(messages: list) -> int:
+    return sum(len(m["content"].encode("utf-8")) for m in messages if m.get("content"))
+
+
+def trim_messages(messages: list, max_messages: int, max_chars: int) -> list:
+    """Keep the leading system messages plus the newest messages within both limits"""
+    pinned = 0
+    while pinned < len(messages) and messages[pinned]["role"] == "system":
+        pinned += 1
+    head, history = messages[:pinned], messages[pinned:]
+    kept = []
+    chars = 0
+    for message in reversed(history):
+        length = len(message.get("content") or "")
+        if len(head) + len(kept) >= max_messages or (kept and chars + length > max_chars):
+            break
+        kept.append(message)
+        chars += length
+    kept.reverse()
+    # Never start the history on an assistant reply to a dropped question
+    # (an opening greeting with nothing dropped before it is kept)
+    while kept and len(kept) < len(history) and kept[0]["role"] == "assistant":
+        kept.pop(0)
+    return head + kept
+
+
+class SessionStore:
+    def __init__(self,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS,
+                 max_history_messages: int = DEFAULT_MAX_HISTORY_MESSAGES,
+                 max_history_chars: int = DEFAULT_MAX_HISTORY_CHARS):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_history_messages = max_history_messages
+        self.max_history_chars = max_history_chars
+
+        self.sessions = OrderedDict()  # session_id -> Session, least recently used first
+        self.lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _evict(self, now: float):
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_access <= self.idle_ttl_seconds:
+                break
+            del self.sessions[oldest.session_id]
+            self.expired += 1
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, session_id: str, system_prompt_factory) -> Session:
+        """Return the live session, creating it with `system_prompt_factory()` if needed"""
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and now - session.last_access > self.idle_ttl_seconds:
+                del self.sessions[session_id]
+                self.expired += 1
+                session = None
+            if session is None:
+                session = Session(session_id, system_prompt_factory())
+                self.sessions[session_id] = session
+                self.created += 1
+                log.debug("Created session", extra={"session": session_id})
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_access = now
+            self._evict(now)
+            return session
+
+    @contextmanager
+    def conversation(self, session_id: str, system_prompt_factory):
+        """Hold the session's lock and yield its (trimmed) message list"""
+        session = self.get(session_id, system_prompt_factory)
+        with session.lock:
+            session.messages[:] = self.trim(session.messages)
+            try:
+                yield session.messages
+            finally:
+                session.messages[:] = self.trim(session.messages)
+                session.size_bytes = message_bytes(session.messages)
+                session.last_access = time.monotonic()
+
+    def trim(self, messages: list) -> list:
+        return trim_messages(messages, self.max_history_messages, self.max_history_chars)
+
+    def reset(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            sessions = list(self.sessions.values())
+            return {
+                "backend": "memory",
+                "live_sessions": len(sessions),
+                "messages": sum(len(s.messages) for s in sessions),
+                "memory_bytes": sum(s.size_bytes for s in sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max_sessions": self.max_sessions,
+            }
+
+
+def create_session_store():
+    """
+    Store configured from SESSION_* env vars.
+    SESSION_STORE=memory (default) keeps sessions in this process;
+    SESSION_STORE=database shares them between workers (db_session_store.py).
+    """
+    options = dict(
+        max_sessions=int(os.getenv("SESSION_MAX") or DEFAULT_MAX_SESSIONS),
+        idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS") or DEFAULT_IDLE_TTL_SECONDS),
+        max_history_messages=int(os.getenv("SESSION_MAX_HISTORY_MESSAGES") or DEFAULT_MAX_HISTORY_MESSAGES),
+        max_history_chars=int(os.getenv("SESSION_MAX_HISTORY_CHARS") or DEFAULT_MAX_HISTORY_CHARS),
+    )
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "database":
+        # Imported lazily so the memory backend needs no database driver
+        from db_session_store import DEFAULT_FLUSH_BATCH, DEFAULT_FLUSH_INTERVAL_SECONDS, DatabaseSessionStore
+        return DatabaseSessionStore(
+            flush_interval_seconds=float(os.getenv("SESSION_DB_FLUSH_INTERVAL_SECONDS") or DEFAULT_FLUSH_INTERVAL_SECONDS),
+            flush_batch=int(os.getenv("SESSION_DB_FLUSH_BATCH") or DEFAULT_FLUSH_BATCH),
+            **options,
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
+    return SessionStore(**options)
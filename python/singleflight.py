@@ -0,0 +1,135 @@
+"""
+Single-flight deduplication of identical concurrent calls.
+
+When several requests need the same vendor call at the same moment (a
+class opening the same persona, a client retrying while the first try is
+still running), only the first one (the leader) makes it. The others wait
+and get the leader's result, or its exception. Once the call finishes
+the key is forgotten, so later requests call again (caching is the TTS
+cache's job, not this module's).
+
+    audio = tts_flights.do(key, lambda: providers.synthesize_to_bytes(text))
+
+Callers that stream (the LLM reply) use `join()` and `finish()` directly so
+the leader can yield as it goes while followers wait for the whole result.
+
+A follower waits no longer than its own turn's deadline (admission.py):
+once that passes it gets DeadlineExceeded, while the leader carries on.
+If the leader stops without a result (its client went away), followers
+don't fail with it: the first to notice makes the call itself, and the
+rest follow it, each still within its own deadline.
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+
+import admission
+
+log = logging.getLogger(__name__)
+
+
+class Abandoned(Exception):
+    """The leader stopped before finishing; a follower should make the call itself"""
+
+
+class Flight:
+    """One in-flight call; followers block in wait() until the leader finishes it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def wait(self):
+        """The leader's result or exception; DeadlineExceeded if this caller's turn runs out first"""
+        while not self.done.wait(admission.remaining()):  # no deadline: wait for as long as it takes
+            admission.check_deadline()
+        if self.error is not None:
+            # A copy per follower, so threads don't pile frames onto one shared traceback
+            try:
+                error = copy.copy(self.error)
+            except Exception:
+                error = self.error
+            raise error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.flights = {}  # key -> Flight
+        self.lock = threading.Lock()
+        self.calls = 0  # calls actually made (leaders)
+        self.coalesced = 0  # requests that shared a leader's call
+        self.shared_errors = 0  # followers that got the leader's exception
+        self.abandoned = 0  # leaders that stopped early, leaving their followers to call again
+
+    def join(self, key: str) -> tuple:
+        """(flight, is_leader); the leader must call finish() when done"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self.flights[key] = Flight()
+            self.calls += 1
+            return flight, True
+
+    def finish(self, key: str, flight: Flight, result=None, error: BaseException = None):
+        """Publish the leader's result (or error) to its followers and forget the key"""
+        flight.result, flight.error = result, error
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            if isinstance(error, Abandoned):
+                self.abandoned += 1
+            elif error is not None:
+                self.shared_errors += flight.followers
+        if flight.followers:
+            log.debug("%s call shared with %d waiting requests", self.name, flight.followers)
+        flight.done.set()
+
+    def abandon(self, key: str, flight: Flight):
+        """Finish a flight whose leader stopped early (e.g. a closed generator); its followers call again"""
+        self.finish(key, flight, error=Abandoned(f"{self.name} call was abandoned by its leader"))
+
+    def do(self, key: str, fn):
+        """Return fn(), sharing one call among concurrent callers with the same key"""
+        while True:
+            flight, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return flight.wait()
+            except Abandoned:
+                log.debug("%s leader stopped early, calling again", self.name)
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, flight, error=e)
+            raise
+        except BaseException:
+            self.abandon(key, flight)
+            raise
+        self.finish(key, flight, result=result)
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "shared_errors": self.shared_errors,
+                "abandoned": self.abandoned,
+                "in_flight": len(self.flights),
+            }
+
+
+def request_key(*parts) -> str:
+    """Stable hash of JSON-serializable request parts"""
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
@@ -0,0 +1,88 @@
+"""
+Measure how long a fresh API worker takes to become ready.
+
+Each run starts a new interpreter, imports api and calls create_app(),
+the same work a gunicorn worker or an autoscaled container does before
+it can serve. Prints the median import and create_app times and exits 1
+if their sum is over the budget (STARTUP_BUDGET_MS, default 1500).
+
+    python python/startup_check.py
+    python python/startup_check.py --runs 10 --budget-ms 800
+    python python/startup_check.py --importtime     # slowest imports, from python -X importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).parent
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+api.create_app()
+ready = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (ready - imported) * 1000}))
+"""
+
+
+def probe_env() -> dict:
+    # Placeholder keys so validation passes without a .env; nothing calls a vendor
+    env = {"DEEPGRAM_API_KEY": "startup-check", "OPENAI_API_KEY": "startup-check", "ELEVEN_API_KEY": "startup-check"}
+    return {**env, **os.environ, "LOG_LEVEL": "WARNING"}
+
+
+def measure(runs: int) -> list:
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=HERE, env=probe_env(),
+                             capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def slowest_imports(limit: int = 15) -> list:
+    """(cumulative ms, module) for the slowest imports under `import api`"""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api"], cwd=HERE, env=probe_env(),
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative) / 1000, module.rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API worker startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS") or 1500))
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    create_ms = statistics.median(r["create_app_ms"] for r in results)
+    total_ms = import_ms + create_ms
+    print(f"import api     {import_ms:7.0f} ms")
+    print(f"create_app()   {create_ms:7.0f} ms")
+    print(f"total          {total_ms:7.0f} ms  (budget {args.budget_ms:.0f} ms, median of {args.runs})")
+
+    if args.importtime:
+        print("\nSlowest imports (cumulative):")
+        for ms, module in slowest_imports():
+            print(f"  {ms:7.1f} ms  {module}")
+
+    if total_ms > args.budget_ms:
+        print("\nOver budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
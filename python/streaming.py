@@ -0,0 +1,117 @@
+import contextvars
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Abbreviations that end in a period but do not end a sentence
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "prof", "st", "vs", "etc", "e.g", "i.e", "u.s", "jr", "sr"}
+
+# Sentence end: terminal punctuation, optional closing quote/bracket, then whitespace
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+# Very short sentences ("Okay.") are merged with the next one so TTS gets enough context
+MIN_SENTENCE_CHARS = 20
+
+_END = object()  # stream_segments: the sentences ran out
+
+
+class SentenceSplitter:
+    """Accumulate streamed LLM tokens and emit complete sentences"""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, token: str) -> list:
+        """Add a token and return any sentences that are now complete"""
+        self.buffer += token
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()]
+            last_word = candidate.strip().rstrip('.!?"\')]').split()[-1:] or [""]
+            if last_word[0].lower().rstrip(".") in ABBREVIATIONS:
+                continue
+            if len(candidate.strip()) < self.min_chars:
+                continue
+            sentences.append(candidate.strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> list:
+        """Return whatever is left once the token stream ends"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+def iter_sentences(token_iter, min_chars: int = MIN_SENTENCE_CHARS):
+    """Yield sentences from an iterator of text deltas"""
+    splitter = SentenceSplitter(min_chars)
+    for token in token_iter:
+        if token:
+            yield from splitter.feed(token)
+    yield from splitter.flush()
+
+
+def stream_segments(sentences, synthesize, max_workers: int = 2):
+    """
+    Run `synthesize(index, sentence)` for each sentence as soon as it is
+    available and yield (index, sentence, result) in order.
+
+    The sentences are read on their own thread, so TTS for sentence N
+    overlaps with generating sentence N+1, and each segment is yielded as
+    soon as its TTS finishes rather than when the next sentence arrives.
+    Results are still yielded strictly in order so playback never skips
+    ahead. The reader and each call run in a copy of the caller's context,
+    so they keep the turn deadline.
+    """
+    submitted = queue.Queue()  # (index, sentence, future) per sentence, then _END or the reader's exception
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def read():
+        try:
+            for index, sentence in enumerate(sentences):
+                submitted.put((index, sentence, executor.submit(contextvars.copy_context().run,
+                                                                synthesize, index, sentence)))
+                if stop.is_set():
+                    break
+            submitted.put(_END)
+        except BaseException as e:
+            submitted.put(e)
+        finally:
+            if stop.is_set() and hasattr(sentences, "close"):
+                sentences.close()  # the consumer went away: stop the upstream generator too
+
+    reader = threading.Thread(target=contextvars.copy_context().run, args=(read,),
+                              name="sentence-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = submitted.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            index, sentence, future = item
+            yield index, sentence, future.result()
+    finally:
+        # Don't hand the sentences (and whatever they write to) back to the caller while the reader still runs
+        stop.set()
+        reader.join()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def elapsed_ms(start: float) -> int:
+    """Milliseconds since `start` (a time.perf_counter() value)"""
+    return int((time.perf_counter() - start) * 1000)
@@ -0,0 +1,154 @@
+"""
+Streaming speech-to-text through Deepgram's live /v1/listen WebSocket.
+
+/api/stt/stream (api.py) relays the browser's timesliced MediaRecorder
+chunks here while the user is still holding the record button. Deepgram
+transcribes as the audio arrives, so when the button is released only the
+last fraction of a second is left to recognize:
+
+    stream = DeepgramStream(on_partial=print)
+    for chunk in chunks:
+        stream.send(chunk)
+    transcript = stream.finish()
+
+Uses the same DEEPGRAM_BASE_URL (http -> ws), STT timeouts and "deepgram"
+circuit breaker as providers.py. Each stream holds one of the deepgram
+concurrency slots (admission.py) until it is closed, so STT_MAX_CONCURRENCY
+covers live streams as well as batch requests. close() settles the breaker
+and frees the slot however the stream ends (finished, or abandoned when the
+browser hangs up or goes quiet). `python fake_stt_server.py` is a local
+stand-in for testing.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.sync.client import connect
+
+import admission
+import metrics
+from providers import CircuitOpenError, ProviderError, get_breaker, get_config
+
+log = logging.getLogger(__name__)
+
+
+def stream_url(base_url: str, keywords: str = None) -> str:
+    params = {
+        "model": "nova-2",
+        "smart_format": "true",
+        "punctuate": "true",
+        "interim_results": "true",
+    }
+    if keywords:
+        params["keywords"] = keywords
+    ws_base = "ws" + base_url[len("http"):] if base_url.startswith("http") else base_url
+    return f"{ws_base}/v1/listen?{urlencode(params)}"
+
+
+class DeepgramStream:
+    """One live transcription; send audio chunks, then finish() for the final transcript"""
+
+    def __init__(self, keywords: str = None, on_partial=None):
+        config = get_config()
+        self.breaker = get_breaker("deepgram")
+        if self.breaker.state == "open":
+            raise CircuitOpenError("deepgram circuit is open")  # fail fast, without queueing for a slot
+        self.limiter = admission.get_limiter("deepgram")
+        self.acquired = self.limiter.acquire()  # held until close()
+        if not self.breaker.allow():
+            self.limiter.release(self.acquired)
+            raise CircuitOpenError("deepgram circuit is open")
+
+        self.read_timeout = config.stt_timeout[1]
+        self.on_partial = on_partial
+        self.finals = []
+        self.error = None
+        self.closed = False
+        try:
+            self.ws = connect(
+                stream_url(config.deepgram_base_url, keywords),
+                additional_headers={"Authorization": f"Token {os.getenv('DEEPGRAM_API_KEY')}"},
+                open_timeout=config.stt_timeout[0],
+            )
+        except (OSError, WebSocketException) as e:
+            self.breaker.record_failure()
+            self.limiter.release(self.acquired)
+            metrics.record_error("stt")
+            raise ProviderError(f"deepgram stream failed to open: {e}") from e
+        except BaseException:
+            self.breaker.release()
+            self.limiter.release(self.acquired)
+            raise
+
+        self.thread = threading.Thread(target=self._read, name="deepgram-stream", daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        try:
+            for message in self.ws:
+                data = json.loads(message)
+                if data.get("type") != "Results":
+                    continue
+                alternatives = data.get("channel", {}).get("alternatives") or [{}]
+                text = (alternatives[0].get("transcript") or "").strip()
+                if data.get("is_final"):
+                    if text:
+                        self.finals.append(text)
+                elif text and self.on_partial:
+                    try:
+                        self.on_partial(" ".join(self.finals + [text]))
+                    except Exception as e:  # e.g. the browser already hung up
+                        log.debug("Dropped partial transcript: %s", e)
+        except ConnectionClosed as e:
+            if e.rcvd is None or e.rcvd.code != 1000:
+                self.error = e
+        except (ValueError, WebSocketException) as e:
+            self.error = e
+
+    def send(self, chunk: bytes):
+        try:
+            self.ws.send(chunk)
+        except (OSError, WebSocketException) as e:
+            raise ProviderError(f"deepgram stream broke off: {e}") from e
+
+    def finish(self) -> str:
+        """Flush the stream and return the final transcript ("" if nothing was said)"""
+        started = time.perf_counter()
+        try:
+            try:
+                self.ws.send(json.dumps({"type": "CloseStream"}))
+            except (OSError, WebSocketException) as e:
+                self.error = self.error or e
+            # Deepgram sends the last results, then closes the socket
+            self.thread.join(self.read_timeout)
+            if self.thread.is_alive():
+                self.error = self.error or TimeoutError("no final transcript before the read timeout")
+        finally:
+            self.close()
+            metrics.observe("stt_finalize", time.perf_counter() - started)
+
+        if self.error is not None:
+            metrics.record_error("stt")
+            raise ProviderError(f"deepgram stream failed: {self.error}")
+        transcript = " ".join(self.finals).strip()
+        log.debug("Streamed transcript: %s", transcript)
+        return transcript
+
+    def close(self):
+        """Close the socket, record the outcome on the breaker and free the slot; later calls do nothing"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.ws.close()
+        finally:
+            # An abandoned stream still tells us whether Deepgram was reachable
+            if self.error is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            self.limiter.release(self.acquired)
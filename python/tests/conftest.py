@@ -0,0 +1,60 @@
+"""
+Test setup: the API modules import each other as siblings, so python/ goes
+on sys.path. Vendor calls are replaced per test (fake functions, or the
+local fake servers in fake_vendors.py and fake_stt_server.py); the API keys
+only need to be set.
+
+    python -m pytest -q python/tests
+"""
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+for name in ("ELEVEN_API_KEY", "DEEPGRAM_API_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("PERSONA_WARMUP", "0")
+os.environ.setdefault("TTS_FALLBACK_ENGINE", "none")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import admission  # noqa: E402
+import providers  # noqa: E402
+import tts_cache  # noqa: E402
+from fake_vendors import VendorProfile, make_handler  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_vendor_state(tmp_path, monkeypatch):
+    """Clients, breakers, limiters and caches are per process; start every test from scratch"""
+    monkeypatch.setenv("TTS_CACHE_DIR", str(tmp_path / "tts_cache"))
+    providers._reset_after_fork()
+    tts_cache._cache = None
+    admission._limiters.clear()
+    admission._session_limiter = None
+    admission._config = None
+    yield
+    providers._reset_after_fork()
+    admission._limiters.clear()
+    tts_cache._cache = None
+
+
+@pytest.fixture
+def fake_vendors(monkeypatch):
+    """fake_vendors.py on a free port, with every *_BASE_URL pointing at it"""
+    profile = VendorProfile(stt_ms=20, llm_first_token_ms=20, llm_token_ms=1, llm_tokens=20,
+                            tts_first_byte_ms=10, tts_bytes=4000, tts_stream_ms=10, jitter=0, seed=1)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(profile))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setenv("DEEPGRAM_BASE_URL", base_url)
+    monkeypatch.setenv("ELEVEN_BASE_URL", base_url)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{base_url}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
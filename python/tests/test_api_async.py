@@ -0,0 +1,75 @@
+import asyncio
+import subprocess
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import admission
+import api_async
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def post_turn(client, session_id: str):
+    audio = FileStorage(BytesIO(b"\x1aE\xdf\xa3 fake webm"), filename="recording.webm", content_type="audio/webm")
+    return await client.post("/api/chat", form={"session_id": session_id}, files={"audio": audio})
+
+
+@pytest.fixture
+def app(fake_vendors, monkeypatch):
+    monkeypatch.setenv("SESSION_TURNS_PER_MINUTE", "0")
+    return api_async.create_app()
+
+
+def test_chat_turn_goes_through_the_session_store(app):
+    async def turn():
+        client = app.test_client()
+        r = await post_turn(client, "a1")
+        assert r.status_code == 200, await r.get_json()
+        body = await r.get_json()
+        audio = await client.get(body["audio_url"])
+        assert audio.status_code == 200
+        assert len(await audio.get_data()) == 4000
+        return body
+
+    body = run(turn())
+    history = api_async.read_history("a1", None)
+    assert [m["role"] for m in history] == ["system", "user", "assistant"]
+    assert history[-1]["content"] == body["reply"]
+    assert api_async.sessions.stats()["live_sessions"] >= 1
+
+
+def test_full_vendor_queue_sheds_the_turn(app, monkeypatch):
+    monkeypatch.setattr(admission.get_limiter("openai"), "saturated", lambda: True)
+    r = run(post_turn(app.test_client(), "a2"))
+    assert r.status_code == 503
+    assert r.headers["Retry-After"]
+
+
+def test_turn_past_its_deadline_gets_504(app, monkeypatch):
+    monkeypatch.setattr(admission.get_config(), "turn_deadline_seconds", 0)
+    r = run(post_turn(app.test_client(), "a3"))
+    assert r.status_code == 504
+    assert api_async.read_history("a3", None) == [{"role": "system", "content": api_async.get_system_prompt(None)}]
+
+
+def test_async_vendor_calls_hold_a_slot(fake_vendors):
+    limiter = admission.get_limiter("deepgram")
+    limiter.max_concurrent, limiter.max_queue, limiter.in_flight = 1, 0, 1
+    with pytest.raises(admission.Overloaded):
+        run(api_async.providers.transcribe_with_deepgram_async(b"audio", "audio/webm"))
+    limiter.in_flight = 0
+    assert run(api_async.providers.transcribe_with_deepgram_async(b"audio", "audio/webm"))
+    assert limiter.in_flight == 0
+
+
+def test_import_has_no_side_effects():
+    # A fresh process without API keys: importing must neither fail nor build anything
+    code = "import api_async; assert api_async.sessions is None and api_async.audio_store is None"
+    env = {"PATH": "/usr/bin:/bin", "PYTHONPATH": str(Path(api_async.__file__).parent)}
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, cwd="/")
@@ -0,0 +1,92 @@
+import io
+
+import numpy as np
+import pytest
+
+soundfile = pytest.importorskip("soundfile")
+
+import api  # noqa: E402
+import bench_upload  # noqa: E402
+from audio_codec import TARGET_RATE, encode_speech, prepare_for_stt, to_mono_16k  # noqa: E402
+
+
+def tone(hz: float, seconds: float = 1.0, rate: int = 48000) -> np.ndarray:
+    return np.sin(2 * np.pi * hz * np.arange(int(seconds * rate)) / rate).astype(np.float32)
+
+
+def level(samples: np.ndarray) -> float:
+    middle = samples[len(samples) // 4:-len(samples) // 4]  # clear of the filter's edges
+    return float(np.sqrt(np.mean(middle ** 2)))
+
+
+def test_downmix_and_resample_to_16k():
+    stereo = np.stack([tone(440), 0.5 * tone(440)], axis=1)
+    mono = to_mono_16k(stereo, 48000)
+    assert mono.dtype == np.float32 and mono.ndim == 1
+    assert len(mono) == TARGET_RATE
+    assert level(mono) == pytest.approx(0.75 / np.sqrt(2), rel=0.02)
+
+
+def test_resampling_filters_out_what_would_alias():
+    # 10 kHz is above the new 8 kHz Nyquist frequency: unfiltered it would fold back to 6 kHz
+    assert level(to_mono_16k(tone(10000), 48000)) < 0.01
+    assert level(to_mono_16k(tone(1000), 48000)) > 0.6
+
+
+def wav(samples: np.ndarray, rate: int) -> bytes:
+    return bench_upload.wav_bytes(samples, rate)
+
+
+def test_stereo_wav_is_sent_as_mono_16k_flac(monkeypatch):
+    monkeypatch.setenv("STT_UPLOAD_CODEC", "flac")
+    capture = bench_upload.synthetic_capture(seconds=2)
+    original = wav(capture, 48000)
+
+    encoded, content_type = prepare_for_stt(original, "audio/wav")
+    assert content_type == "audio/flac"
+    assert len(encoded) < len(original) / 5
+    decoded, rate = soundfile.read(io.BytesIO(encoded), always_2d=True)
+    assert (rate, decoded.shape) == (TARGET_RATE, (2 * TARGET_RATE, 1))
+
+
+@pytest.mark.parametrize("content_type", ["audio/webm", "audio/mp4"])
+def test_browser_uploads_pass_through(content_type):
+    assert prepare_for_stt(b"\x1aE\xdf\xa3 webm", content_type) == (b"\x1aE\xdf\xa3 webm", content_type)
+
+
+def test_codec_none_sends_audio_as_recorded(monkeypatch):
+    monkeypatch.setenv("STT_UPLOAD_CODEC", "none")
+    original = wav(tone(440), 48000)
+    assert prepare_for_stt(original, "audio/wav") == (original, "audio/wav")
+
+
+def test_upload_already_in_the_target_format_is_left_alone(monkeypatch):
+    monkeypatch.setenv("STT_UPLOAD_CODEC", "flac")
+    flac, content_type = encode_speech(tone(440, rate=TARGET_RATE), TARGET_RATE, "flac")
+    assert prepare_for_stt(flac, content_type) == (flac, content_type)
+
+
+def test_undecodable_upload_is_sent_as_is():
+    assert prepare_for_stt(b"RIFF not really a wav", "audio/wav") == (b"RIFF not really a wav", "audio/wav")
+
+
+def test_bench_variants_encode_what_prepare_for_stt_sends(monkeypatch):
+    monkeypatch.setenv("STT_UPLOAD_CODEC", "flac")
+    capture = bench_upload.synthetic_capture(seconds=1)
+    variants = bench_upload.variants(capture, 48000)
+    benched, benched_type = variants["flac 16k mono"]()
+    sent, sent_type = prepare_for_stt(wav(capture, 48000), "audio/wav")
+    assert benched_type == sent_type == "audio/flac"
+    for audio in (benched, sent, variants["wav 16k mono"]()[0]):
+        info = soundfile.info(io.BytesIO(audio))
+        assert (info.samplerate, info.channels, info.frames) == (TARGET_RATE, 1, TARGET_RATE)
+
+
+def test_oversized_upload_is_refused_before_any_vendor_call(fake_vendors, monkeypatch):
+    monkeypatch.setenv("MAX_UPLOAD_BYTES", "1000")
+    monkeypatch.setattr(api, "transcribe_with_deepgram", lambda *args: pytest.fail("STT called"))
+    client = api.create_app().test_client()
+    data = {"audio": (io.BytesIO(b"\x00" * 5000), "recording.wav"), "session_id": "big"}
+    r = client.post("/api/chat", data=data, content_type="multipart/form-data")
+    assert r.status_code == 413
+    assert r.json == {"error": "Upload too large (limit is 1000 bytes)"}
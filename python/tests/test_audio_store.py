@@ -0,0 +1,63 @@
+import pytest
+
+import api
+from audio_store import DiskAudioStore, MemoryAudioStore, audio_format
+
+MP3 = b"ID3\x04 elevenlabs audio"
+WAV = b"RIFF\x24\x00\x00\x00WAVEfmt espeak audio"
+
+
+@pytest.mark.parametrize("audio, expected", [
+    (MP3, ("audio/mpeg", "mp3")),
+    (b"\xff\xfb\x90 mp3 frame without a tag", ("audio/mpeg", "mp3")),
+    (WAV, ("audio/wav", "wav")),
+    (b"FORM\x00\x00\x00\x10AIFF", ("audio/aiff", "aiff")),
+])
+def test_audio_format(audio, expected):
+    assert audio_format(audio) == expected
+
+
+def test_disk_store_names_files_after_their_format(tmp_path):
+    store = DiskAudioStore(tmp_path)
+    store.put("a", MP3)
+    store.put("b", WAV)
+    assert {p.name for p in tmp_path.iterdir()} == {"reply_a.mp3", "reply_b.wav"}
+    assert store.get("a") == MP3
+    assert store.get("b") == WAV
+
+    store.put("a", WAV)  # voiced again by the fallback engine
+    assert {p.name for p in tmp_path.iterdir()} == {"reply_a.wav", "reply_b.wav"}
+    assert store.get("a") == WAV
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_memory_store_expires_and_evicts():
+    store = MemoryAudioStore(max_bytes=len(MP3) * 2, ttl_seconds=60)
+    for audio_id in "abc":
+        store.put(audio_id, MP3)
+    assert store.get("a") is None
+    assert store.get("c") == MP3
+    assert store.stats()["evictions"] == 1
+
+    store = MemoryAudioStore(ttl_seconds=0)
+    store.put("a", MP3)
+    assert store.get("a") is None
+
+
+@pytest.mark.parametrize("backend", ["memory", "disk"])
+def test_audio_is_served_with_its_own_type_and_extension(backend, fake_vendors, monkeypatch, tmp_path):
+    monkeypatch.setenv("AUDIO_STORE", backend)
+    monkeypatch.setattr(api, "audio_out_dir", tmp_path)
+    client = api.create_app().test_client()
+    api.audio_store.put("s1_1", WAV)
+    api.audio_store.put("s1_2", MP3)
+
+    wav = client.get("/api/audio/s1_1")
+    assert wav.status_code == 200
+    assert wav.mimetype == "audio/wav"
+    assert "reply_s1_1.wav" in wav.headers["Content-Disposition"]
+    assert wav.data == WAV
+    mp3 = client.get("/api/audio/s1_2")
+    assert mp3.mimetype == "audio/mpeg"
+    assert "reply_s1_2.mp3" in mp3.headers["Content-Disposition"]
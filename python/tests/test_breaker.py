@@ -0,0 +1,183 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import admission
+import providers
+
+
+def fake_openai(monkeypatch, create):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(providers, "get_openai_client", lambda: client)
+
+
+def completion(text="Hello."):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def half_open(vendor: str) -> providers.CircuitBreaker:
+    breaker = providers.get_breaker(vendor)
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_opens_after_threshold_and_fails_fast(monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        raise RuntimeError("vendor down")
+
+    fake_openai(monkeypatch, create)
+    breaker = providers.get_breaker("openai")
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(RuntimeError):
+            providers.create_chat_completion([], max_tokens=5)
+    assert breaker.state == "open"
+    with pytest.raises(providers.CircuitOpenError):
+        providers.create_chat_completion([], max_tokens=5)
+    assert len(calls) == breaker.failure_threshold
+
+
+def test_failed_trial_reopens_then_successful_trial_closes(monkeypatch):
+    outcomes = [RuntimeError("still down"), completion()]
+
+    def create(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    fake_openai(monkeypatch, create)
+    breaker = half_open("openai")
+    with pytest.raises(RuntimeError):
+        providers.create_chat_completion([], max_tokens=5)
+    assert breaker.state == "open"
+    assert not breaker.trial_in_flight
+
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+    assert providers.create_chat_completion([], max_tokens=5).choices[0].message.content == "Hello."
+    assert breaker.state == "closed"
+
+
+def test_trial_out_of_time_does_not_wedge_the_breaker(monkeypatch):
+    fake_openai(monkeypatch, lambda **kwargs: completion())
+    breaker = half_open("openai")
+    with admission.turn_deadline(0):
+        with pytest.raises(admission.DeadlineExceeded):
+            providers.create_chat_completion([], max_tokens=5)
+    assert not breaker.trial_in_flight
+    providers.create_chat_completion([], max_tokens=5)
+    assert breaker.state == "closed"
+
+
+def test_shed_trial_does_not_wedge_the_breaker(monkeypatch):
+    fake_openai(monkeypatch, lambda **kwargs: completion())
+    breaker = half_open("openai")
+    limiter = admission.get_limiter("openai")
+    limiter.max_concurrent, limiter.max_queue, limiter.in_flight = 1, 0, 1
+    with pytest.raises(admission.Overloaded):
+        providers.create_chat_completion([], max_tokens=5)
+    assert not breaker.trial_in_flight
+
+    limiter.in_flight = 0
+    providers.create_chat_completion([], max_tokens=5)
+    assert breaker.state == "closed"
+
+
+def test_post_out_of_time_does_not_wedge_the_breaker(monkeypatch):
+    posted = []
+    monkeypatch.setattr(providers, "get_session", lambda: SimpleNamespace(post=lambda *a, **kw: posted.append(a)))
+    breaker = half_open("deepgram")
+    with admission.turn_deadline(0):
+        with pytest.raises(admission.DeadlineExceeded):
+            providers.post_with_retries("deepgram", "http://stt.invalid/v1/listen", (1, 1))
+    assert not posted
+    assert not breaker.trial_in_flight
+    assert breaker.allow()
+
+
+def test_interrupted_post_frees_the_trial(monkeypatch):
+    def post(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(providers, "get_session", lambda: SimpleNamespace(post=post))
+    breaker = half_open("elevenlabs")
+    with pytest.raises(KeyboardInterrupt):
+        providers.post_with_retries("elevenlabs", "http://tts.invalid/", (1, 1))
+    assert not breaker.trial_in_flight
+
+
+def test_unreachable_vendor_counts_as_failure(monkeypatch):
+    def post(*args, **kwargs):
+        raise requests.ConnectionError("refused")
+
+    monkeypatch.setattr(providers, "get_session", lambda: SimpleNamespace(post=post))
+    monkeypatch.setattr(providers, "backoff_delay", lambda *args: 0)
+    breaker = half_open("deepgram")
+    with pytest.raises(providers.ProviderError):
+        providers.post_with_retries("deepgram", "http://stt.invalid/v1/listen", (1, 1))
+    assert breaker.state == "open"
+
+
+def post_returning(monkeypatch, statuses):
+    """A session whose posts answer with `statuses` in turn; returns the list of posts made"""
+    posted = []
+
+    def post(*args, **kwargs):
+        posted.append(args)
+        return SimpleNamespace(status_code=statuses.pop(0), headers={}, close=lambda: None)
+
+    monkeypatch.setattr(providers, "get_session", lambda: SimpleNamespace(post=post))
+    monkeypatch.setattr(providers, "backoff_delay", lambda *args: 0)
+    return posted
+
+
+def test_retried_call_counts_as_one_failure(monkeypatch):
+    breaker = providers.get_breaker("elevenlabs")
+    retries = providers.get_config().max_retries
+    posted = post_returning(monkeypatch, [503] * (retries + 1))
+    resp = providers.post_with_retries("elevenlabs", "http://tts.invalid/", (1, 1))
+    assert resp.status_code == 503
+    assert len(posted) == retries + 1
+    assert breaker.failures == 1
+    assert breaker.state == "closed"
+
+
+def test_rate_limiting_never_opens_the_circuit(monkeypatch):
+    breaker = providers.get_breaker("elevenlabs")
+    retries = providers.get_config().max_retries
+    post_returning(monkeypatch, [429] * (retries + 1) * breaker.failure_threshold)
+    for _ in range(breaker.failure_threshold):
+        assert providers.post_with_retries("elevenlabs", "http://tts.invalid/", (1, 1)).status_code == 429
+    assert breaker.failures == 0
+    assert breaker.state == "closed"
+
+
+def test_rate_limited_trial_is_released_without_a_failure(monkeypatch):
+    breaker = half_open("elevenlabs")
+    post_returning(monkeypatch, [429] * (providers.get_config().max_retries + 1) + [200])
+    providers.post_with_retries("elevenlabs", "http://tts.invalid/", (1, 1))
+    assert not breaker.trial_in_flight
+    assert breaker.state == "half_open"  # neither re-opened nor closed by a 429
+    providers.post_with_retries("elevenlabs", "http://tts.invalid/", (1, 1))
+    assert breaker.state == "closed"
+
+
+def test_rate_limited_completion_is_not_a_failure(monkeypatch):
+    class RateLimitError(Exception):
+        status_code = 429
+
+    def create(**kwargs):
+        raise RateLimitError("slow down")
+
+    fake_openai(monkeypatch, create)
+    breaker = half_open("openai")
+    with pytest.raises(RateLimitError):
+        providers.create_chat_completion([], max_tokens=5)
+    assert not breaker.trial_in_flight
+    assert breaker.state == "half_open"
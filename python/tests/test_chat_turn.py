@@ -0,0 +1,180 @@
+import io
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import api
+import providers
+
+# Each over streaming.MIN_SENTENCE_CHARS, so each is its own segment
+SENTENCES = ["Thanks for calling me today.", "I have a few minutes before my meeting.",
+             "What is the new program about?"]
+SENTENCE_GAP_SECONDS = 0.3
+
+
+@pytest.fixture
+def client(fake_vendors, monkeypatch):
+    monkeypatch.setenv("SESSION_TURNS_PER_MINUTE", "0")
+    return api.create_app().test_client()
+
+
+def post_audio(client, path, session_id, buffered=True, **fields):
+    data = {"audio": (io.BytesIO(b"\x1aE\xdf\xa3 fake webm"), "recording.webm"),
+            "session_id": session_id, **fields}
+    return client.post(path, data=data, content_type="multipart/form-data", buffered=buffered)
+
+
+def sse_frames(chunks):
+    """Complete SSE frames from a streamed body, as they arrive"""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            frame, buffer = buffer.split("\n\n", 1)
+            yield frame + "\n\n"
+
+
+def sse_events(body: str) -> list:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_turn(client):
+    r = post_audio(client, "/api/chat", "turn-1", async_audio="0")
+    assert r.status_code == 200, r.json
+    assert r.json["transcript"] and r.json["reply"]
+
+    audio = client.get(r.json["audio_url"])
+    assert audio.status_code == 200
+    assert len(audio.data) == 4000
+
+    with api.sessions.conversation("turn-1", lambda: "unused") as messages:
+        assert [m["role"] for m in messages] == ["system", "user", "assistant"]
+        assert messages[-1]["content"] == r.json["reply"]
+
+
+def test_async_audio_turn(client):
+    r = post_audio(client, "/api/chat", "turn-2", async_audio="1")
+    assert r.status_code == 200
+    assert r.json["audio_pending"] is True
+    assert len(client.get(r.json["audio_url"]).data) == 4000  # waits for the background synthesis
+
+
+def test_streamed_turn_sends_each_segment_as_soon_as_its_audio_is_ready(client, monkeypatch):
+    emitted = []  # when the fake LLM wrote each sentence
+
+    def slow_completion(messages, max_tokens, stream=False, model=None):
+        def deltas():
+            for sentence in SENTENCES:
+                emitted.append(time.perf_counter())
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=sentence + " "))])
+                time.sleep(SENTENCE_GAP_SECONDS)
+        return deltas()
+
+    monkeypatch.setattr(providers, "create_chat_completion", slow_completion)
+    r = post_audio(client, "/api/chat/stream", "turn-3", buffered=False)
+    assert r.status_code == 200
+    events, received = [], []
+    for frame in sse_frames(r.response):
+        events.extend(sse_events(frame))
+        received.append(time.perf_counter())
+    names = [name for name, _ in events]
+    assert names == ["transcript", "segment", "segment", "segment", "done"]
+
+    segments = [data for name, data in events if name == "segment"]
+    assert [s["text"] for s in segments] == SENTENCES
+    # Time to first audio: each segment goes out about one (fake, ~20 ms) TTS call after its
+    # sentence was written, while the LLM is still writing the next one
+    for index, sentence_at in enumerate(emitted):
+        assert received[index + 1] - sentence_at < SENTENCE_GAP_SECONDS / 2
+    assert client.get(segments[0]["audio_url"]).status_code == 200
+
+
+def test_streamed_turn_event_sequence(client):
+    r = post_audio(client, "/api/chat/stream", "turn-4")
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    events = sse_events(r.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[0] == "transcript" and names[-1] == "done"
+    assert set(names[1:-1]) == {"segment"}
+
+    segments = [data for name, data in events[1:-1]]
+    done = events[-1][1]
+    assert [s["index"] for s in segments] == list(range(len(segments)))
+    assert done["segments"] == len(segments)
+    assert done["reply"] == " ".join(s["text"] for s in segments)
+    assert all(len(client.get(s["audio_url"]).data) == 4000 for s in segments)
+    with api.sessions.conversation("turn-4", lambda: "unused") as messages:
+        assert messages[-1] == {"role": "assistant", "content": done["reply"]}
+
+
+def test_streamed_turn_reports_a_tts_failure(client, monkeypatch):
+    monkeypatch.setattr(api, "synthesize_speech", lambda text: b"")
+    r = post_audio(client, "/api/chat/stream", "turn-5")
+    assert r.status_code == 200
+    events = sse_events(r.get_data(as_text=True))
+    assert [name for name, _ in events] == ["transcript", "error"]
+    assert events[-1][1] == {"error": "TTS failed", "index": 0}
+    with api.sessions.conversation("turn-5", lambda: "unused") as messages:
+        assert [m["role"] for m in messages] == ["system"]
+
+
+def test_streamed_turn_reports_an_llm_failure(client, monkeypatch):
+    def down(messages, max_tokens, stream=False, model=None):
+        raise providers.ProviderError("openai request failed")
+
+    monkeypatch.setattr(providers, "create_chat_completion", down)
+    r = post_audio(client, "/api/chat/stream", "turn-6")
+    events = sse_events(r.get_data(as_text=True))
+    assert [name for name, _ in events] == ["transcript", "error"]
+    assert events[-1][1] == {"error": "openai request failed"}
+    with api.sessions.conversation("turn-6", lambda: "unused") as messages:
+        assert [m["role"] for m in messages] == ["system"]
+
+
+def test_streamed_turn_rejects_a_request_without_audio_before_admission(client, monkeypatch):
+    def shed(vendors=None):
+        raise AssertionError("admission ran before validation")
+
+    monkeypatch.setattr(api.admission, "admit", shed)
+    r = client.post("/api/chat/stream", data={"session_id": "turn-7"}, content_type="multipart/form-data")
+    assert r.status_code == 400
+    assert r.json == {"error": "No audio file provided"}
+
+
+def test_several_workers_need_a_shared_audio_store(fake_vendors, monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("AUDIO_STORE", "memory")
+    with pytest.raises(RuntimeError, match="AUDIO_STORE=disk"):
+        api.create_app()
+    monkeypatch.setenv("AUDIO_STORE", "disk")
+    api.create_app()
+
+
+def test_follower_gets_a_reply_when_the_leaders_client_goes_away(monkeypatch):
+    def completion(messages, max_tokens, stream=False, model=None):
+        def deltas():
+            for word in ["Tell ", "me ", "more."]:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+                time.sleep(0.05)
+        return deltas()
+
+    monkeypatch.setattr(providers, "create_chat_completion", completion)
+    conversation = [{"role": "system", "content": "You are a donor."}, {"role": "user", "content": "Hi"}]
+    leader = api.stream_llm_reply(conversation)
+    assert next(leader) == "Tell "
+
+    replies = []
+    follower = threading.Thread(target=lambda: replies.append("".join(api.stream_llm_reply(conversation))))
+    follower.start()
+    time.sleep(0.05)
+    leader.close()  # the SSE client disconnected mid-reply
+    follower.join(5)
+    assert replies == ["Tell me more."]
@@ -0,0 +1,105 @@
+import pytest
+
+from context_budget import SUMMARY_PREFIX, ContextManager, count_message_tokens, is_summary
+from session_store import trim_messages
+
+SYSTEM = {"role": "system", "content": "You are Dr. Jennifer Walker, a program officer at a family foundation."}
+
+
+class Summarizer:
+    """Records what it was asked to fold and answers with a short summary"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous_summary: str, messages: list, max_tokens: int) -> str:
+        self.calls.append((previous_summary, list(messages)))
+        return f"Summary {len(self.calls)} of {sum(len(m) for _, m in self.calls)} messages."
+
+
+def turn(n: int) -> list:
+    words = " ".join(f"word{n}" for _ in range(30))
+    return [{"role": "user", "content": f"Trainee {n}: {words}"},
+            {"role": "assistant", "content": f"Donor {n}: {words}"}]
+
+
+def talk(manager: ContextManager, turns: int) -> list:
+    """Run `turns` exchanges the way api.py does: fit the prompt, then append the exchange"""
+    conversation = [SYSTEM]
+    for n in range(turns):
+        user, assistant = turn(n)
+        conversation.append(user)
+        conversation[:] = manager.fit(conversation)
+        assert count_message_tokens(conversation) <= manager.budget_tokens
+        conversation.append(assistant)
+    return conversation
+
+
+def test_short_conversation_is_left_alone():
+    summarizer = Summarizer()
+    manager = ContextManager(budget_tokens=2000, summarizer=summarizer)
+    messages = [SYSTEM, *turn(0)]
+    assert manager.fit(messages) is messages
+    assert summarizer.calls == []
+
+
+@pytest.mark.parametrize("budget_tokens", [300, 450, 800])
+def test_long_conversation_stays_within_the_budget(budget_tokens):
+    summarizer = Summarizer()
+    manager = ContextManager(budget_tokens=budget_tokens, keep_recent_messages=2, summary_max_tokens=40,
+                             summarizer=summarizer)
+    talk(manager, 30)
+    assert summarizer.calls
+    assert manager.stats()["folded_messages"] == sum(len(folded) for _, folded in summarizer.calls)
+
+
+@pytest.mark.parametrize("budget_tokens", range(250, 500, 25))
+def test_kept_history_never_opens_with_an_assistant_reply(budget_tokens):
+    summarizer = Summarizer()
+    manager = ContextManager(budget_tokens=budget_tokens, keep_recent_messages=1, summary_max_tokens=40,
+                             summarizer=summarizer)
+    conversation = [SYSTEM] + [m for n in range(12) for m in turn(n)]
+    conversation.append({"role": "user", "content": "And what would you need from us?"})
+    fitted = manager.fit(conversation)
+    history = [m for m in fitted if m["role"] != "system"]
+    assert history[0]["role"] == "user"
+    for _, folded in summarizer.calls:
+        assert folded[-1]["role"] == "assistant"  # a question is never folded away from its answer
+
+
+def test_summary_is_pinned_after_the_system_prompt():
+    summarizer = Summarizer()
+    manager = ContextManager(budget_tokens=300, keep_recent_messages=2, summary_max_tokens=40,
+                             summarizer=summarizer)
+    conversation = talk(manager, 20)
+    assert len(summarizer.calls) > 1
+
+    assert conversation[0] is SYSTEM
+    assert is_summary(conversation[1])
+    assert sum(is_summary(m) for m in conversation) == 1
+    assert conversation[1]["content"] == SUMMARY_PREFIX + f"Summary {len(summarizer.calls)} of " \
+        f"{manager.stats()['folded_messages']} messages."
+    # Each fold builds on the previous summary rather than starting over
+    for n, (previous, _) in enumerate(summarizer.calls[1:], start=1):
+        assert previous.startswith(f"Summary {n} of ")
+
+
+def test_session_trim_keeps_the_summary():
+    summarizer = Summarizer()
+    manager = ContextManager(budget_tokens=300, keep_recent_messages=2, summary_max_tokens=40,
+                             summarizer=summarizer)
+    conversation = talk(manager, 10)
+    trimmed = trim_messages(conversation, max_messages=4, max_chars=10_000)
+    assert trimmed[:2] == conversation[:2]
+    assert trimmed[2:] == conversation[-2:]
+
+
+def test_failed_summary_drops_old_turns_but_keeps_the_reply_going():
+    def down(previous_summary, messages, max_tokens):
+        raise RuntimeError("openai request failed")
+
+    manager = ContextManager(budget_tokens=300, keep_recent_messages=2, summary_max_tokens=40, summarizer=down)
+    conversation = talk(manager, 10)
+    assert conversation[0] is SYSTEM
+    assert not any(is_summary(m) for m in conversation)
+    assert manager.stats()["summary_failures"] >= 1
@@ -0,0 +1,164 @@
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")  # database.py builds its default engine on import
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from db_session_store import DatabaseSessionStore  # noqa: E402  (puts the project root on sys.path)
+from database import Base  # noqa: E402
+from models import ConversationMessage  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def store(session_factory, **kwargs) -> DatabaseSessionStore:
+    options = {"flush_interval_seconds": 0.05}
+    options.update(kwargs)
+    return DatabaseSessionStore(session_factory=session_factory, **options)
+
+
+def take_turn(s: DatabaseSessionStore, session_id: str, user: str, reply: str):
+    with s.conversation(session_id, lambda: "You are a donor.") as messages:
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": reply})
+
+
+def stored_messages(session_factory) -> int:
+    db = session_factory()
+    try:
+        return db.query(ConversationMessage).count()
+    finally:
+        db.close()
+
+
+def test_round_trip_between_two_workers(session_factory):
+    first, second = store(session_factory), store(session_factory)
+    take_turn(first, "s1", "Hello", "Hi, who is this?")
+    first.flush()
+
+    take_turn(second, "s1", "I'm from the aquarium", "Go on.")
+    second.flush()
+
+    with first.conversation("s1", lambda: "unused") as messages:
+        assert [m["content"] for m in messages] == [
+            "You are a donor.", "Hello", "Hi, who is this?", "I'm from the aquarium", "Go on.",
+        ]
+    assert stored_messages(session_factory) == 4
+
+
+def contents(s: DatabaseSessionStore, session_id: str) -> list:
+    with s.conversation(session_id, lambda: "unused") as messages:
+        return [m["content"] for m in messages]
+
+
+def test_turns_taken_on_two_workers_before_either_flushes_are_both_kept(session_factory):
+    first, second = store(session_factory, flush_interval_seconds=3600), store(session_factory, flush_interval_seconds=3600)
+    take_turn(first, "s1", "Hello", "Hi.")
+    take_turn(second, "s1", "Anyone there?", "Yes.")
+    first.flush()
+    second.flush()
+
+    assert first.stats()["flush_errors"] == second.stats()["flush_errors"] == 0
+    assert stored_messages(session_factory) == 4
+    expected = ["You are a donor.", "Hello", "Hi.", "Anyone there?", "Yes."]
+    assert contents(store(session_factory), "s1") == expected
+    assert contents(second, "s1") == expected  # its cache was behind the row, so it reloaded
+
+
+def test_queued_turn_is_not_reloaded_over(session_factory):
+    first, second = store(session_factory, flush_interval_seconds=3600), store(session_factory, flush_interval_seconds=3600)
+    take_turn(first, "s1", "Hello", "Hi.")
+    first.flush()
+    assert contents(second, "s1")[1:] == ["Hello", "Hi."]
+
+    take_turn(first, "s1", "Still queued", "Noted.")  # not flushed yet
+    take_turn(second, "s1", "From the other worker", "Okay.")
+    second.flush()
+    # first sees the row ahead of its cache: it writes its own queue, then reloads
+    assert contents(first, "s1")[1:] == ["Hello", "Hi.", "From the other worker", "Okay.", "Still queued", "Noted."]
+    assert stored_messages(session_factory) == 6
+
+
+def test_reload_starts_at_the_trimmed_window(session_factory):
+    s = store(session_factory, max_history_messages=3)
+    for n in range(3):
+        take_turn(s, "s1", f"Question {n}", f"Answer {n}")
+        s.flush()
+    assert contents(store(session_factory), "s1") == ["You are a donor.", "Question 2", "Answer 2"]
+    assert stored_messages(session_factory) == 6
+
+
+def test_failed_write_is_retried_not_dropped(session_factory, monkeypatch):
+    s = store(session_factory, flush_interval_seconds=3600)
+    take_turn(s, "s1", "Hello", "Hi.")
+    apply = s._apply
+
+    def failing_apply(db, writes):
+        raise SQLAlchemyError("database is locked")
+
+    monkeypatch.setattr(s, "_apply", failing_apply)
+    s.flush()
+    assert stored_messages(session_factory) == 0
+    assert s.stats()["pending_messages"] == 2
+
+    monkeypatch.setattr(s, "_apply", apply)
+    s.flush()
+    assert stored_messages(session_factory) == 2
+    assert s.stats()["flush_errors"] == 0
+
+
+def test_reset_removes_the_session_for_everyone(session_factory):
+    first, second = store(session_factory), store(session_factory)
+    take_turn(first, "s1", "Hello", "Hi.")
+    first.flush()
+    second.reset("s1")
+    with first.conversation("s1", lambda: "Fresh prompt.") as messages:
+        assert messages == [{"role": "system", "content": "Fresh prompt."}]
+
+
+def test_writer_flushes_in_the_background(session_factory):
+    s = store(session_factory)
+    assert s.thread is None  # nothing starts until the first write
+    take_turn(s, "s1", "Hello", "Hi.")
+    deadline = time.monotonic() + 5
+    while stored_messages(session_factory) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert stored_messages(session_factory) == 2
+
+
+def test_close_flushes_queued_turns(session_factory):
+    s = store(session_factory, flush_interval_seconds=3600)
+    take_turn(s, "s1", "Hello", "Hi.")
+    assert stored_messages(session_factory) == 0
+    s.close()
+    assert stored_messages(session_factory) == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_forked_worker_flushes_its_own_turns(session_factory):
+    s = store(session_factory)  # created before the fork, like a gunicorn --preload master
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            take_turn(s, "child", "Hello", "Hi.")
+            deadline = time.monotonic() + 5
+            while s.stats()["flushes"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            code = 0 if s.stats()["flushed_messages"] == 2 else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert stored_messages(session_factory) == 2
@@ -0,0 +1,133 @@
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+import api
+import providers
+
+REPLY = "Hi there, what is your ask?"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    counts = {"stt": 0, "llm": 0}
+
+    def transcribe(audio_bytes, content_type):
+        counts["stt"] += 1
+        time.sleep(0.2)
+        return "" if audio_bytes == b"silence" else "Hello doctor"
+
+    def completion(messages, max_tokens, stream=False, model=None):
+        counts["llm"] += 1
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=REPLY))])])
+
+    monkeypatch.setattr(api, "transcribe_with_deepgram", transcribe)
+    monkeypatch.setattr(providers, "create_chat_completion", completion)
+    monkeypatch.setattr(providers, "synthesize_to_bytes", lambda text, voice_id=None, **kw: b"ID3" + text.encode())
+    return counts
+
+
+@pytest.fixture
+def client(calls):
+    return api.create_app().test_client()
+
+
+def post(client, key, session_id="s1", audio=b"speech"):
+    return client.post("/api/chat", data={"audio": (io.BytesIO(audio), "r.webm"), "session_id": session_id},
+                       headers={"Idempotency-Key": key}, content_type="multipart/form-data")
+
+
+def history(session_id: str) -> list:
+    with api.sessions.conversation(session_id, lambda: "unused") as messages:
+        return [m["role"] for m in messages]
+
+
+def test_retry_after_the_turn_replays_it(client, calls):
+    first = post(client, "k1")
+    retry = post(client, "k1")
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json == first.json
+    assert calls == {"stt": 1, "llm": 1}
+    assert history("s1") == ["system", "user", "assistant"]
+
+
+def test_retry_during_the_turn_waits_for_it(client, calls):
+    results = {}
+    original = threading.Thread(target=lambda: results.setdefault("first", post(client, "k1")))
+    original.start()
+    time.sleep(0.05)
+    retry = post(client, "k1")
+    original.join()
+    assert retry.json == results["first"].json
+    assert calls["llm"] == 1
+
+
+def test_keys_are_scoped_to_the_session(client, calls):
+    post(client, "k1", session_id="s1")
+    assert "Idempotent-Replayed" not in post(client, "k1", session_id="s2").headers
+    assert calls["llm"] == 2
+
+
+def test_failed_turn_runs_again(client, calls):
+    assert post(client, "k1", audio=b"silence").status_code == 500
+    retry = post(client, "k1")
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+def test_replay_skips_admission_and_the_session_rate(client, calls, monkeypatch):
+    first = post(client, "k1")
+    limiter = admission.get_limiter("openai")
+    monkeypatch.setattr(limiter, "saturated", lambda: True)
+    monkeypatch.setattr(admission.get_session_limiter(), "check", lambda session_id: 30)
+
+    retry = post(client, "k1")
+    assert retry.status_code == 200
+    assert retry.json == first.json
+    assert post(client, "k2").status_code == 503  # a new turn is still shed
+
+
+def test_retry_that_outlasts_the_turn_gets_409(client, calls, monkeypatch):
+    monkeypatch.setattr(admission.get_config(), "turn_deadline_seconds", 0.05)
+    results = {}
+    original = threading.Thread(target=lambda: results.setdefault("first", post(client, "k1")))
+    original.start()
+    time.sleep(0.02)
+    retry = post(client, "k1")
+    original.join()
+    assert retry.status_code == 409
+    assert retry.headers["Retry-After"] == "1"
+
+
+def test_text_turns_take_keys_too(client, calls):
+    body = {"message": "hi", "session_id": "s3", "idempotency_key": "t1"}
+    first, retry = client.post("/api/chat/text", json=body), client.post("/api/chat/text", json=body)
+    assert retry.json == first.json
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert calls["llm"] == 1
+
+
+def test_retry_after_a_tts_failure_adds_one_exchange(client, calls, monkeypatch):
+    tts_up = False
+    monkeypatch.setattr(api, "synthesize_speech", lambda text: b"ID3" + text.encode() if tts_up else b"")
+    assert post(client, "k1").status_code == 500
+    assert history("s1") == ["system"]
+
+    tts_up = True
+    assert post(client, "k1").status_code == 200
+    assert history("s1") == ["system", "user", "assistant"]
+
+
+def test_failed_llm_call_leaves_no_user_message(client, calls, monkeypatch):
+    def down(messages, max_tokens, stream=False, model=None):
+        raise providers.ProviderError("openai request failed")
+
+    monkeypatch.setattr(providers, "create_chat_completion", down)
+    body = {"message": "hi", "session_id": "s4", "idempotency_key": "t1"}
+    assert client.post("/api/chat/text", json=body).status_code == 500
+    assert history("s4") == ["system"]
@@ -0,0 +1,42 @@
+import pytest
+
+from metrics import Histogram, Registry
+
+
+def test_quantiles_interpolate_within_buckets():
+    histogram = Histogram(buckets=(0.1, 0.2, 0.5))
+    for value in [0.05] * 50 + [0.15] * 45 + [0.3] * 5:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(0.1)
+    assert histogram.quantile(0.95) == pytest.approx(0.2)
+    assert 0.2 < histogram.quantile(0.99) < 0.5
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_timed_records_the_duration_and_any_error():
+    registry = Registry()
+    with registry.timed("stt"):
+        pass
+    with pytest.raises(RuntimeError):
+        with registry.timed("stt"):
+            raise RuntimeError("deepgram down")
+    stats = registry.summary()["stt"]
+    assert (stats["count"], stats["errors"]) == (2, 1)
+
+
+def test_prometheus_buckets_are_cumulative():
+    registry = Registry()
+    for seconds in (0.003, 0.02, 0.02, 45):
+        registry.observe("llm", seconds)
+    registry.record_request("/api/chat", 200)
+    registry.register_gauge("pitch_sessions", "Live sessions", lambda: {"memory": 3})
+    registry.register_gauge("pitch_broken", "Raises", lambda: 1 / 0)
+
+    text = registry.render_prometheus()
+    assert 'pitch_stage_duration_seconds_bucket{stage="llm",le="0.005"} 1' in text
+    assert 'pitch_stage_duration_seconds_bucket{stage="llm",le="0.025"} 3' in text
+    assert 'pitch_stage_duration_seconds_bucket{stage="llm",le="30.0"} 3' in text
+    assert 'pitch_stage_duration_seconds_bucket{stage="llm",le="+Inf"} 4' in text
+    assert 'pitch_requests_total{route="/api/chat",status="200"} 1' in text
+    assert 'pitch_sessions{key="memory"} 3' in text
+    assert "pitch_broken" not in text  # a failing gauge is skipped, not the whole scrape
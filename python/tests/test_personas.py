@@ -0,0 +1,33 @@
+import json
+
+import personas
+from personas import PersonaRegistry
+
+
+def registry(tmp_path) -> PersonaRegistry:
+    (tmp_path / "template1.json").write_text(json.dumps({"name": "Dr. Walker", "prompt": "You are a donor."}))
+    return PersonaRegistry(tmp_path, reload_check_seconds=0)
+
+
+def test_unknown_keys_fall_back_to_the_default(tmp_path):
+    r = registry(tmp_path)
+    assert r.get("nope").key == "template1"
+    assert r.get(None).key == "template1"
+
+
+def test_unknown_keys_are_bounded(tmp_path):
+    r = registry(tmp_path)
+    for i in range(personas.MAX_UNKNOWN_KEYS * 5):
+        r.get(f"attacker-{i}-" + "x" * 10000)
+    assert len(r.unknown_keys) == personas.MAX_UNKNOWN_KEYS
+    assert all(len(key) <= personas.MAX_LOGGED_KEY_CHARS for key in r.unknown_keys)
+    assert r.stats()["unknown_lookups"] == personas.MAX_UNKNOWN_KEYS * 5
+
+
+def test_prompt_tokens_are_counted_on_first_use(tmp_path, monkeypatch):
+    counted = []
+    monkeypatch.setattr(personas, "count_text_tokens", lambda text: counted.append(text) or 4)
+    r = registry(tmp_path)
+    assert not counted
+    assert r.list()[0]["prompt_tokens"] == 4
+    assert counted == ["You are a donor."]
@@ -0,0 +1,85 @@
+import logging
+import threading
+
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from playback import WRITE_FRAMES, StreamPlayer  # noqa: E402
+
+
+class FakeOutput:
+    """Stands in for the PyAudio device: records what would have been played"""
+
+    def __init__(self):
+        self.written = []
+        self.opened = 0
+        self.closed = False
+
+    def open(self, **kwargs):
+        self.opened += 1
+        return self
+
+    def write(self, data):
+        self.written.append(data)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_chunks_are_played_in_whole_samples():
+    output = FakeOutput()
+    first_audio = []
+    player = StreamPlayer(output)
+    player.play(iter([b"\x01\x02\x03", b"\x04" * (WRITE_FRAMES * 4 + 1)]), on_first_audio=lambda: first_audio.append(1))
+    assert player.wait(2)
+
+    played = b"".join(output.written)
+    assert played == (b"\x01\x02\x03" + b"\x04" * (WRITE_FRAMES * 4 + 1))
+    assert all(len(data) % 2 == 0 and len(data) <= WRITE_FRAMES * 2 for data in output.written)
+    assert player.bytes_played == len(played)
+    assert (output.opened, first_audio, output.closed) == (1, [1], True)
+
+
+def test_empty_reply_is_logged_not_printed(caplog, capsys):
+    player = StreamPlayer(FakeOutput())
+    with caplog.at_level(logging.WARNING, logger="playback"):
+        player.play(iter([]))
+        assert player.wait(2)
+    assert "No audio to play" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_stop_closes_the_tts_stream():
+    release = threading.Event()
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            yield b"\x00\x00" * 10
+            release.wait(2)
+            yield b"\x00\x00" * 10
+        finally:
+            closed.set()
+
+    player = StreamPlayer(FakeOutput())
+    player.play(chunks())
+    player.stop()
+    release.set()
+    assert player.wait(2)
+    assert closed.is_set()
+
+
+def test_broken_stream_is_logged_and_playback_ends(caplog):
+    def chunks():
+        yield b"\x00\x00" * 10
+        raise ConnectionError("TTS stream broke off")
+
+    player = StreamPlayer(FakeOutput())
+    with caplog.at_level(logging.ERROR, logger="playback"):
+        player.play(chunks())
+        assert player.wait(2)
+    assert "Playback failed" in caplog.text
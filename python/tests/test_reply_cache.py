@@ -0,0 +1,92 @@
+import pytest
+
+from reply_cache import ReplyCache, normalize_utterance, similarity, trigrams
+
+OPENER = "Hi Dr. Walker, I'm calling from the City Aquarium about our new education program."
+
+
+def conversation(utterance: str, prompt: str = "You are Dr. Jennifer Walker.") -> list:
+    return [{"role": "system", "content": prompt}, {"role": "user", "content": utterance}]
+
+
+def filled(cache: ReplyCache, persona: str = "walker", utterance: str = OPENER, prompt: str = None) -> ReplyCache:
+    messages = conversation(utterance) if prompt is None else conversation(utterance, prompt)
+    for n in range(cache.variants):
+        cache.put(persona, messages, f"Reply {n}", seconds=1.0)
+    return cache
+
+
+def test_exact_match_after_normalization_is_a_hit():
+    cache = filled(ReplyCache(variants=2))
+    reply = cache.get("walker", conversation("hi dr walker im calling from the city aquarium about our new education program"))
+    assert reply is None  # apostrophes are kept, so "im" is a different word from "i'm"
+    assert cache.get("walker", conversation("  HI Dr. Walker, I'm calling from the city aquarium... about our new "
+                                            "education program!")) in {"Reply 0", "Reply 1"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["seconds_saved"] == 1.0
+
+
+def test_entry_answers_only_once_it_has_all_its_variants():
+    cache = ReplyCache(variants=3)
+    cache.put("walker", conversation(OPENER), "Reply 0", seconds=1.0)
+    cache.put("walker", conversation(OPENER), "Reply 0", seconds=1.0)  # duplicates don't count
+    assert cache.get("walker", conversation(OPENER)) is None
+    assert cache.stats()["filling"] == 1
+
+
+def test_trigram_near_match_is_a_fuzzy_hit():
+    cache = filled(ReplyCache(variants=1, min_similarity=0.8))
+    near = "Hi Dr Walker, I am calling from the City Aquarium about our new education program."
+    assert similarity(trigrams(normalize_utterance(near)), trigrams(normalize_utterance(OPENER))) >= 0.8
+    assert cache.get("walker", conversation(near)) == "Reply 0"
+    assert cache.stats()["fuzzy_hits"] == 1
+
+
+def test_utterance_below_the_threshold_misses():
+    cache = filled(ReplyCache(variants=1, min_similarity=0.8))
+    other = "Hello, could you tell me about your giving priorities this year?"
+    assert similarity(trigrams(normalize_utterance(other)), trigrams(normalize_utterance(OPENER))) < 0.8
+    assert cache.get("walker", conversation(other)) is None
+    assert cache.stats()["hits"] == 0
+
+
+def test_exact_only_by_default():
+    cache = filled(ReplyCache(variants=1))
+    assert cache.get("walker", conversation(OPENER.replace("new", "brand new"))) is None
+
+
+@pytest.mark.parametrize("min_similarity", [1.0, 0.5])
+def test_replies_never_cross_personas(min_similarity):
+    cache = filled(ReplyCache(variants=1, min_similarity=min_similarity), persona="walker")
+    assert cache.get("chen", conversation(OPENER)) is None
+    # Same key but a different persona prompt (e.g. after an edit) is a different conversation too
+    assert cache.get("walker", conversation(OPENER, prompt="You are Mr. David Chen.")) is None
+    assert cache.get("walker", conversation(OPENER)) == "Reply 0"
+
+
+def test_case_studies_sharing_a_persona_key_are_isolated_by_their_prompt():
+    cache = ReplyCache(variants=1)
+    filled(cache, persona="template1", prompt="Case study: aquarium")
+    filled(cache, persona="template1", prompt="Case study: food bank")
+    cache.put("template1", conversation(OPENER, "Case study: food bank"), "Food bank reply", seconds=1.0)
+    assert cache.get("template1", conversation(OPENER, "Case study: aquarium")) == "Reply 0"
+    assert cache.get("template1", conversation(OPENER, "Case study: food bank")) == "Reply 0"
+    assert cache.stats()["entries"] == 2
+
+
+def test_later_turns_are_not_cached():
+    cache = ReplyCache(variants=1, max_turns=1)
+    messages = conversation(OPENER) + [{"role": "assistant", "content": "Go on."},
+                                       {"role": "user", "content": "We teach kids about oceans."}]
+    cache.put("walker", messages, "Interesting.", seconds=1.0)
+    assert cache.get("walker", messages) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_utterance_is_evicted():
+    cache = ReplyCache(variants=1, max_entries=2)
+    for utterance in ("First opener here", "Second opener here", "Third opener here"):
+        filled(cache, utterance=utterance)
+    assert cache.get("walker", conversation("First opener here")) is None
+    assert cache.get("walker", conversation("Third opener here")) == "Reply 0"
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,146 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import session_store
+from session_store import SessionStore, create_session_store, trim_messages
+
+SYSTEM = {"role": "system", "content": "You are Dr. Jennifer Walker."}
+SUMMARY = {"role": "system", "content": "Summary of the conversation so far: they asked about funding."}
+
+
+def prompt():
+    return SYSTEM["content"]
+
+
+def exchange(n: int, size: int = 10) -> list:
+    return [{"role": "user", "content": f"q{n}".ljust(size, ".")},
+            {"role": "assistant", "content": f"a{n}".ljust(size, ".")}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """session_store's monotonic clock, moved by hand"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(session_store, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_idle_session_expires(clock):
+    store = SessionStore(idle_ttl_seconds=60)
+    with store.conversation("s1", prompt) as messages:
+        messages.extend(exchange(0))
+
+    clock.value += 59
+    with store.conversation("s1", prompt) as messages:
+        assert len(messages) == 3  # still live, and the visit restarts its clock
+
+    clock.value += 61
+    with store.conversation("s1", prompt) as messages:
+        assert messages == [SYSTEM]
+    assert store.stats()["expired"] == 1
+    assert store.stats()["created"] == 2
+
+
+def test_expired_sessions_are_swept_when_others_are_used(clock):
+    store = SessionStore(idle_ttl_seconds=60)
+    store.get("idle", prompt)
+    clock.value += 30
+    store.get("busy", prompt)
+    clock.value += 31
+    store.get("busy", prompt)
+    assert list(store.sessions) == ["busy"]
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = SessionStore(max_sessions=2)
+    for session_id in ("a", "b"):
+        store.get(session_id, prompt)
+        clock.value += 1
+    store.get("a", prompt)  # "b" is now the least recently used
+    store.get("c", prompt)
+    assert list(store.sessions) == ["a", "c"]
+    assert store.stats()["evicted"] == 1
+
+
+def test_trim_keeps_system_messages_and_the_newest_turns():
+    messages = [SYSTEM, SUMMARY] + [m for n in range(5) for m in exchange(n)]
+    trimmed = trim_messages(messages, max_messages=6, max_chars=10_000)
+    assert trimmed == [SYSTEM, SUMMARY] + exchange(3) + exchange(4)
+
+
+def test_trim_by_characters():
+    messages = [SYSTEM] + [m for n in range(5) for m in exchange(n, size=100)]
+    trimmed = trim_messages(messages, max_messages=100, max_chars=450)
+    assert trimmed == [SYSTEM] + exchange(3, size=100) + exchange(4, size=100)
+
+
+def test_trim_never_opens_on_an_assistant_reply():
+    messages = [SYSTEM] + [m for n in range(5) for m in exchange(n)] + [{"role": "user", "content": "q5"}]
+    trimmed = trim_messages(messages, max_messages=5, max_chars=10_000)
+    assert [m["role"] for m in trimmed] == ["system", "user", "assistant", "user"]
+
+    # An opening greeting with nothing dropped before it stays
+    greeting = [SYSTEM, {"role": "assistant", "content": "Hello."}, {"role": "user", "content": "Hi."}]
+    assert trim_messages(greeting, max_messages=5, max_chars=10_000) == greeting
+
+
+def test_a_single_oversized_message_is_still_kept():
+    messages = [SYSTEM, {"role": "user", "content": "x" * 1000}]
+    assert trim_messages(messages, max_messages=10, max_chars=100) == messages
+
+
+def test_conversation_is_trimmed_and_measured():
+    store = SessionStore(max_history_messages=5)
+    with store.conversation("s1", prompt) as messages:
+        messages.extend(m for n in range(4) for m in exchange(n))
+    with store.conversation("s1", prompt) as messages:
+        assert messages == [SYSTEM] + exchange(2) + exchange(3)
+    stats = store.stats()
+    assert stats["messages"] == 5
+    assert stats["memory_bytes"] == len(SYSTEM["content"]) + 4 * 10
+
+
+def test_turns_on_one_session_run_one_at_a_time():
+    store = SessionStore()
+    inside, overlapped = [], []
+
+    def turn(n):
+        with store.conversation("s1", prompt) as messages:
+            inside.append(n)
+            overlapped.append(len(inside) > 1)
+            time.sleep(0.01)
+            messages.extend(exchange(n))
+            inside.remove(n)
+
+    threads = [threading.Thread(target=turn, args=(n,)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlapped == [False] * 5
+    with store.conversation("s1", prompt) as messages:
+        assert len(messages) == 11
+
+
+def test_reset_starts_the_session_over():
+    store = SessionStore()
+    with store.conversation("s1", prompt) as messages:
+        messages.extend(exchange(0))
+    store.reset("s1")
+    with store.conversation("s1", prompt) as messages:
+        assert messages == [SYSTEM]
+
+
+def test_store_is_configured_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SESSION_MAX", "7")
+    monkeypatch.setenv("SESSION_IDLE_TTL_SECONDS", "90")
+    monkeypatch.setenv("SESSION_MAX_HISTORY_MESSAGES", "12")
+    store = create_session_store()
+    assert (store.max_sessions, store.idle_ttl_seconds, store.max_history_messages) == (7, 90, 12)
+
+    monkeypatch.setenv("SESSION_STORE", "redis")
+    with pytest.raises(ValueError):
+        create_session_store()
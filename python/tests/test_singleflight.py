@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+import admission
+from singleflight import SingleFlight
+
+
+def start_leader(flights: SingleFlight, key: str, release: threading.Event, result="reply"):
+    flight, leader = flights.join(key)
+    assert leader
+
+    def run():
+        release.wait(5)
+        flights.finish(key, flight, result=result)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_followers_share_the_leaders_result():
+    flights, release = SingleFlight("llm"), threading.Event()
+    leader = start_leader(flights, "k", release)
+    flight, is_leader = flights.join("k")
+    assert not is_leader
+    release.set()
+    assert flight.wait() == "reply"
+    leader.join()
+    assert flights.stats()["coalesced"] == 1
+
+
+def test_follower_gives_up_at_its_own_deadline():
+    flights, release = SingleFlight("llm"), threading.Event()
+    leader = start_leader(flights, "k", release)
+    flight, _ = flights.join("k")
+    started = time.monotonic()
+    with admission.turn_deadline(0.1):
+        with pytest.raises(admission.DeadlineExceeded):
+            flight.wait()
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join()
+    assert flight.wait() == "reply"  # the leader finished regardless
+
+
+def test_do_shares_errors():
+    flights, release = SingleFlight("tts"), threading.Event()
+    flight, _ = flights.join("k")
+    errors = []
+
+    def follower():
+        try:
+            flights.do("k", lambda: b"never called")
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    time.sleep(0.05)
+    flights.finish("k", flight, error=RuntimeError("vendor down"))
+    thread.join(5)
+    assert [str(e) for e in errors] == ["vendor down"]
+
+
+def test_followers_call_again_when_the_leader_is_abandoned():
+    flights = SingleFlight("tts")
+    flight, _ = flights.join("k")
+    results, calls = [], []
+
+    def follower():
+        results.append(flights.do("k", lambda: calls.append(1) or b"audio"))
+
+    threads = [threading.Thread(target=follower) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    flights.abandon("k", flight)  # e.g. the leader's client closed the tab
+    for thread in threads:
+        thread.join(5)
+    assert results == [b"audio"] * 3
+    assert 1 <= len(calls) <= 3
+    assert flights.stats()["abandoned"] == 1
+    assert flights.stats()["shared_errors"] == 0
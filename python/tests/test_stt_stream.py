@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+from websockets.sync.server import serve
+
+import admission
+import providers
+from fake_stt_server import DEFAULT_TRANSCRIPT, make_handler
+from stt_stream import DeepgramStream
+
+
+@pytest.fixture
+def fake_stt(monkeypatch):
+    """fake_stt_server.py on a free port, with DEEPGRAM_BASE_URL pointing at it"""
+    server = serve(make_handler(DEFAULT_TRANSCRIPT, finalize_delay=0.01), "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("DEEPGRAM_BASE_URL", f"http://127.0.0.1:{server.socket.getsockname()[1]}")
+    yield server
+    server.shutdown()
+    thread.join(5)
+
+
+def half_open(vendor: str) -> providers.CircuitBreaker:
+    breaker = providers.get_breaker(vendor)
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+    return breaker
+
+
+def test_streams_partials_and_final_transcript(fake_stt):
+    partials = []
+    stream = DeepgramStream(on_partial=partials.append)
+    for _ in DEFAULT_TRANSCRIPT.split():
+        stream.send(b"\x00" * 320)
+    assert stream.finish() == DEFAULT_TRANSCRIPT
+    assert partials and DEFAULT_TRANSCRIPT.startswith(partials[0])
+    assert providers.get_breaker("deepgram").state == "closed"
+    assert admission.get_limiter("deepgram").in_flight == 0
+
+
+def test_holds_a_deepgram_slot_while_open(fake_stt):
+    limiter = admission.get_limiter("deepgram")
+    limiter.max_concurrent, limiter.max_queue = 1, 0
+    stream = DeepgramStream()
+    assert limiter.in_flight == 1
+    with pytest.raises(admission.Overloaded):
+        DeepgramStream()
+    stream.close()
+    assert limiter.in_flight == 0
+    DeepgramStream().close()
+
+
+def test_abandoned_trial_settles_the_breaker(fake_stt):
+    breaker = half_open("deepgram")
+    stream = DeepgramStream()
+    assert breaker.trial_in_flight
+    stream.send(b"\x00" * 320)
+    stream.close()  # the browser hung up before finalize
+    stream.close()
+    assert breaker.state == "closed"
+    assert not breaker.trial_in_flight
+    assert admission.get_limiter("deepgram").in_flight == 0
+
+
+def test_unreachable_server_frees_the_slot_and_counts_a_failure(monkeypatch):
+    monkeypatch.setenv("DEEPGRAM_BASE_URL", "http://127.0.0.1:9")
+    breaker = half_open("deepgram")
+    with pytest.raises(providers.ProviderError):
+        DeepgramStream()
+    assert breaker.state == "open"
+    assert not breaker.trial_in_flight
+    assert admission.get_limiter("deepgram").in_flight == 0
+
+
+def test_open_circuit_fails_fast():
+    breaker = providers.get_breaker("deepgram")
+    breaker.opened_at = time.monotonic()
+    with pytest.raises(providers.CircuitOpenError):
+        DeepgramStream()
+    assert admission.get_limiter("deepgram").in_flight == 0
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from tts_backends import EspeakBackend, HedgedTTS, TTSBackend, audio_mimetype
+
+BUDGET_SECONDS = 0.1
+
+
+class FakeBackend(TTSBackend):
+    """Starts streaming after `delay` seconds (unless cancelled first) and returns `audio`"""
+
+    def __init__(self, name: str, delay: float, audio: bytes):
+        self.name = name
+        self.delay = delay
+        self.audio = audio
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def synthesize(self, text: str, on_first_byte=None, cancel=None) -> bytes:
+        self.calls += 1
+        if cancel is not None and cancel.wait(self.delay):
+            self.cancelled.set()
+            return b""
+        if cancel is None:
+            time.sleep(self.delay)
+        if on_first_byte:
+            on_first_byte()
+        return self.audio
+
+
+def hedged(primary, fallback) -> HedgedTTS:
+    return HedgedTTS(primary, fallback, budget_seconds=BUDGET_SECONDS)
+
+
+def test_fast_primary_wins_without_starting_the_fallback():
+    primary = FakeBackend("elevenlabs", 0, b"ID3 primary")
+    fallback = FakeBackend("espeak", 0, b"RIFF fallback")
+    tts = hedged(primary, fallback)
+    assert tts.synthesize("Hello.") == b"ID3 primary"
+    assert fallback.calls == 0
+    assert tts.stats()["hedged"] == 0
+    assert tts.stats()["elevenlabs_wins"] == 1
+
+
+def test_slow_primary_is_hedged_and_cancelled_when_the_fallback_wins():
+    primary = FakeBackend("elevenlabs", 5, b"ID3 primary")
+    fallback = FakeBackend("espeak", 0.05, b"RIFF fallback")
+    tts = hedged(primary, fallback)
+    started = time.monotonic()
+    assert tts.synthesize("Hello.") == b"RIFF fallback"
+    assert time.monotonic() - started < 1
+    assert primary.cancelled.wait(1)
+    stats = tts.stats()
+    assert (stats["hedged"], stats["espeak_wins"], stats["cancelled"]) == (1, 1, 1)
+
+
+def test_fallback_is_cancelled_when_the_hedged_primary_finishes_first():
+    primary = FakeBackend("elevenlabs", BUDGET_SECONDS * 2, b"ID3 primary")
+    fallback = FakeBackend("espeak", 5, b"RIFF fallback")
+    tts = hedged(primary, fallback)
+    assert tts.synthesize("Hello.") == b"ID3 primary"
+    assert fallback.cancelled.wait(1)
+    assert tts.stats()["cancelled"] == 1
+
+
+def test_failed_primary_fails_over_without_waiting_for_the_budget():
+    primary = FakeBackend("elevenlabs", 0, b"")
+    fallback = FakeBackend("espeak", 0, b"RIFF fallback")
+    tts = HedgedTTS(primary, fallback, budget_seconds=5)
+    started = time.monotonic()
+    assert tts.synthesize("Hello.") == b"RIFF fallback"
+    assert time.monotonic() - started < 1
+    assert tts.stats()["failovers"] == 1
+
+
+def test_all_backends_failing_returns_nothing():
+    tts = hedged(FakeBackend("elevenlabs", 0, b""), FakeBackend("espeak", 0, b""))
+    assert tts.synthesize("Hello.") == b""
+    assert tts.stats()["lost"] == 1
+
+
+def test_queued_loser_never_starts():
+    primary = FakeBackend("elevenlabs", 0.3, b"ID3 primary")
+    fallback = FakeBackend("espeak", 5, b"RIFF fallback")
+    tts = HedgedTTS(primary, fallback, budget_seconds=BUDGET_SECONDS, fallback_workers=1)
+    blocker = threading.Event()
+    tts.fallback_pool.submit(blocker.wait, 5)  # the only fallback worker is busy
+    assert tts.synthesize("Hello.") == b"ID3 primary"
+    blocker.set()
+    tts.fallback_pool.shutdown(wait=True)
+    assert fallback.calls == 0
+
+
+@pytest.fixture
+def fake_espeak(tmp_path):
+    """An espeak stand-in: reads the text, waits $DELAY seconds, writes a WAV header"""
+    script = tmp_path / "espeak"
+    script.write_text('#!/bin/sh\ncat > /dev/null\nsleep "${DELAY:-0}"\nprintf "RIFF....WAVE"\n')
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_espeak_audio_is_served_as_wav(fake_espeak):
+    audio = EspeakBackend(fake_espeak).synthesize("Hello.")
+    assert audio == b"RIFF....WAVE"
+    assert audio_mimetype(audio) == "audio/wav"
+
+
+def test_cancelled_espeak_process_is_killed(fake_espeak, monkeypatch):
+    monkeypatch.setenv("DELAY", "5")
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    started = time.monotonic()
+    assert EspeakBackend(fake_espeak).synthesize("Hello.", cancel=cancel) == b""
+    assert time.monotonic() - started < 2
@@ -0,0 +1,144 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import providers
+from tts_cache import TTSCache, cache_key, get_tts_cache
+
+VOICE = "21m00Tcm4TlvDq8ikWAM"
+MODEL = "eleven_turbo_v2"
+SETTINGS = {"stability": 0.5, "similarity_boost": 0.75}
+
+
+def test_key_is_stable_across_releases():
+    # Changing the key format turns every deployed disk cache cold; do it on purpose only
+    assert cache_key(VOICE, MODEL, SETTINGS, "Hello there.") == \
+        "398c0e5f6b31590d51203283c8851478c4136932d5cf30fd5909c1771d236261"
+
+
+def test_key_ignores_what_does_not_change_the_speech():
+    key = cache_key(VOICE, MODEL, SETTINGS, "Café at noon?")
+    assert cache_key(VOICE, MODEL, dict(reversed(SETTINGS.items())), "Café at noon?") == key
+    assert cache_key(VOICE, MODEL, SETTINGS, "  Café \n at  noon? ") == key
+
+
+@pytest.mark.parametrize("voice, model, settings, text", [
+    ("other-voice", MODEL, SETTINGS, "Hello there."),
+    (VOICE, "eleven_multilingual_v2", SETTINGS, "Hello there."),
+    (VOICE, MODEL, {**SETTINGS, "stability": 0.6}, "Hello there."),
+    (VOICE, MODEL, {**SETTINGS, "output_format": "pcm_22050"}, "Hello there."),
+    (VOICE, MODEL, SETTINGS, "Hello there!"),
+])
+def test_key_changes_with_anything_that_changes_the_speech(voice, model, settings, text):
+    assert cache_key(voice, model, settings, text) != cache_key(VOICE, MODEL, SETTINGS, "Hello there.")
+
+
+def files(directory: Path) -> set:
+    return {p.name for p in directory.iterdir()}
+
+
+def test_least_recently_used_entries_are_evicted_by_bytes(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=100)
+    cache.put("a", b"a" * 40)
+    cache.put("b", b"b" * 40)
+    assert cache.get("a") == b"a" * 40  # "b" is now the oldest
+    cache.put("c", b"c" * 40)
+
+    assert cache.get("b") is None
+    assert files(tmp_path) == {"a.mp3", "c.mp3"}
+    stats = cache.stats()
+    assert (stats["bytes"], stats["entries"], stats["evictions"]) == (80, 2, 1)
+
+
+def test_entry_larger_than_the_cache_is_not_stored(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=100)
+    cache.put("a", b"a" * 40)
+    cache.put("big", b"x" * 101)
+    assert cache.get("big") is None
+    assert cache.get("a") == b"a" * 40
+
+
+def test_recency_and_the_cap_survive_a_restart(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=1000)
+    for n, key in enumerate(["old", "middle", "new"]):
+        cache.put(key, key.encode() * 10)
+        os.utime(tmp_path / f"{key}.mp3", (1000 + n, 1000 + n))
+
+    restarted = TTSCache(tmp_path, max_bytes=90)  # 120 bytes on disk: the oldest entry has to go
+    assert files(tmp_path) == {"middle.mp3", "new.mp3"}
+    assert restarted.get("new") == b"new" * 10
+    assert restarted.stats()["evictions"] == 1
+
+
+def test_crash_leftovers_are_cleaned_up_on_load(tmp_path):
+    (tmp_path / "good.mp3").write_bytes(b"ID3 audio")
+    (tmp_path / "empty.mp3").write_bytes(b"")
+    (tmp_path / "half.140212.tmp").write_bytes(b"ID3 au")
+
+    cache = TTSCache(tmp_path)
+    assert files(tmp_path) == {"good.mp3"}
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == len(b"ID3 audio")
+
+
+def test_corrupt_entry_is_a_miss_and_is_removed(tmp_path):
+    cache = TTSCache(tmp_path)
+    cache.put("a", b"ID3 audio")
+    (tmp_path / "a.mp3").write_bytes(b"")  # truncated behind our back
+
+    assert cache.get("a") is None
+    assert files(tmp_path) == set()
+    assert cache.stats()["bytes"] == 0
+    cache.put("a", b"ID3 audio")
+    assert cache.get("a") == b"ID3 audio"
+
+
+def test_deleted_entry_is_a_miss(tmp_path):
+    cache = TTSCache(tmp_path)
+    cache.put("a", b"ID3 audio")
+    os.remove(tmp_path / "a.mp3")
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_write_is_skipped(tmp_path, monkeypatch):
+    cache = TTSCache(tmp_path)
+
+    def disk_full(self, data):
+        with open(self, "wb") as f:
+            f.write(data[:3])
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(Path, "write_bytes", disk_full)
+    cache.put("a", b"ID3 audio")
+    assert cache.get("a") is None
+    assert files(tmp_path) == set()
+
+
+def test_entries_are_stored_under_their_format(tmp_path):
+    cache = TTSCache(tmp_path)
+    cache.put("a", b"\x00\x01" * 10, extension="pcm")
+    assert files(tmp_path) == {"a.pcm"}
+    assert TTSCache(tmp_path).get("a") == b"\x00\x01" * 10  # found again after a restart
+
+    cache.put("a", b"ID3 audio")
+    assert files(tmp_path) == {"a.mp3"}
+    assert cache.stats()["bytes"] == len(b"ID3 audio")
+
+
+def test_streamed_pcm_is_cached_as_pcm(monkeypatch):
+    class Streamed:
+        def iter_content(self, chunk_size):
+            yield from (b"\x00\x01" * 100, b"\x02\x03" * 100)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(providers, "request_elevenlabs_audio", lambda text, voice_id, output_format: Streamed())
+    audio = b"".join(providers.stream_speech("Hello there.", output_format="pcm_22050"))
+    cache = get_tts_cache()
+    assert {p.suffix for p in cache.directory.iterdir()} == {".pcm"}
+    assert b"".join(providers.stream_speech("Hello there.", output_format="pcm_22050")) == audio
+    assert cache.stats()["hits"] == 1
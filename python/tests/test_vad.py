@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from vad import FRAME_MS, Endpointer, frame_db, trim_silence
+
+RATE = 16000
+FRAME = RATE * FRAME_MS // 1000
+PAD = int(0.1 * RATE)
+
+# Frame-aligned fixture: 17 frames of room noise, 33 frames of a 440 Hz tone, 1.5 s of room noise
+TONE_START = 17 * FRAME
+TONE_END = 50 * FRAME
+
+
+def room_noise(n: int, rng) -> np.ndarray:
+    return rng.normal(0, 10, n)  # about -70 dBFS
+
+
+@pytest.fixture
+def utterance() -> bytes:
+    rng = np.random.default_rng(0)
+    t = np.arange(TONE_END - TONE_START) / RATE
+    samples = np.concatenate([
+        room_noise(TONE_START, rng),
+        0.3 * 32767 * np.sin(2 * np.pi * 440 * t) + room_noise(len(t), rng),
+        room_noise(int(1.5 * RATE), rng),
+    ])
+    return samples.astype(np.int16).tobytes()
+
+
+def test_frame_levels(utterance):
+    levels = frame_db(np.frombuffer(utterance, dtype=np.int16), FRAME)
+    assert np.all(levels[:17] < -60)
+    assert np.all(levels[17:50] > -20)
+    assert frame_db(np.zeros(FRAME * 2, dtype=np.int16), FRAME).tolist() == [-90.0, -90.0]
+
+
+def test_trim_keeps_the_tone_plus_padding(utterance):
+    trimmed = trim_silence(utterance, RATE, threshold_db=-40)
+    assert trimmed == utterance[(TONE_START - PAD) * 2:(TONE_END + PAD) * 2]
+
+
+def test_trim_of_silence_is_empty():
+    assert trim_silence(np.zeros(RATE, dtype=np.int16).tobytes(), RATE, threshold_db=-40) == b""
+
+
+def feed(endpointer: Endpointer, pcm: bytes, chunk_samples: int = 1024):
+    """Feed `pcm` in microphone-sized chunks; return how many samples were in when it ended"""
+    for offset in range(0, len(pcm), chunk_samples * 2):
+        if endpointer.process(pcm[offset:offset + chunk_samples * 2]):
+            return offset // 2 + chunk_samples
+    return None
+
+
+def test_endpointer_calibrates_starts_and_ends(utterance):
+    endpointer = Endpointer(rate=RATE)
+    ended_at = feed(endpointer, utterance)
+
+    assert endpointer.threshold_db == -50.0  # the -70 dB room plus the margin is below the minimum
+    assert endpointer.speech_started
+    # Ends in the chunk that completes 0.8 s (26 frames) of quiet after the tone
+    silence_done = TONE_END + 26 * FRAME
+    assert silence_done <= ended_at < silence_done + 1024
+    assert endpointer.audio() == utterance[(TONE_START - PAD) * 2:(TONE_END + PAD) * 2]
+
+
+def test_endpointer_waits_while_nobody_speaks():
+    pcm = room_noise(3 * RATE, np.random.default_rng(1)).astype(np.int16).tobytes()
+    endpointer = Endpointer(rate=RATE)
+    assert feed(endpointer, pcm) is None
+    assert not endpointer.speech_started
+    assert endpointer.audio() == b""
+
+
+def test_a_click_is_not_an_utterance(utterance):
+    samples = np.frombuffer(utterance, dtype=np.int16).copy()
+    quiet = TONE_START + 2 * FRAME  # only two loud frames are left of the tone
+    samples[quiet:TONE_END] = room_noise(TONE_END - quiet, np.random.default_rng(3))
+    endpointer = Endpointer(rate=RATE)
+    assert feed(endpointer, samples.tobytes()) is None
+    assert not endpointer.speech_started
+
+
+def test_loud_room_raises_the_threshold(utterance):
+    rng = np.random.default_rng(2)
+    hum = (rng.normal(0, 300, len(utterance) // 2)).astype(np.int16)  # about -40 dBFS
+    samples = np.clip(np.frombuffer(utterance, dtype=np.int16).astype(np.int32) + hum, -32768, 32767)
+    endpointer = Endpointer(rate=RATE)
+    assert feed(endpointer, samples.astype(np.int16).tobytes()) is not None
+    assert -30 < endpointer.threshold_db < -25
@@ -0,0 +1,294 @@
+"""
+Text-to-speech backends, and hedging ElevenLabs with a local engine.
+
+The primary backend is ElevenLabs (providers.synthesize_to_bytes, with
+its cache, retries, breaker and concurrency limit). HedgedTTS gives it a
+first-byte budget. If ElevenLabs hasn't started streaming within
+TTS_FIRST_BYTE_BUDGET_MS, an offline engine starts on the same text,
+and whichever finishes first with audio wins. If ElevenLabs fails
+outright, the offline engine is used straight away. The offline voice is
+robotic, but turn latency stays bounded and a TTS outage never costs a
+turn. The loser is cancelled: a call still queued never starts, a running
+espeak process is killed and an ElevenLabs stream is closed, so a lost
+race doesn't hold a vendor slot or a fallback worker.
+
+Offline engines (no network needed):
+    espeak-ng / espeak on PATH   `--stdout` WAV, one process per call
+    pyttsx3 (pip install)        the platform's speech engine, one call at a time
+
+Their audio is WAV (or AIFF from pyttsx3 on macOS), not MP3;
+`audio_store.audio_format()` tells the audio store and /api/audio which
+one it is, so it is stored and served under the right extension and type.
+
+Configuration (environment variables):
+    TTS_FALLBACK_ENGINE        auto (default: espeak-ng, then pyttsx3), espeak, pyttsx3 or none
+    TTS_FIRST_BYTE_BUDGET_MS   how long ElevenLabs gets to start streaming (default 1500)
+    TTS_FALLBACK_WORKERS       concurrent offline syntheses (default 2)
+    TTS_FALLBACK_VOICE         espeak voice name (default en-us)
+    TTS_FALLBACK_RATE          speaking rate in words per minute (default 170)
+"""
+import contextvars
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import metrics
+import providers
+from audio_store import audio_format
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MS = 1500
+DEFAULT_FALLBACK_WORKERS = 2
+DEFAULT_VOICE = "en-us"
+DEFAULT_RATE = 170
+PRIMARY_WORKERS = 16  # ElevenLabs calls in flight at once are capped by admission.py, not here
+LOCAL_TIMEOUT_SECONDS = 30
+
+
+def audio_mimetype(audio: bytes) -> str:
+    """MIME type of synthesized audio: MP3 from ElevenLabs, WAV/AIFF from the offline engines"""
+    return audio_format(audio)[0]
+
+
+class TTSBackend:
+    """
+    Turns text into audio bytes; b"" on failure. `cancel` is a
+    threading.Event: once it is set the result is no longer wanted, and
+    the backend should stop as soon as it can and return b"".
+    """
+
+    name = "tts"
+
+    def synthesize(self, text: str, on_first_byte=None, cancel=None) -> bytes:
+        raise NotImplementedError
+
+
+class ElevenLabsBackend(TTSBackend):
+    name = "elevenlabs"
+
+    def __init__(self, voice_id: str = providers.DEFAULT_VOICE_ID):
+        self.voice_id = voice_id
+
+    def synthesize(self, text: str, on_first_byte=None, cancel=None) -> bytes:
+        return providers.synthesize_to_bytes(text, self.voice_id, on_first_byte=on_first_byte, cancel=cancel)
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng (or classic espeak) as a subprocess; the text goes in on stdin"""
+
+    name = "espeak"
+
+    def __init__(self, executable: str, voice: str = DEFAULT_VOICE, rate: int = DEFAULT_RATE):
+        self.executable = executable
+        self.voice = voice
+        self.rate = rate
+
+    def synthesize(self, text: str, on_first_byte=None, cancel=None) -> bytes:
+        # WAV goes to a temporary file, not a pipe, so the process can't block on a full pipe while we watch `cancel`
+        with tempfile.TemporaryFile() as out:
+            try:
+                process = subprocess.Popen(
+                    [self.executable, "--stdin", "--stdout", "-v", self.voice, "-s", str(self.rate)],
+                    stdin=subprocess.PIPE, stdout=out, stderr=subprocess.PIPE,
+                )
+                process.stdin.write(text.encode("utf-8"))
+                process.stdin.close()
+            except OSError as e:
+                log.warning("espeak failed: %s", e, extra={"stage": "tts_fallback"})
+                return b""
+            deadline = time.monotonic() + LOCAL_TIMEOUT_SECONDS
+            while process.poll() is None:
+                stopped = cancel.wait(0.05) if cancel is not None else time.sleep(0.05)
+                if stopped or time.monotonic() > deadline:
+                    process.kill()
+                    process.wait()
+                    if not stopped:
+                        log.warning("espeak timed out after %d s", LOCAL_TIMEOUT_SECONDS, extra={"stage": "tts_fallback"})
+                    return b""
+            if process.returncode != 0:
+                log.warning("espeak exited with %d: %s", process.returncode,
+                            process.stderr.read().decode(errors="replace").strip(), extra={"stage": "tts_fallback"})
+                return b""
+            out.seek(0)
+            return out.read()
+
+
+class Pyttsx3Backend(TTSBackend):
+    """pyttsx3 through a temporary file; its engines aren't thread-safe, so calls are serialized"""
+
+    name = "pyttsx3"
+
+    def __init__(self, rate: int = DEFAULT_RATE):
+        self.rate = rate
+        self.lock = threading.Lock()
+
+    def synthesize(self, text: str, on_first_byte=None, cancel=None) -> bytes:
+        import pyttsx3
+
+        with self.lock, tempfile.TemporaryDirectory() as tmp:
+            if cancel is not None and cancel.is_set():
+                return b""  # lost the race while waiting for the engine
+            path = Path(tmp) / "speech.wav"
+            try:
+                engine = pyttsx3.init()
+                engine.setProperty("rate", self.rate)
+                engine.save_to_file(text, str(path))
+                engine.runAndWait()
+                return path.read_bytes()
+            except Exception as e:
+                log.warning("pyttsx3 failed: %s", e, extra={"stage": "tts_fallback"})
+                return b""
+
+
+class HedgedTTS:
+    """
+    Run `primary`, and `fallback` too if the primary misses its first-byte
+    budget or fails; the first to finish with audio wins.
+    """
+
+    def __init__(self, primary: TTSBackend, fallback: TTSBackend = None,
+                 budget_seconds: float = DEFAULT_BUDGET_MS / 1000, fallback_workers: int = DEFAULT_FALLBACK_WORKERS):
+        self.primary = primary
+        self.fallback = fallback
+        self.budget_seconds = budget_seconds
+        self.primary_pool = ThreadPoolExecutor(max_workers=PRIMARY_WORKERS, thread_name_prefix="tts-primary")
+        self.fallback_pool = ThreadPoolExecutor(max_workers=fallback_workers, thread_name_prefix="tts-fallback")
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0  # fallback started because the primary was slow
+        self.failovers = 0  # fallback started because the primary failed
+        self.wins = {primary.name: 0}
+        if fallback is not None:
+            self.wins[fallback.name] = 0
+        self.lost = 0  # no backend produced audio
+        self.cancelled = 0  # losing calls stopped once the other backend won
+
+    def _count(self, counter: str):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _won(self, backend: str, audio: bytes) -> bytes:
+        with self.lock:
+            self.wins[backend] += 1
+        return audio
+
+    def _run_fallback(self, text: str, cancel: threading.Event) -> bytes:
+        with metrics.timed("tts_fallback"):
+            audio = self.fallback.synthesize(text, cancel=cancel)
+        if not audio and not cancel.is_set():
+            metrics.record_error("tts_fallback")
+        return audio
+
+    def _cancel_losers(self, cancels: dict, winner):
+        for future, cancel in cancels.items():
+            if future is not winner and not future.done():
+                cancel.set()
+                future.cancel()  # never starts if it is still queued
+                self._count("cancelled")
+
+    def synthesize(self, text: str) -> bytes:
+        """Audio for `text` from whichever backend gets there first; b"" only if all of them fail"""
+        self._count("calls")
+        if self.fallback is None:
+            audio = self.primary.synthesize(text)
+            if audio:
+                return self._won(self.primary.name, audio)
+            self._count("lost")
+            return b""
+
+        started = threading.Event()
+        # A copy of the context per call keeps the turn deadline (admission.py) in the worker thread
+        primary_cancel = threading.Event()
+        primary = self.primary_pool.submit(contextvars.copy_context().run, self.primary.synthesize, text,
+                                           started.set, primary_cancel)
+        primary.add_done_callback(lambda _: started.set())
+        names = {primary: self.primary.name}
+        cancels = {primary: primary_cancel}
+        if not started.wait(self.budget_seconds):
+            log.info("TTS first byte over %.0f ms, starting %s", self.budget_seconds * 1000, self.fallback.name,
+                     extra={"stage": "tts"})
+            self._count("hedged")
+            self._start_fallback(text, names, cancels)
+
+        pending = set(names)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    log.warning("%s synthesis failed: %s", names[future], e, extra={"stage": "tts"})
+                    audio = b""
+                if audio:
+                    self._cancel_losers(cancels, future)
+                    return self._won(names[future], audio)
+            if primary in done and len(names) == 1:
+                # The primary failed before its budget ran out: no point waiting, fail over now
+                self._count("failovers")
+                pending.add(self._start_fallback(text, names, cancels))
+        self._count("lost")
+        return b""
+
+    def _start_fallback(self, text: str, names: dict, cancels: dict):
+        cancel = threading.Event()
+        future = self.fallback_pool.submit(self._run_fallback, text, cancel)
+        names[future] = self.fallback.name
+        cancels[future] = cancel
+        return future
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "failovers": self.failovers,
+                "lost": self.lost,
+                "cancelled": self.cancelled,
+                **{f"{name}_wins": count for name, count in self.wins.items()},
+            }
+
+
+def create_fallback_backend() -> TTSBackend:
+    """The offline engine chosen by TTS_FALLBACK_ENGINE, or None if there isn't one"""
+    engine = (os.getenv("TTS_FALLBACK_ENGINE") or "auto").lower()
+    voice = os.getenv("TTS_FALLBACK_VOICE") or DEFAULT_VOICE
+    rate = int(os.getenv("TTS_FALLBACK_RATE") or DEFAULT_RATE)
+    if engine == "none":
+        return None
+    if engine in ("auto", "espeak"):
+        executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if executable:
+            return EspeakBackend(executable, voice, rate)
+        if engine == "espeak":
+            log.warning("TTS_FALLBACK_ENGINE=espeak but neither espeak-ng nor espeak is on PATH")
+            return None
+    if engine in ("auto", "pyttsx3"):
+        try:
+            import pyttsx3  # noqa: F401 (imported again on use; this only checks it's installed)
+            return Pyttsx3Backend(rate)
+        except ImportError:
+            if engine == "pyttsx3":
+                log.warning("TTS_FALLBACK_ENGINE=pyttsx3 but pyttsx3 is not installed")
+    return None
+
+
+def create_hedged_tts(primary: TTSBackend) -> HedgedTTS:
+    """`primary` hedged with the configured offline engine (if any)"""
+    fallback = create_fallback_backend()
+    if fallback is None:
+        log.info("No offline TTS engine; TTS failures and slow starts are not covered")
+    else:
+        log.info("Offline TTS fallback: %s", fallback.name)
+    return HedgedTTS(
+        primary,
+        fallback,
+        budget_seconds=float(os.getenv("TTS_FIRST_BYTE_BUDGET_MS") or DEFAULT_BUDGET_MS) / 1000,
+        fallback_workers=int(os.getenv("TTS_FALLBACK_WORKERS") or DEFAULT_FALLBACK_WORKERS),
+    )
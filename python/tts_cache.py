@@ -0,0 +1,177 @@
+"""
+Content-addressed cache of synthesized speech.
+
+Entries are keyed on a hash of (voice id, model id, voice settings,
+normalized text) and stored as <key>.<ext> under TTS_CACHE_DIR (.mp3,
+or .pcm for the raw PCM streamed to the CLI's speaker), so the
+cache survives restarts and a freshly deployed node starts warm. The
+store is capped at TTS_CACHE_MAX_BYTES and evicts least recently used
+entries first; recency is persisted through file mtimes. Empty or
+unreadable entries, and temp files left by a crash mid-write, are
+deleted rather than served.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / "tts_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and unicode variants that don't change the speech"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(voice_id: str, model_id: str, voice_settings: dict, text: str) -> str:
+    material = json.dumps(
+        [voice_id, model_id, voice_settings, normalize_text(text)],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Size-bounded LRU of audio files on local disk"""
+
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (size, extension), least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    def _path(self, key: str, extension: str) -> Path:
+        return self.directory / f"{key}.{extension}"
+
+    def _load(self):
+        """Rebuild the LRU order from what is already on disk"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            key, _, extension = entry.name.partition(".")
+            if entry.name.endswith(".tmp") or not stat.st_size:
+                self._remove(entry.path)  # a write that never finished
+            elif extension:
+                found.append((stat.st_mtime, key, extension, stat.st_size))
+        for _, key, extension, size in sorted(found):
+            self.entries[key] = (size, extension)
+            self.total_bytes += size
+        with self.lock:
+            self._evict()
+        log.info("Loaded %d entries (%d bytes) from %s", len(self.entries), self.total_bytes, self.directory)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, (size, extension) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            self._remove(self._path(key, extension))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Could not remove %s: %s", path, e)
+
+    def get(self, key: str) -> bytes:
+        """Return cached audio bytes, or None on a miss"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            _, extension = self.entries[key]
+        path = self._path(key, extension)
+        try:
+            data = path.read_bytes()
+            if not data:
+                raise OSError("empty file")
+            os.utime(path)  # persist recency for the next restart
+        except OSError as e:
+            if not isinstance(e, FileNotFoundError):
+                log.warning("Dropping unreadable TTS cache entry %s: %s", key, e)
+                self._remove(path)
+            with self.lock:
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.total_bytes -= entry[0]
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes, extension: str = "mp3"):
+        """Store `data` as <key>.<extension>; the extension names its audio format"""
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self._path(key, extension)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)  # readers never see a partial file
+        except OSError as e:
+            # A full or read-only disk costs us the cache entry, not the reply
+            log.warning("Could not cache TTS audio: %s", e)
+            self._remove(tmp_path)
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[0]
+                if old[1] != extension:
+                    self._remove(self._path(key, old[1]))
+            self.entries[key] = (len(data), extension)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Process-wide cache from TTS_CACHE_* env vars, or None if TTS_CACHE_ENABLED=0"""
+    global _cache
+    if os.getenv("TTS_CACHE_ENABLED", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                max_bytes = int(os.getenv("TTS_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES)
+                _cache = TTSCache(os.getenv("TTS_CACHE_DIR") or DEFAULT_CACHE_DIR, max_bytes)
+    return _cache
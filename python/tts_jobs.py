@@ -0,0 +1,115 @@
+"""
+Background TTS for replies whose text has already been sent.
+
+`/api/chat` can answer as soon as the LLM reply exists. It submits the
+reply here and returns an audio_url right away. A small worker pool runs
+the synthesis and puts the MP3 in the audio store. `/api/audio/<id>`
+long-polls on the job (`wait()`) until the bytes are there, so the
+browser's <audio> element just sees a slow first response.
+
+Configuration (environment variables):
+    TTS_WORKERS            concurrent background syntheses (default 4)
+    TTS_JOBS_MAX           jobs remembered for /api/audio (default 1000)
+    AUDIO_WAIT_SECONDS     how long /api/audio waits on a pending job (default 30)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_JOBS = 1000
+DEFAULT_WAIT_SECONDS = 30
+
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+class Job:
+    def __init__(self, audio_id: str, text: str):
+        self.audio_id = audio_id
+        self.text = text
+        self.status = PENDING
+        self.submitted = time.perf_counter()
+        self.finished = threading.Event()
+
+
+class TTSJobs:
+    """
+    Worker pool running `synthesize(text, audio_id)`, which stores the
+    audio and returns a falsy value on failure.
+    """
+
+    def __init__(self, synthesize, workers: int = DEFAULT_WORKERS, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.synthesize = synthesize
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-job")
+        self.jobs = OrderedDict()  # audio_id -> Job, oldest first
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, audio_id: str, text: str) -> Job:
+        job = Job(audio_id, text)
+        with self.lock:
+            self.jobs[audio_id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+            self.submitted += 1
+        self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        metrics.observe("tts_queue", time.perf_counter() - job.submitted)
+        try:
+            ok = self.synthesize(job.text, job.audio_id)
+        except Exception:
+            log.exception("Background TTS failed", extra={"audio_id": job.audio_id})
+            ok = False
+        job.status = DONE if ok else FAILED
+        with self.lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if not ok:
+            log.warning("Background TTS produced no audio", extra={"audio_id": job.audio_id, "stage": "tts"})
+        metrics.observe("tts_job", time.perf_counter() - job.submitted)
+        job.finished.set()
+
+    def wait(self, audio_id: str, timeout: float) -> str:
+        """The job's status after waiting up to `timeout` seconds for it; None for unknown ids"""
+        with self.lock:
+            job = self.jobs.get(audio_id)
+        if job is None:
+            return None
+        job.finished.wait(timeout)
+        return job.status
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "pending": sum(1 for job in self.jobs.values() if job.status == PENDING),
+            }
+
+
+def create_tts_jobs(synthesize) -> TTSJobs:
+    """Pool configured from TTS_WORKERS / TTS_JOBS_MAX"""
+    return TTSJobs(
+        synthesize,
+        workers=int(os.getenv("TTS_WORKERS") or DEFAULT_WORKERS),
+        max_jobs=int(os.getenv("TTS_JOBS_MAX") or DEFAULT_MAX_JOBS),
+    )
+
+
+def get_wait_seconds() -> float:
+    return float(os.getenv("AUDIO_WAIT_SECONDS") or DEFAULT_WAIT_SECONDS)
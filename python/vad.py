@@ -0,0 +1,121 @@
+"""
+Energy-based voice activity detection for the chatbot.py microphone loop.
+
+The recorder feeds raw 16-bit mono PCM chunks to an Endpointer. Per-frame
+loudness is computed in one vectorized NumPy pass per chunk. The first
+few frames calibrate the room's noise floor. Recording "starts" once a
+short run of frames is louder than that floor, and ends after a
+configurable stretch of silence. Leading and trailing silence are trimmed
+from what goes to Deepgram, keeping a little padding so word edges aren't
+clipped.
+"""
+from collections import deque
+
+import numpy as np
+
+FRAME_MS = 30
+SILENCE_FLOOR_DB = -90.0  # what an all-zero frame reads as
+
+
+def frame_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """RMS level in dBFS of each whole `frame_len`-sample frame of int16 `samples`"""
+    frames = samples[:len(samples) // frame_len * frame_len].reshape(-1, frame_len).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1)) / 32768.0
+    return np.maximum(20 * np.log10(np.maximum(rms, 1e-12)), SILENCE_FLOOR_DB)
+
+
+def trim_silence(pcm: bytes, rate: int, threshold_db: float, pad_seconds: float = 0.1) -> bytes:
+    """Drop leading/trailing frames quieter than `threshold_db`, keeping `pad_seconds` around speech"""
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    frame_len = rate * FRAME_MS // 1000
+    voiced = np.flatnonzero(frame_db(samples, frame_len) > threshold_db)
+    if len(voiced) == 0:
+        return b""
+    pad = int(pad_seconds * rate)
+    start = max(voiced[0] * frame_len - pad, 0)
+    end = min((voiced[-1] + 1) * frame_len + pad, len(samples))
+    return samples[start:end].tobytes()
+
+
+class Endpointer:
+    """
+    Decides when an utterance starts and ends.
+
+    Call `process(chunk)` with each PCM chunk from the microphone; it
+    returns True once the speaker has gone quiet for `silence_seconds`
+    after speaking. `audio()` is then the utterance, trimmed.
+    """
+
+    def __init__(self,
+                 rate: int = 16000,
+                 silence_seconds: float = 0.8,
+                 onset_seconds: float = 0.09,
+                 pre_roll_seconds: float = 0.3,
+                 calibration_seconds: float = 0.3,
+                 margin_db: float = 12.0,
+                 min_threshold_db: float = -50.0):
+        self.rate = rate
+        self.frame_len = rate * FRAME_MS // 1000
+        self.silence_frames = max(int(silence_seconds * 1000 / FRAME_MS), 1)
+        self.onset_frames = max(int(onset_seconds * 1000 / FRAME_MS), 1)
+        self.calibration_frames = max(int(calibration_seconds * 1000 / FRAME_MS), 1)
+        self.margin_db = margin_db
+        self.min_threshold_db = min_threshold_db
+
+        self.threshold_db = None  # set once the noise floor is calibrated
+        self.calibration = []
+        self.pre_roll = deque(maxlen=max(int(pre_roll_seconds * 1000 / FRAME_MS), self.onset_frames))
+        self.frames = []  # utterance frames (bytes), from just before onset
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.voiced_run = 0
+        self.silent_run = 0
+        self.speech_started = False
+        self.ended = False
+
+    def process(self, chunk: bytes) -> bool:
+        samples = np.concatenate([self.remainder, np.frombuffer(chunk, dtype=np.int16)])
+        whole = len(samples) // self.frame_len * self.frame_len
+        self.remainder = samples[whole:]
+        if whole == 0:
+            return self.ended
+
+        levels = frame_db(samples[:whole], self.frame_len)
+        frames = samples[:whole].reshape(-1, self.frame_len)
+
+        start = 0
+        if self.threshold_db is None:
+            # Noise floor from the first frames (the user is rarely talking yet)
+            start = min(self.calibration_frames - len(self.calibration), len(levels))
+            self.calibration.extend(levels[:start].tolist())
+            self.pre_roll.extend(frame.tobytes() for frame in frames[:start])
+            if len(self.calibration) >= self.calibration_frames:
+                floor = float(np.median(self.calibration))
+                self.threshold_db = max(floor + self.margin_db, self.min_threshold_db)
+
+        if self.threshold_db is not None:
+            voiced = levels[start:] > self.threshold_db
+            for frame, is_voiced in zip(frames[start:], voiced):
+                self._step(frame.tobytes(), bool(is_voiced))
+                if self.ended:
+                    break
+        return self.ended
+
+    def _step(self, frame: bytes, voiced: bool):
+        if not self.speech_started:
+            self.pre_roll.append(frame)
+            self.voiced_run = self.voiced_run + 1 if voiced else 0
+            if self.voiced_run >= self.onset_frames:
+                self.speech_started = True
+                self.frames = list(self.pre_roll)
+            return
+
+        self.frames.append(frame)
+        self.silent_run = 0 if voiced else self.silent_run + 1
+        if self.silent_run >= self.silence_frames:
+            self.ended = True
+
+    def audio(self) -> bytes:
+        """The utterance with leading/trailing silence trimmed ("" if nobody spoke)"""
+        if not self.speech_started:
+            return b""
+        return trim_silence(b"".join(self.frames), self.rate, self.threshold_db)